@@ -1,11 +1,14 @@
 # app.py
+from datetime import datetime
+
 import streamlit as st
-from utils import init_state, ensure_style, load_repo_data
+from utils import init_state, ensure_style, load_repo_data, persist_header, resume_draft, sync_active_destination
+from drafts import get_draft_store
 
 st.set_page_config(page_title="Peticiones almacenes", page_icon="📦", layout="wide")
 ensure_style()
 init_state()
-load_repo_data()
+cat_version = load_repo_data()
 
 st.markdown("# 0 · Datos del pedido")
 st.markdown(
@@ -13,8 +16,10 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Catálogo obligatorio
-if not st.session_state.get("cat_loaded"):
+# Catálogo obligatorio. Esta página no lo usa: no se espera a la precarga, solo se avisa si ya falló
+if cat_version is None:
+    st.caption("⏳ Cargando catálogo en segundo plano…")
+elif not cat_version.cat_loaded:
     st.error("No se encontró **catalogue.xlsx** en la raíz del repositorio (o tiene columnas incorrectas).")
     st.stop()
 
@@ -71,6 +76,35 @@ with c4:
         placeholder="Ej: PET-2026-02-08-MARBELLA",
     )
 
+sync_active_destination()
+persist_header()
+
+# Borradores guardados en servidor (se reanudan por referencia de petición)
+with st.expander("Reanudar una petición guardada", expanded=False):
+    f1, f2 = st.columns([2, 1])
+    with f1:
+        draft_q = st.text_input("Filtrar por referencia de la petición", key="draft_filter", placeholder="Ej: PET-2026")
+    drafts = get_draft_store().list_drafts(draft_q.strip())
+    drafts = drafts[(drafts["lineas"] > 0) | (drafts["ref_peticion"] != "")]
+    if drafts.empty:
+        st.caption("No hay borradores guardados.")
+    else:
+        labels = {}
+        for r in drafts.itertuples(index=False):
+            when = datetime.fromtimestamp(r.updated_at).strftime("%Y-%m-%d %H:%M")
+            cur = " (actual)" if r.draft_id == st.session_state.draft_id else ""
+            labels[f"{r.ref_peticion or 'SIN_REF'} · {r.destino or '-'} · {r.lineas} líneas · {r.uds} uds · {when}{cur}"] = r.draft_id
+
+        sel_draft = labels[st.selectbox("Borradores", list(labels))]
+        with f2:
+            st.write("")
+            if st.button("Reanudar", use_container_width=True, disabled=sel_draft == st.session_state.draft_id):
+                resume_draft(sel_draft)
+                st.rerun()
+
+if st.session_state.get("draft_error"):
+    st.caption(f"⚠️ No se pudo guardar el borrador: {st.session_state.draft_error}")
+
 # Bloqueo: origen y destino no pueden coincidir
 if st.session_state.origen == st.session_state.destino:
     st.warning("Origen y destino no pueden coincidir. Cambia uno de los dos para continuar.")
@@ -79,7 +113,7 @@ if st.session_state.origen == st.session_state.destino:
 st.markdown("<hr/>", unsafe_allow_html=True)
 
 # Plantilla: recomendable (necesaria para exportar)
-if st.session_state.get("tpl_bytes") is None:
+if cat_version is not None and not cat_version.has_template:
     st.warning("No se encontró **plantilla_pedido.xlsx** en la raíz del repositorio. Podrás trabajar, pero no exportar.")
 
 st.markdown("### Siguiente paso")
@@ -0,0 +1,9 @@
+# bench/__init__.py
+"""
+Benchmarks reproducibles con datos sintéticos (sin servidor de Streamlit).
+
+    python -m bench --sizes 10000,100000
+    python -m bench --save-baseline          # fija la referencia en bench/baseline.json
+    python -m bench.e2e                      # latencia por rerun de las páginas reales (AppTest)
+    python -m bench.normalize                # normalización del catálogo a 1M filas + casos límite
+"""
@@ -0,0 +1,205 @@
+# bench/__main__.py
+"""
+Ejecuta la batería de benchmarks y compara con una referencia guardada.
+
+    python -m bench                              # tamaños por defecto, compara con bench/baseline.json
+    python -m bench --sizes 10000,100000,1000000 # hasta 1M variantes
+    python -m bench --save-baseline              # guarda el resultado como nueva referencia
+
+Se compara el mínimo de las repeticiones (menos sensible al ruido que la mediana) y se sale
+con código 1 si alguna medida empeora más que --threshold respecto a la referencia. Sin referencia
+sale con código 2 si se pide --require-baseline (por defecto cuando la variable CI está definida).
+Las referencias versionadas (bench/baseline.json, bench/e2e_baseline.json) son de la máquina que
+indica su "meta": en otra máquina, fija la propia con --save-baseline antes de comparar.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import stock  # noqa: E402
+import utils  # noqa: E402
+import validation  # noqa: E402
+from bench.generators import cached_catalog_xlsx, make_petition  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_OUT = os.path.join(HERE, "results", "latest.json")
+CACHE_DIR = os.path.join(HERE, ".cache")
+SEARCH_QUERIES = ["negro", "bikini", "8445790", "xl", "angélica"]
+
+
+def _time(fn, repeat: int) -> dict:
+    runs = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(runs), "min_s": min(runs), "runs": len(runs)}
+
+
+def _cart_from(cat: pd.DataFrame, n: int, seed: int) -> dict:
+    cart = {}
+    for v in cat.sample(min(n, len(cat)), random_state=seed).to_dict("records"):
+        utils.add_to_cart(cart, v, 1 + seed % 3)
+    return cart
+
+
+def run_size(n: int, repeat: int, seed: int = 0) -> dict:
+    """Todas las medidas para un catálogo de ~n variantes."""
+    reps = repeat if n <= 100_000 else 1
+    out = {}
+
+    path = cached_catalog_xlsx(n, CACHE_DIR, seed)
+    cat = utils._read_catalog_xlsx(path)
+    out["read_catalog_xlsx"] = _time(lambda: utils._read_catalog_xlsx(path), reps)
+    out["build_catalog_indexes"] = _time(lambda: utils.build_catalog_indexes(cat), reps)
+    idx = utils.build_catalog_indexes(cat)
+
+    n_pet = min(max(1000, n // 10), 50_000)
+    pet = make_petition(cat, n_pet, seed=seed)
+    bio = io.BytesIO()
+    pet.to_excel(bio, index=False)
+    pet_bytes = bio.getvalue()
+    out["read_petition_excel"] = _time(lambda: utils.read_petition_excel(pet_bytes), repeat)
+    pet_df = utils.read_petition_excel(pet_bytes)
+    raws = pet_df["raw"].tolist()
+    out["parse_petition_line"] = _time(lambda: [utils.parse_petition_line(r) for r in raws], repeat)
+    out["match_petition_to_catalog"] = _time(lambda: utils.match_petition_to_catalog(pet_df, *idx), repeat)
+
+    blob = utils.build_search_blob(cat)
+    out["build_search_blob"] = _time(lambda: utils.build_search_blob(cat), reps)
+    out["search"] = _time(lambda: [blob.str.contains(q, regex=False).sum() for q in SEARCH_QUERIES], repeat)
+
+    n_cart = min(max(500, n // 10), 50_000)
+    a, b = _cart_from(cat, n_cart, seed), _cart_from(cat, n_cart, seed + 1)
+    out["merge_carts"] = _time(lambda: utils.merge_carts(a, b), repeat)
+
+    merged = utils.merge_carts(a, b)
+
+    # Snapshot de stock con todo el catálogo (una fila por EAN) contra el carrito fusionado
+    snap_csv = pd.DataFrame({
+        "Almacén": "PET Almacén Badalona", "EAN": cat["EAN"], "Stock": (cat.index % 7).to_numpy(),
+    }).to_csv(index=False, sep=";").encode()
+    out["read_stock_file"] = _time(lambda: stock.read_stock_file(snap_csv, "stock.csv"), reps)
+    snap_df, _ = stock.read_stock_file(snap_csv, "stock.csv")
+    out["build_stock_snapshot"] = _time(lambda: stock.StockSnapshot(snap_df), reps)
+    snap = stock.StockSnapshot(snap_df)
+    merged_df = utils.cart_to_df(merged)
+
+    def full_check():
+        chk = stock.StockCheck(snap.stock_for("PET Almacén Badalona"), ("bench",))
+        chk.sync(merged)
+        return chk.check(merged_df)
+
+    chk = stock.StockCheck(snap.stock_for("PET Almacén Badalona"), ("bench",))
+    chk.sync(merged)
+    extra = dict(merged)
+    extra.update(_cart_from(cat, 1, seed + 2))
+    out["stock_check"] = _time(full_check, repeat)
+    out["stock_check_incremental"] = _time(lambda: (chk.sync(extra), chk.sync(merged), chk.check(merged_df)), repeat)
+
+    ean_index = utils.build_ean_index(cat)
+    out["export_validate"] = _time(lambda: validation.validate_export_lines(merged, ean_index), repeat)
+
+    tpl = open(os.path.join(ROOT, utils.DEFAULT_TEMPLATE_PATH), "rb").read()
+    out["export_xlsx"] = _time(
+        lambda: utils.build_transfer_xlsx(merged, date.today(), "PET Almacén Badalona", "PET T001 Tienda Ibiza",
+                                          "BENCH", tpl),
+        reps,
+    )
+
+    for r in out.values():
+        r["n"] = n
+    return {f"{name}@{n}": r for name, r in out.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    rows = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = cur["min_s"] / base["min_s"] if base["min_s"] else float("inf")
+        rows.append((key, base["min_s"], cur["min_s"], ratio, ratio > threshold))
+    return rows
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000,100000", help="Variantes de catálogo, separadas por coma")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=DEFAULT_OUT)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    # En CI (variable CI definida) una referencia ausente es un error, no un aviso
+    ap.add_argument("--require-baseline", action="store_true", default=bool(os.environ.get("CI")),
+                    help="Sale con código 2 si no existe la referencia")
+    ap.add_argument("--threshold", type=float, default=1.25, help="Ratio actual/referencia a partir del cual es regresión")
+    args = ap.parse_args(argv)
+
+    results = {}
+    for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        t0 = time.perf_counter()
+        results.update(run_size(n, args.repeat, args.seed))
+        print(f"· {n} variantes: {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    doc = {
+        "meta": {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+
+    print(f"{'medida':<40} {'mediana ms':>12}")
+    for key, r in results.items():
+        print(f"{key:<40} {r['median_s'] * 1000:>12.2f}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"Referencia guardada en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"ERROR: no existe la referencia {args.baseline}; no se puede detectar regresiones.", file=sys.stderr)
+            return 2
+        print("Sin referencia: usa --save-baseline para fijarla.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    rows = compare(results, baseline, args.threshold)
+    print(f"\n{'medida':<40} {'ref min ms':>12} {'actual min ms':>14} {'ratio':>7}")
+    for key, b, c, ratio, bad in rows:
+        print(f"{key:<40} {b * 1000:>12.2f} {c * 1000:>14.2f} {ratio:>7.2f}{'  ← REGRESIÓN' if bad else ''}")
+    return 1 if any(r[4] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# bench/catalog_memory.py
+"""
+Informe antes/después de codificar el catálogo con categóricas (encode_catalog_columns).
+
+    python -m bench.catalog_memory                      # catálogo sintético de 100 000 variantes
+    python -m bench.catalog_memory --n 1000000
+    python -m bench.catalog_memory --catalog catalogue.xlsx
+
+Memoria por columna (memory_usage(deep=True)) y latencia de las operaciones típicas sobre
+el catálogo: filtro por igualdad, isin, groupby y join por referencia.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import utils  # noqa: E402
+from bench.generators import make_catalog  # noqa: E402
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    b = before.memory_usage(deep=True, index=False)
+    a = after.memory_usage(deep=True, index=False)
+    out = pd.DataFrame({"antes MB": b / 1e6, "después MB": a / 1e6})
+    out.loc["TOTAL"] = out.sum()
+    out["ratio"] = out["antes MB"] / out["después MB"]
+    return out.round(2)
+
+
+def latency_report(before: pd.DataFrame, after: pd.DataFrame, repeat: int = 5) -> pd.DataFrame:
+    refs = before["Referencia"].drop_duplicates()
+    ref = refs.iloc[len(refs) // 2]
+    some_refs = refs.sample(min(200, len(refs)), random_state=0).tolist()
+    stock = pd.DataFrame({"Referencia": some_refs, "stock": range(len(some_refs))})
+    ops = {
+        "Referencia == ref": lambda df: df[df["Referencia"] == ref],
+        "Referencia.isin(200 refs)": lambda df: df[df["Referencia"].isin(some_refs)],
+        "groupby(Referencia).size()": lambda df: df.groupby("Referencia", observed=True).size(),
+        "groupby(Referencia, Color).size()": lambda df: df.groupby(["Referencia", "Color"], observed=True).size(),
+        "Color.value_counts()": lambda df: df["Color"].value_counts(),
+        "merge(stock, on=Referencia)": lambda df: df.merge(stock, on="Referencia"),
+    }
+    rows = []
+    for name, op in ops.items():
+        b = _best_ms(lambda: op(before), repeat)
+        a = _best_ms(lambda: op(after), repeat)
+        rows.append({"operación": name, "antes ms": round(b, 2), "después ms": round(a, 2), "ratio": round(b / a, 1)})
+    return pd.DataFrame(rows).set_index("operación")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.catalog_memory", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100_000, help="Variantes del catálogo sintético")
+    ap.add_argument("--catalog", help="Usar un catalogue.xlsx real en lugar del sintético")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    after = utils._read_catalog_xlsx(args.catalog) if args.catalog else utils.encode_catalog_columns(
+        make_catalog(args.n).assign(TallaRank=lambda d: utils.size_rank(d["Talla"]))
+    )
+    before = after.astype({c: "str" for c in utils.CATEGORY_COLUMNS if c in after.columns})
+
+    print(f"Catálogo: {len(after)} variantes · {after['Referencia'].nunique()} referencias\n")
+    print("Memoria")
+    print(memory_report(before, after).to_string())
+    print("\nLatencia (mejor de", args.repeat, "repeticiones)")
+    print(latency_report(before, after, args.repeat).to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
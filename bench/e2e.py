@@ -0,0 +1,302 @@
+# bench/e2e.py
+"""
+Latencia de extremo a extremo sobre las páginas reales (AppTest, sin servidor).
+
+Recorre el flujo completo en una sesión: carga de catálogo, importación de una petición
+sintética, clics en el grid de 2 · Selección manual con el carrito creciendo por escalones,
+filtro en 3 · Revisión final y 4 · Exportar. Cada rerun queda registrado con su tiempo de
+pared, el número de widgets y de elementos, los KB de mensajes (protobuf) que genera y el
+tamaño del carrito en ese momento.
+
+    python -m bench.e2e                                  # escalones por defecto
+    python -m bench.e2e --cart-sizes 0,500,2000 --clicks 10
+    python -m bench.e2e --light                          # mismo flujo en modo ligero (móvil)
+    python -m bench.e2e --compare-light                  # normal vs ligero, paso a paso
+    python -m bench.e2e --save-baseline                  # fija bench/e2e_baseline.json
+
+Sale con código 1 si algún paso empeora más que --threshold respecto a la referencia, y con
+código 2 si no hay referencia y se pide --require-baseline (por defecto en CI).
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+# Borradores en un fichero temporal: el harness no debe tocar la base de datos local
+os.environ.setdefault("PETICIONES_DB", os.path.join(tempfile.mkdtemp(prefix="peticiones_e2e_"), "e2e.sqlite3"))
+
+import pandas as pd  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1.element_tree import Widget  # noqa: E402
+
+import perf  # noqa: E402
+from catalog_store import get_catalog_store  # noqa: E402
+from jobs import get_scheduler  # noqa: E402
+from utils import DEST_OPTIONS  # noqa: E402
+from bench.__main__ import compare  # noqa: E402
+from bench.generators import make_petition  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "e2e_baseline.json")
+DEFAULT_OUT = os.path.join(HERE, "results", "e2e_latest.json")
+
+APP = os.path.join(ROOT, "app.py")
+PAGE_IMPORT = "pages/1_Importar_ventas_reposicion.py"
+PAGE_MANUAL = "pages/2_Seleccion_manual.py"
+PAGE_REVIEW = "pages/3_Revision_final.py"
+PAGE_EXPORT = "pages/4_Exportar.py"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+SEARCH_LABEL = "Buscar (ref / nombre / EAN / color / talla)"
+REVIEW_FILTER_LABEL = "Buscar en revisión"
+
+
+def count_widgets(node) -> int:
+    n = 1 if isinstance(node, Widget) else 0
+    for child in getattr(node, "children", {}).values():
+        n += count_widgets(child)
+    return n
+
+
+def count_elements(node) -> int:
+    n = 1 if getattr(node, "proto", None) is not None else 0
+    for child in getattr(node, "children", {}).values():
+        n += count_elements(child)
+    return n
+
+
+def payload_bytes(node) -> int:
+    """Tamaño serializado de los elementos del rerun: aproxima lo que viaja por el websocket."""
+    proto = getattr(node, "proto", None)
+    n = proto.ByteSize() if proto is not None else 0
+    for child in getattr(node, "children", {}).values():
+        n += payload_bytes(child)
+    return n
+
+
+def _button(at: AppTest, label: str):
+    return next(b for b in at.button if b.label == label)
+
+
+def _wait_import(at: AppTest, _=None, poll: float = 0.05):
+    """La importación corre en segundo plano: reruns hasta que la sesión recoge el resultado."""
+    while at.session_state["import_job"]:
+        time.sleep(poll)
+        at.run()
+
+
+def _wait_pool_idle(timeout: float = 60):
+    """Página 1 arranca el pool de procesos; se mide la importación con los procesos ya levantados."""
+    pool = get_scheduler()
+    t0 = time.time()
+    while (pool.in_flight or pool.queued()) and time.time() - t0 < timeout:
+        time.sleep(0.05)
+
+
+class Recorder:
+    """Ejecuta pasos de AppTest y anota una fila por rerun."""
+
+    def __init__(self, at: AppTest):
+        self.at = at
+        self.rows = []
+        self.tier = 0
+
+    def cart_lines(self) -> int:
+        state = self.at.session_state
+        keys = ("carrito_import", "carrito_manual")
+        return sum(len(state[k]) for k in keys if k in state)
+
+    def step(self, stage: str, action):
+        t0 = time.perf_counter()
+        action()
+        wall = time.perf_counter() - t0
+        if len(self.at.exception):
+            raise RuntimeError(f"{stage}: {self.at.exception[0].value}")
+        self.rows.append({
+            "stage": stage,
+            "tier": self.tier,
+            "cart_lines": self.cart_lines(),
+            "wall_s": wall,
+            "widgets": count_widgets(self.at._tree),
+            "elements": count_elements(self.at._tree),
+            "payload_kb": payload_bytes(self.at._tree) / 1024,
+        })
+
+
+def _text_input(at: AppTest, label: str):
+    return next(t for t in at.text_input if t.label == label)
+
+
+def run_flow(cart_sizes, clicks: int, petition_lines: int, seed: int = 0, timeout: float = 300,
+             light: bool = False) -> pd.DataFrame:
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.session_state["light_mode"] = light
+    rec = Recorder(at)
+
+    rec.step("load", at.run)
+    # 0 · Datos ya no espera al catálogo: se espera aquí a la precarga antes de seguir midiendo
+    rec.step("catalog_ready", lambda: get_catalog_store().ensure_loaded())
+    cat = get_catalog_store().current.catalog_df
+    if cat is None:
+        raise RuntimeError("No se ha podido cargar catalogue.xlsx")
+    # Lo que se elegiría en 0 · Datos: origen y destino distintos
+    at.session_state["destino"] = DEST_OPTIONS[1]
+
+    # 1 · Importar: petición sintética sobre el catálogo real
+    pet = make_petition(cat, petition_lines, seed=seed)
+    bio = io.BytesIO()
+    pet.to_excel(bio, index=False)
+    rec.step("page_import", lambda: at.switch_page(PAGE_IMPORT).run())
+    _wait_pool_idle()
+    rec.step("upload", lambda: at.file_uploader[0].set_value(("peticion.xlsx", bio.getvalue(), XLSX_MIME)).run())
+    rec.step("import", lambda: _wait_import(at, _button(at, "Procesar importación").click().run()))
+
+    # 2 · Selección manual: el carrito crece por escalones (Pegar lista) y en cada uno se mide el grid
+    rec.step("page_manual", lambda: at.switch_page(PAGE_MANUAL).run())
+    pool = cat.sample(frac=1.0, random_state=seed)
+    refs = pool["Referencia"].drop_duplicates().tolist()
+    for i, size in enumerate(sorted(cart_sizes)):
+        rec.tier = size
+        have = set(at.session_state["carrito_manual"])
+        missing = [e for e in pool["EAN"] if e not in have][: max(0, size - len(have))]
+        if missing:
+            text = "\n".join(f"{e};1" for e in missing)
+            rec.step("bulk_paste", lambda: (at.text_area[-1].input(text), _button(at, "Añadir lista al carrito").click().run()))
+
+        ref = refs[i % len(refs)]
+        rec.step("search", lambda: _text_input(at, SEARCH_LABEL).input(ref).run())
+        # En modo ligero el grid es un data_editor (AppTest no puede editarlo): sin clics
+        plus = [b for b in at.button if (b.key or "").startswith(f"plus_{ref}_")]
+        for k in range(clicks):
+            if not plus:
+                break
+            key = plus[k % len(plus)].key
+            rec.step("grid_click", lambda: at.button(key=key).click().run())
+
+        # 3 · Revisión: entrada a la página y filtro sobre el carrito de este escalón
+        rec.step("page_review", lambda: at.switch_page(PAGE_REVIEW).run())
+        if any(t.label == REVIEW_FILTER_LABEL for t in at.text_input):
+            rec.step("review_filter", lambda: _text_input(at, REVIEW_FILTER_LABEL).input(ref).run())
+            rec.step("review_filter", lambda: _text_input(at, REVIEW_FILTER_LABEL).input("").run())
+        rec.step("page_manual", lambda: at.switch_page(PAGE_MANUAL).run())
+
+    # 4 · Exportar con el carrito final
+    rec.step("page_export", lambda: at.switch_page(PAGE_EXPORT).run())
+    return pd.DataFrame(rec.rows)
+
+
+def summarize(rows: pd.DataFrame) -> dict:
+    """Una medida por paso y escalón (líneas objetivo del carrito manual; cart_lines es el total real)."""
+    out = {}
+    for (stage, tier), g in rows.groupby(["stage", "tier"], sort=False):
+        out[f"{stage}@{tier}"] = {
+            "median_s": float(g["wall_s"].median()),
+            "min_s": float(g["wall_s"].min()),
+            "max_s": float(g["wall_s"].max()),
+            "runs": int(len(g)),
+            "widgets": int(g["widgets"].max()),
+            "elements": int(g["elements"].max()),
+            "payload_kb": float(g["payload_kb"].max()),
+            "cart_lines": int(g["cart_lines"].max()),
+        }
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.e2e", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cart-sizes", default="0,250,1000", help="Escalones de líneas del carrito manual")
+    ap.add_argument("--clicks", type=int, default=10, help="Clics en el grid por escalón")
+    ap.add_argument("--petition-lines", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--perf", action="store_true", help="Activa perf y añade el desglose por etapa")
+    ap.add_argument("--out", default=DEFAULT_OUT)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    # En CI (variable CI definida) una referencia ausente es un error, no un aviso
+    ap.add_argument("--require-baseline", action="store_true", default=bool(os.environ.get("CI")),
+                    help="Sale con código 2 si no existe la referencia")
+    ap.add_argument("--threshold", type=float, default=1.25)
+    ap.add_argument("--light", action="store_true", help="Recorre el flujo en modo ligero (móvil)")
+    ap.add_argument("--compare-light", action="store_true",
+                    help="Recorre el flujo en los dos modos y compara elementos y KB por paso")
+    args = ap.parse_args(argv)
+
+    os.chdir(ROOT)
+    if args.perf:
+        perf.set_enabled(True)
+    cart_sizes = [int(x) for x in args.cart_sizes.split(",") if x.strip()]
+    if args.compare_light:
+        normal = summarize(run_flow(cart_sizes, args.clicks, args.petition_lines, args.seed))
+        light = summarize(run_flow(cart_sizes, args.clicks, args.petition_lines, args.seed, light=True))
+        print(f"{'paso':<28} {'elem.':>7} {'ligero':>7} {'×':>6} {'KB':>8} {'ligero':>8} {'×':>6}")
+        for key, n in normal.items():
+            lt = light.get(key)
+            if lt is None:
+                continue
+            print(f"{key:<28} {n['elements']:>7} {lt['elements']:>7} {n['elements'] / max(1, lt['elements']):>6.1f} "
+                  f"{n['payload_kb']:>8.1f} {lt['payload_kb']:>8.1f} {n['payload_kb'] / max(0.1, lt['payload_kb']):>6.1f}")
+        return 0
+
+    rows = run_flow(cart_sizes, args.clicks, args.petition_lines, args.seed, light=args.light)
+    results = summarize(rows)
+
+    doc = {
+        "meta": {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cart_sizes": args.cart_sizes,
+            "clicks": args.clicks,
+            "petition_lines": args.petition_lines,
+            "light": args.light,
+        },
+        "results": results,
+        "reruns": rows.to_dict("records"),
+    }
+    if args.perf:
+        doc["perf"] = perf.process_summary().to_dict("records")
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+
+    print(f"{'paso':<28} {'líneas':>7} {'reruns':>7} {'p50 ms':>9} {'máx ms':>9} {'widgets':>8} {'elem.':>6} {'KB':>7}")
+    for key, r in results.items():
+        print(f"{key:<28} {r['cart_lines']:>7} {r['runs']:>7} {r['median_s'] * 1000:>9.1f} "
+              f"{r['max_s'] * 1000:>9.1f} {r['widgets']:>8} {r['elements']:>6} {r['payload_kb']:>7.1f}")
+    if args.perf:
+        print()
+        print(perf.process_summary().to_string(index=False))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"Referencia guardada en {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"ERROR: no existe la referencia {args.baseline}; no se puede detectar regresiones.", file=sys.stderr)
+            return 2
+        print("Sin referencia: usa --save-baseline para fijarla.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    bad = [r for r in compare(results, baseline, args.threshold) if r[4]]
+    for key, b, c, ratio, _ in bad:
+        print(f"REGRESIÓN {key}: {b * 1000:.1f} → {c * 1000:.1f} ms (×{ratio:.2f})")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# bench/generators.py
+"""Generadores deterministas de catálogos y peticiones sintéticos."""
+from __future__ import annotations
+
+import os
+import random
+from typing import Dict, Optional
+
+import pandas as pd
+
+COLORS = [
+    "Negro", "Blanco", "EST.NEGRO", "EST.BLANCO", "Azul Marino", "Rojo", "Verde Oliva", "Beige",
+    "Gris", "Rosa", "Amarillo Bliss", "LIMA SAM", "GRIS WAV", "Camel", "Burdeos", "Crudo",
+]
+SIZES = ["XXS", "XS", "S", "M", "L", "XL", "XXL", "36", "38", "40", "42", "10A", "12A", "UNICA"]
+NAMES = ["Bikini Top", "Bikini Bottom", "Vestido", "Camiseta", "Pantalón", "Falda", "Blusa", "Chaqueta"]
+FIRST = ["Angélica", "Rovi", "Mallok", "Sabhy", "Luna", "Nora", "Ibiza", "Marbella", "Alba", "Vera"]
+
+# Mezcla por defecto de formatos de línea en la petición
+DEFAULT_MIX = {"exact": 0.6, "ref_color": 0.1, "ref_talla": 0.1, "ref": 0.1, "miss": 0.1}
+
+
+def ean13(body12: int) -> str:
+    """EAN-13 válido (dígito de control) a partir de 12 dígitos."""
+    digits = f"{body12:012d}"
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def make_catalog(n_variants: int, colors_per_ref: int = 8, sizes_per_ref: int = 5, seed: int = 0) -> pd.DataFrame:
+    """Catálogo refs × colores × tallas con ~n_variants filas y EANs únicos."""
+    rng = random.Random(seed)
+    per_ref = colors_per_ref * sizes_per_ref
+    n_refs = max(1, n_variants // per_ref)
+    rows = []
+    body = 844579000000
+    for r in range(n_refs):
+        ref = str(200000 + r)
+        name = f"{rng.choice(FIRST)} {rng.choice(NAMES)}"
+        colors = rng.sample(COLORS, min(colors_per_ref, len(COLORS)))
+        sizes = rng.sample(SIZES, min(sizes_per_ref, len(SIZES)))
+        for c in colors:
+            for t in sizes:
+                rows.append((ean13(body), ref, name, c, t))
+                body += 1
+    return pd.DataFrame(rows, columns=["EAN", "Referencia", "Nombre", "Color", "Talla"])
+
+
+def make_petition(cat: pd.DataFrame, n_lines: int, mix: Optional[Dict[str, float]] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Petición con formato "[ref] (color, talla)" y mezcla controlable de tipos de línea:
+    exact, ref_color, ref_talla, ref (solo referencia) y miss (referencia inexistente).
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    sample = cat.sample(n_lines, replace=len(cat) < n_lines, random_state=seed)
+    raws = []
+    for ref, color, talla in zip(sample["Referencia"], sample["Color"], sample["Talla"]):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "exact":
+            raws.append(f"[{ref}] ({color}, {talla})")
+        elif kind == "ref_color":
+            raws.append(f"[{ref}] ({color})")
+        elif kind == "ref_talla":
+            raws.append(f"[{ref}] ({talla})")
+        elif kind == "ref":
+            raws.append(f"[{ref}] Artículo")
+        else:
+            raws.append(f"[X{ref}] ({color}, {talla})")
+    qty = [rng.randint(1, 6) for _ in raws]
+    return pd.DataFrame({"Producto": raws, "Cantidad": qty})
+
+
+def write_xlsx(df: pd.DataFrame, path: str):
+    """xlsxwriter en modo constant_memory: viable para catálogos de 1M filas."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with pd.ExcelWriter(path, engine="xlsxwriter", engine_kwargs={"options": {"constant_memory": True}}) as xw:
+        df.to_excel(xw, index=False)
+
+
+def cached_catalog_xlsx(n_variants: int, cache_dir: str, seed: int = 0) -> str:
+    """Ruta a un catalogue.xlsx sintético; se genera una vez por tamaño/semilla."""
+    path = os.path.join(cache_dir, f"catalogue_{n_variants}_{seed}.xlsx")
+    if not os.path.exists(path):
+        write_xlsx(make_catalog(n_variants, seed=seed), path)
+    return path
+
+
+def make_history(cat: pd.DataFrame, n_lines: int, days: int = 365, lines_per_transfer: int = 200,
+                 destinos: Optional[list] = None, seed: int = 0) -> pd.DataFrame:
+    """Líneas de traspaso sintéticas repartidas en `days` días hasta hoy (formato de history.transfer_lines)."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    destinos = destinos or ["PET T001 Tienda Ibiza", "PET T002 Tienda Marbella", "PET T004 Tienda Madrid",
+                            "PET Almacén Ibiza"]
+    n_transfers = max(1, n_lines // lines_per_transfer)
+    t_day = rng.integers(0, days, n_transfers)
+    t_dest = rng.integers(0, len(destinos), n_transfers)
+    which = np.repeat(np.arange(n_transfers), lines_per_transfer)[:n_lines]
+    pick = rng.integers(0, len(cat), n_lines)
+    fechas = (pd.Timestamp.today().normalize() - pd.to_timedelta(t_day, unit="D")).strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "transfer_id": [f"bench-{i}" for i in which],
+        "fecha": np.asarray(fechas)[which],
+        "origen": "PET Almacén Badalona",
+        "destino": np.asarray(destinos)[t_dest][which],
+        "ean": cat["EAN"].to_numpy()[pick],
+        "ref": cat["Referencia"].astype(str).to_numpy()[pick],
+        "col": cat["Color"].astype(str).to_numpy()[pick],
+        "tal": cat["Talla"].astype(str).to_numpy()[pick],
+        "qty": rng.integers(1, 7, n_lines),
+    })
+
+
+def make_sales(cat: pd.DataFrame, days: int = 365, lines_per_day: int = 1500,
+               warehouses: Optional[list] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Ventas diarias sintéticas (fecha, almacén, EAN, unidades) de `days` días hasta ayer en cada almacén.
+    La popularidad de los EAN sigue una cola larga (unos pocos venden casi todos los días).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    warehouses = warehouses or ["PET Almacén Badalona", "PET Almacén Ibiza", "PET T001 Tienda Ibiza",
+                                "PET T002 Tienda Marbella", "PET T004 Tienda Madrid"]
+    n = days * len(warehouses) * lines_per_day
+    weights = 1.0 / np.arange(1, len(cat) + 1) ** 0.8
+    pick = rng.choice(len(cat), n, p=weights / weights.sum())
+    day = np.repeat(np.arange(days), len(warehouses) * lines_per_day)
+    wh = np.tile(np.repeat(np.arange(len(warehouses)), lines_per_day), days)
+    fechas = pd.Timestamp.today().normalize() - pd.to_timedelta(day + 1, unit="D")
+    return pd.DataFrame({
+        "Fecha": fechas.strftime("%Y-%m-%d"),
+        "Almacén": np.asarray(warehouses)[wh],
+        "EAN": cat["EAN"].to_numpy()[pick],
+        "Unidades": rng.integers(1, 4, n),
+    })
+
+
+def make_raw_catalog(cat: pd.DataFrame, dirty: float = 0.2, seed: int = 0) -> pd.DataFrame:
+    """
+    El catálogo tal como llega de un xlsx real: una fracción `dirty` de celdas con espacios, tallas en
+    minúsculas, celdas vacías (NaN) y EAN numéricos (int y float) en columnas de tipo object.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = len(cat)
+    out = cat[["EAN", "Referencia", "Nombre", "Color", "Talla"]].astype(object).copy()
+
+    def pick():
+        return rng.random(n) < dirty
+
+    for c in ("Referencia", "Nombre", "Color"):
+        m = pick()
+        out.loc[m, c] = " " + out.loc[m, c].astype(str) + "  "
+    m = pick()
+    out.loc[m, "Talla"] = out.loc[m, "Talla"].astype(str).str.lower()
+    m = pick()
+    out.loc[m, "EAN"] = out.loc[m, "EAN"].astype("int64")
+    m = pick() & (rng.random(n) < 0.5)
+    out.loc[m, "EAN"] = out.loc[m, "EAN"].astype(float)
+    for c in ("Nombre", "Color", "EAN"):
+        out.loc[rng.random(n) < dirty / 20, c] = np.nan
+    return out
@@ -0,0 +1,104 @@
+# bench/history.py
+"""
+Histórico de traspasos con un año de datos sintéticos (por defecto 2M líneas).
+
+    python -m bench.history
+    python -m bench.history --lines 5000000
+
+Mide la carga inicial del DataFrame en memoria, la carga incremental tras un traspaso nuevo,
+la carga al reiniciar (snapshot),
+la consulta indexada por fecha/destino, las agregaciones de la página de histórico y
+el coste de repetir un traspaso (biblioteca + join con el catálogo).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import history  # noqa: E402
+import utils  # noqa: E402
+from bench.generators import make_catalog, make_history  # noqa: E402
+
+
+def _ms(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.history", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--lines", type=int, default=2_000_000)
+    ap.add_argument("--variants", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="peticiones_hist_"), "historico.sqlite3")
+    store = history.HistoryStore(path)
+    cat = make_catalog(args.variants, seed=args.seed)
+    lines = make_history(cat, args.lines, seed=args.seed)
+
+    con = store._conn()
+    _, ms = _ms(lambda: (
+        con.execute("BEGIN"),
+        con.executemany(
+            "INSERT INTO transfer_lines (transfer_id, fecha, origen, destino, ean, ref, col, tal, qty) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            lines.itertuples(index=False, name=None),
+        ),
+        con.executemany(
+            "INSERT INTO transfers (transfer_id, exported_at, fecha, origen, destino, n_lines, units) "
+            "VALUES (?, 0, ?, ?, ?, ?, ?)",
+            lines.groupby("transfer_id", sort=False)
+            .agg(fecha=("fecha", "first"), origen=("origen", "first"), destino=("destino", "first"),
+                 n=("qty", "size"), units=("qty", "sum"))
+            .reset_index().astype({"n": int, "units": int}).itertuples(index=False, name=None),
+        ),
+        con.execute("COMMIT"),
+    ))
+    print(f"insertadas {len(lines):,} líneas en {ms:.0f} ms ({os.path.getsize(path) / 1e6:.0f} MB)")
+
+    df, ms = _ms(store.frame)
+    print(f"frame() inicial: {ms:.0f} ms · {df.memory_usage(deep=True).sum() / 1e6:.0f} MB en memoria")
+
+    sample = {e: {"Ref": "1", "Col": "A", "Tal": "M", "Cantidad": 2} for e in cat["EAN"].head(300)}
+    store.record_transfer("bench", date.today(), "PET Almacén Badalona", "PET T001 Tienda Ibiza", "", sample)
+    df, ms = _ms(store.frame)
+    print(f"frame() tras un traspaso nuevo (incremental): {ms:.0f} ms")
+
+    df, ms = _ms(history.HistoryStore(path).frame)
+    print(f"frame() tras reiniciar el proceso (snapshot + filas nuevas): {ms:.0f} ms")
+
+    d_to, d_from = date.today(), date.today() - timedelta(days=30)
+    q, ms = _ms(lambda: store.query_lines(d_from, d_to, ["PET T002 Tienda Marbella"]))
+    print(f"query_lines 30 días · 1 destino (índice): {ms:.0f} ms · {len(q):,} líneas")
+
+    def aggregate():
+        sel = history.filter_lines(df, date.today() - timedelta(days=365), date.today())
+        return history.units_by_week(sel), history.units_by_destino(sel), history.top_refs(sel, 20)
+
+    aggregate()
+    best = min(_ms(aggregate)[1] for _ in range(3))
+    print(f"agregaciones de la página (1 año, todos los destinos): {best:.0f} ms")
+
+    def reorder():
+        found = store.find_transfers(destino="PET T002 Tienda Marbella", limit=20)
+        lines = store.transfer_lines(found["transfer_id"].iloc[0])
+        return utils.resolve_reorder_lines(lines, cat, 1.5)
+
+    (resolved, _), ms = _ms(reorder)
+    print(f"repetir traspaso ({len(resolved)} líneas, búsqueda + join con catálogo): {ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# bench/normalize.py
+"""
+Normalización del catálogo (utils.normalize_catalog) frente al camino anterior celda a celda.
+
+    python -m bench.normalize                 # 1M filas
+    python -m bench.normalize --rows 100000 --dirty 0.5
+
+Primero comprueba los casos límite (NaN, EAN numéricos int/float, tallas en minúsculas, espacios)
+y que sobre datos limpios el resultado coincide con el de norm_* por celda; sale con código 1 si
+alguno falla. Después mide ambos caminos sobre un catálogo sintético "sucio" (make_raw_catalog).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import utils  # noqa: E402
+from bench.generators import make_catalog, make_raw_catalog  # noqa: E402
+
+# (columna, valor crudo, valor normalizado esperado)
+EDGE_CASES = [
+    ("EAN", 8445790046890, "8445790046890"),
+    ("EAN", 8445790046890.0, "8445790046890"),
+    ("EAN", " 8445790046890 ", "8445790046890"),
+    ("EAN", "0845790046890", "0845790046890"),
+    ("Referencia", 214803, "214803"),
+    ("Referencia", " 214803 ", "214803"),
+    ("Nombre", np.nan, ""),
+    ("Nombre", None, ""),
+    ("Color", " Azul Marino ", "Azul Marino"),
+    ("Talla", "xl", "XL"),
+    ("Talla", " m ", "M"),
+    ("Talla", "Xxs", "XXS"),
+    ("Talla", "10a", "10a"),
+    ("Talla", "UNICA", "UNICA"),
+    ("Talla", np.nan, ""),
+]
+BASE_ROW = {"EAN": "8445790000007", "Referencia": "200000", "Nombre": "Vestido", "Color": "Negro", "Talla": "M"}
+
+
+def per_cell(df: pd.DataFrame) -> pd.DataFrame:
+    """El camino anterior: una llamada Python a norm_* por celda."""
+    df = df.copy()
+    df["EAN"] = df["EAN"].astype(str).str.strip()
+    df["Referencia"] = df["Referencia"].map(utils.norm_ref)
+    df["Nombre"] = df["Nombre"].map(utils.norm_str)
+    df["Color"] = df["Color"].map(utils.norm_color)
+    df["Talla"] = df["Talla"].map(utils.norm_talla)
+    df["TallaRank"] = utils.size_rank(df["Talla"])
+    return utils.encode_catalog_columns(df)
+
+
+def check_edge_cases() -> list:
+    failures = []
+    rows = [{**BASE_ROW, col: raw} for col, raw, _ in EDGE_CASES]
+    out = utils.normalize_catalog(pd.DataFrame(rows, dtype=object))
+    for i, (col, raw, expected) in enumerate(EDGE_CASES):
+        got = str(out.at[i, col])
+        if got != expected:
+            failures.append(f"{col} {raw!r}: esperado {expected!r}, obtenido {got!r}")
+
+    dropped = utils.normalize_catalog(pd.DataFrame([{**BASE_ROW, "EAN": np.nan}, {**BASE_ROW, "EAN": "  "}], dtype=object))
+    if len(dropped):
+        failures.append(f"filas sin EAN: esperado 0, quedan {len(dropped)}")
+
+    clean = make_catalog(20_000)
+    a, b = utils.normalize_catalog(clean), per_cell(clean)
+    if not a.equals(b) or list(a["Talla"].cat.categories) != list(b["Talla"].cat.categories):
+        failures.append("datos limpios: el resultado difiere del camino celda a celda")
+    return failures
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.normalize", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--dirty", type=float, default=0.2, help="Fracción de celdas sucias")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    failures = check_edge_cases()
+    for f in failures:
+        print(f"FALLO · {f}")
+    print(f"casos límite: {len(EDGE_CASES) + 2 - len(failures)}/{len(EDGE_CASES) + 2} correctos")
+
+    raw = make_raw_catalog(make_catalog(args.rows, seed=args.seed), args.dirty, args.seed)
+    print(f"catálogo sintético: {len(raw):,} filas · {args.dirty:.0%} de celdas sucias")
+    # Lo que entrega read_excel(dtype=str): texto con NaN en las celdas vacías
+    as_read = raw.apply(lambda c: c.astype("str").where(c.notna()))
+    old = _best_ms(lambda: per_cell(raw), 1)
+    new_obj = _best_ms(lambda: utils.normalize_catalog(raw), args.repeat)
+    new = _best_ms(lambda: utils.normalize_catalog(as_read), args.repeat)
+    print(f"{'celda a celda (norm_*)':<42} {old:>6.0f} ms")
+    print(f"{'normalize_catalog, columnas object':<42} {new_obj:>6.0f} ms · ×{old / new_obj:.1f}")
+    print(f"{'normalize_catalog, read_excel(dtype=str)':<42} {new:>6.0f} ms · ×{old / new:.1f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# bench/suggest.py
+"""
+Motor de sugerencias de reposición con un año de ventas diarias en los cinco almacenes.
+
+    python -m bench.suggest
+    python -m bench.suggest --lines-per-day 3000 --variants 100000
+
+Mide la lectura del CSV de ventas, el snapshot de stock y el cálculo de la sugerencia
+(ventana de 28 días, 14 de cobertura) para un destino, con y sin stock.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import stock  # noqa: E402
+import suggest  # noqa: E402
+import utils  # noqa: E402
+from bench.generators import make_catalog, make_sales  # noqa: E402
+
+
+def _ms(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench.suggest", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--variants", type=int, default=20_000)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--lines-per-day", type=int, default=1500, help="Líneas de venta por almacén y día")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    cat = utils.encode_catalog_columns(
+        make_catalog(args.variants, seed=args.seed).assign(TallaRank=lambda d: utils.size_rank(d["Talla"]))
+    )
+    raw = make_sales(cat, args.days, args.lines_per_day, seed=args.seed)
+    csv = raw.to_csv(index=False, sep=";").encode()
+    print(f"ventas: {len(raw):,} filas · {len(csv) / 1e6:.0f} MB de CSV")
+
+    sales, ms = _ms(lambda: suggest.read_sales_file(csv, "ventas.csv"))
+    print(f"read_sales_file: {ms:.0f} ms · {sales.memory_usage(deep=True).sum() / 1e6:.0f} MB en memoria")
+
+    stock_csv = (
+        "Almacén;EAN;Stock\n"
+        + "".join(f"{w};{e};{i % 9}\n" for w in ("PET Almacén Badalona", "PET T002 Tienda Marbella")
+                  for i, e in enumerate(cat["EAN"]))
+    ).encode()
+    snap, ms = _ms(lambda: stock.StockSnapshot(stock.read_stock_file(stock_csv, "stock.csv")[0]))
+    print(f"snapshot de stock ({snap.rows:,} filas): {ms:.0f} ms")
+
+    for label, s in (("sin stock", None), ("con stock", snap)):
+        best = float("inf")
+        for _ in range(3):
+            (lines, missing), ms = _ms(lambda: suggest.suggest_replenishment(
+                sales, cat, "PET T002 Tienda Marbella", origen="PET Almacén Badalona", snapshot=s,
+            ))
+            best = min(best, ms)
+        print(f"suggest_replenishment {label}: {best:.0f} ms · {len(lines):,} EAN · {int(lines['Cantidad'].sum()):,} uds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
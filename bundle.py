@@ -0,0 +1,175 @@
+# bundle.py
+"""
+Bundle de arranque: catálogo normalizado, derivados y plantilla en un solo fichero versionado.
+
+Se genera en el despliegue (`python -m peticiones prebuild`) y se abre con mmap al arrancar:
+en un contenedor nuevo la primera versión de catalog_store sale del bundle en vez de parsear
+catalogue.xlsx y reconstruir los índices.
+
+Formato:
+    MAGIC | longitud de cabecera (u32 LE) | cabecera JSON | pickle (protocolo 5) | buffers
+- La cabecera lleva BUNDLE_FORMAT, las versiones de pandas y numpy que lo escribieron y el sha1 de
+  catalogue.xlsx y plantilla_pedido.xlsx. Si el formato, las versiones o el catálogo no coinciden,
+  el bundle se ignora (se parsea como siempre); si solo cambió la plantilla, se aprovecha el
+  catálogo y la plantilla se lee del fichero.
+- Los arrays numpy (códigos de las columnas categóricas, TallaRank...) van fuera del pickle,
+  alineados a 64 bytes. Al cargar son vistas de solo lectura sobre el mmap: no se copian y sus
+  páginas las comparten todos los procesos que abren el mismo fichero.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from perf import timed_fn
+from utils import (
+    DEFAULT_CATALOG_PATH,
+    DEFAULT_TEMPLATE_PATH,
+    _read_catalog_xlsx,
+    build_catalog_indexes,
+    build_ean_index,
+    build_ref_grid,
+    build_search_blob,
+    build_size_ranks,
+)
+
+DEFAULT_BUNDLE_PATH = os.environ.get("PETICIONES_BUNDLE", "catalog.bundle")
+
+MAGIC = b"PETBNDL\x00"
+# Subir cuando cambie la normalización del catálogo o la forma de los índices
+BUNDLE_FORMAT = 2
+ALIGN = 64
+
+
+def _sha1_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _library_versions() -> dict:
+    """El pickle de DataFrames y arrays solo es fiable con las mismas versiones que lo escribieron."""
+    return {"pandas": pd.__version__, "numpy": np.__version__}
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+@timed_fn("bundle_build")
+def build_bundle(out_path: str = DEFAULT_BUNDLE_PATH, catalog_path: str = DEFAULT_CATALOG_PATH,
+                 template_path: str = DEFAULT_TEMPLATE_PATH) -> dict:
+    """Parsea catálogo y plantilla, construye todos los derivados y los escribe en `out_path`. Devuelve la cabecera."""
+    df = _read_catalog_xlsx(catalog_path)
+    match_indexes = build_catalog_indexes(df)
+    payload = {
+        "catalog_df": df,
+        "search_blob": build_search_blob(df),
+        "ean_index": build_ean_index(df),
+        "match_indexes": match_indexes,
+        "size_ranks": build_size_ranks(df["Talla"]),
+        "ref_grids": {ref: build_ref_grid(rows) for ref, rows in match_indexes[3].items()},
+    }
+    template_sha1 = _sha1_file(template_path)
+    if template_sha1 is not None:
+        with open(template_path, "rb") as f:
+            payload["tpl_bytes"] = f.read()
+
+    buffers = []
+    data = pickle.dumps(payload, protocol=5, buffer_callback=buffers.append)
+    spans, offset = [], _aligned(len(data))
+    raws = [b.raw() for b in buffers]
+    for raw in raws:
+        spans.append((offset, raw.nbytes))
+        offset = _aligned(offset + raw.nbytes)
+
+    header = {
+        "format": BUNDLE_FORMAT,
+        "libraries": _library_versions(),
+        "catalog_sha1": _sha1_file(catalog_path),
+        "template_sha1": template_sha1,
+        "built_at": time.time(),
+        "rows": len(df),
+        "refs": len(match_indexes[3]),
+        "pickle_len": len(data),
+        "buffers": spans,
+    }
+    head = json.dumps(header).encode()
+    start = _aligned(len(MAGIC) + 4 + len(head))
+
+    # Escritura atómica: un proceso que arranca nunca ve un bundle a medias
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head)
+        f.write(b"\0" * (start - f.tell()))
+        f.write(data)
+        for (off, _), raw in zip(spans, raws):
+            f.write(b"\0" * (start + off - f.tell()))
+            f.write(raw)
+    os.replace(tmp, out_path)
+    return header
+
+
+def read_header(path: str = DEFAULT_BUNDLE_PATH) -> Optional[dict]:
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (n,) = struct.unpack("<I", f.read(4))
+            return json.loads(f.read(n))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def bundle_status(path: str = DEFAULT_BUNDLE_PATH, catalog_path: str = DEFAULT_CATALOG_PATH,
+                  template_path: str = DEFAULT_TEMPLATE_PATH) -> str:
+    """'ok', 'sin bundle', 'formato antiguo', 'versiones distintas', 'catálogo distinto' o 'plantilla distinta'."""
+    header = read_header(path)
+    if header is None:
+        return "sin bundle"
+    if header.get("format") != BUNDLE_FORMAT:
+        return "formato antiguo"
+    if header.get("libraries") != _library_versions():
+        return "versiones distintas"
+    if header.get("catalog_sha1") != _sha1_file(catalog_path):
+        return "catálogo distinto"
+    if header.get("template_sha1") != _sha1_file(template_path):
+        return "plantilla distinta"
+    return "ok"
+
+
+@timed_fn("bundle_load")
+def load_bundle(path: str = DEFAULT_BUNDLE_PATH, catalog_path: str = DEFAULT_CATALOG_PATH,
+                template_path: str = DEFAULT_TEMPLATE_PATH) -> Optional[dict]:
+    """
+    Artefactos del bundle si corresponde al catálogo actual (None si no hay bundle o está obsoleto).
+    Sin `tpl_bytes` si la plantilla cambió desde el prebuild.
+    """
+    status = bundle_status(path, catalog_path, template_path)
+    if status not in ("ok", "plantilla distinta"):
+        return None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # El mmap sigue abierto mientras algún array apunte a él
+    view = memoryview(mm)
+    (n,) = struct.unpack("<I", view[len(MAGIC):len(MAGIC) + 4])
+    header = json.loads(bytes(view[len(MAGIC) + 4:len(MAGIC) + 4 + n]))
+    start = _aligned(len(MAGIC) + 4 + n)
+    payload = pickle.loads(
+        view[start:start + header["pickle_len"]],
+        buffers=[view[start + off:start + off + size] for off, size in header["buffers"]],
+    )
+    if status != "ok":
+        payload.pop("tpl_bytes", None)
+    return payload
@@ -0,0 +1,461 @@
+# catalog_store.py
+"""
+Catálogo y plantilla compartidos por todo el proceso, versionados.
+
+- Cada versión nueva se compara con la anterior por EAN (altas, bajas, cambios) y solo se
+  recalculan los derivados de las referencias afectadas; el resultado queda en `changelog`.
+
+- Un hilo vigilante (polling de mtime) detecta cambios en catalogue.xlsx / plantilla_pedido.xlsx.
+- La reconstrucción (parseo + índices derivados) se hace en ese hilo, nunca en una petición de usuario.
+- Arranque: el primer get_catalog_store() lanza un hilo de precarga y vuelve enseguida. Cada derivado
+  de CatalogVersion se construye al primer acceso (o lo adelanta la precarga); solo las páginas que
+  de verdad necesitan el catálogo esperan por él (CatalogStore.ensure_loaded).
+- Si existe un bundle de arranque vigente (bundle.py, `python -m peticiones prebuild`), la primera
+  versión sale de él ya con todos sus derivados, sin parsear el xlsx.
+- Al terminar se sustituye la versión publicada de golpe (una asignación de referencia);
+  cada sesión la recoge en su siguiente rerun desde load_repo_data().
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from bundle import DEFAULT_BUNDLE_PATH, load_bundle
+from perf import timed_fn
+from utils import (
+    DEFAULT_CATALOG_PATH,
+    DEFAULT_TEMPLATE_PATH,
+    _read_catalog_xlsx,
+    build_catalog_indexes,
+    build_ean_index,
+    build_search_blob,
+    build_size_ranks,
+)
+
+DIFF_COLUMNS = ["Referencia", "Nombre", "Color", "Talla"]
+# Por encima de esta fracción de referencias afectadas sale más a cuenta reconstruir todo
+FULL_REBUILD_RATIO = 0.5
+
+log = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.environ.get("PETICIONES_CATALOG_POLL", "5"))
+# Un fichero recién modificado puede estar a medio copiar: esperamos a que su mtime se asiente
+SETTLE_SECONDS = 1.0
+
+
+class _ArtifactCache:
+    """Derivados de un catálogo concreto. Lo comparten las versiones que solo cambian la plantilla."""
+
+    def __init__(self, values: Optional[dict] = None):
+        self.values: Dict[str, object] = dict(values or {})
+        self.lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CatalogVersion:
+    """
+    Versión publicada. Solo catalog_df se construye al publicar; el resto de artefactos
+    (blob de búsqueda, índice EAN, índices de match, rangos de talla, bytes de plantilla)
+    se derivan al primer acceso y quedan en la versión para todas las sesiones.
+    """
+    version: int
+    catalog_mtime: Optional[float]
+    template_mtime: Optional[float]
+    catalog_df: Optional[pd.DataFrame]
+    built_at: float
+    template_path: str = DEFAULT_TEMPLATE_PATH
+    # Grids por referencia; se rellenan bajo demanda (get_ref_grid) y se heredan si la ref no cambia
+    ref_grids: Dict[str, dict] = field(default_factory=dict)
+    changelog: Optional[dict] = None
+    # "xlsx" (parseado) o "bundle" (mapeado desde el prebuild)
+    source: str = "xlsx"
+    artifacts: _ArtifactCache = field(default_factory=_ArtifactCache, repr=False)
+    template: _ArtifactCache = field(default_factory=_ArtifactCache, repr=False)
+
+    @property
+    def cat_loaded(self) -> bool:
+        return self.catalog_df is not None
+
+    @property
+    def has_template(self) -> bool:
+        """Sin leer el fichero: basta con que existiera al publicar la versión."""
+        return self.template_mtime is not None
+
+    def _get(self, cache: _ArtifactCache, name: str, build):
+        value = cache.values.get(name)
+        if value is None and name not in cache.values:
+            with cache.lock:
+                if name not in cache.values:
+                    cache.values[name] = build()
+                value = cache.values[name]
+        return value
+
+    def _derived(self, name: str):
+        if self.catalog_df is None:
+            return None
+        return self._get(self.artifacts, name, lambda: ARTIFACT_BUILDERS[name](self.catalog_df))
+
+    def has(self, name: str) -> bool:
+        return name in self.artifacts.values
+
+    @property
+    def search_blob(self) -> Optional[pd.Series]:
+        return self._derived("search_blob")
+
+    @property
+    def ean_index(self) -> Optional[Dict[str, dict]]:
+        return self._derived("ean_index")
+
+    @property
+    def match_indexes(self) -> Optional[Tuple[dict, dict, dict, dict]]:
+        return self._derived("match_indexes")
+
+    @property
+    def size_ranks(self) -> Dict[str, int]:
+        # Talla -> rango de orden (igual que la columna TallaRank del catálogo)
+        return self._derived("size_ranks") or {}
+
+    @property
+    def tpl_bytes(self) -> Optional[bytes]:
+        if not self.has_template:
+            return None
+        return self._get(self.template, "tpl_bytes", lambda: _read_bytes(self.template_path))
+
+    @timed_fn("catalog_warm")
+    def warm(self):
+        """Deriva todo lo pendiente (lo llama el hilo de precarga, no las sesiones)."""
+        for name in ARTIFACT_BUILDERS:
+            self._derived(name)
+        _ = self.tpl_bytes
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+ARTIFACT_BUILDERS = {
+    "search_blob": build_search_blob,
+    "ean_index": build_ean_index,
+    "match_indexes": build_catalog_indexes,
+    "size_ranks": lambda df: build_size_ranks(df["Talla"]),
+}
+
+
+def build_catalog_artifacts(path: str) -> dict:
+    """Parsea el catálogo. Los derivados se construyen después, al primer acceso (CatalogVersion)."""
+    return build_catalog_artifacts_from_df(_read_catalog_xlsx(path))
+
+
+def build_catalog_artifacts_from_df(df: pd.DataFrame) -> dict:
+    return {"catalog_df": df, "artifacts": _ArtifactCache(), "ref_grids": {}}
+
+
+def catalog_artifacts_from_bundle(payload: dict) -> dict:
+    """Artefactos ya construidos por `python -m peticiones prebuild` (bundle.py)."""
+    out = {
+        "catalog_df": payload["catalog_df"],
+        "artifacts": _ArtifactCache({name: payload[name] for name in ARTIFACT_BUILDERS}),
+        "ref_grids": dict(payload["ref_grids"]),
+        "source": "bundle",
+    }
+    if "tpl_bytes" in payload:
+        out["template"] = _ArtifactCache({"tpl_bytes": payload["tpl_bytes"]})
+    return out
+
+
+@timed_fn("catalog_diff")
+def diff_catalogs(old: pd.DataFrame, new: pd.DataFrame) -> dict:
+    """
+    Compara dos catálogos normalizados por EAN.
+    Devuelve {"added", "removed", "changed"} (pd.Index de EANs), las referencias afectadas
+    y un DataFrame `detail` con una fila por EAN modificado (estado antes/después).
+    """
+    o = old.drop_duplicates("EAN", keep="last").set_index("EAN")[DIFF_COLUMNS]
+    n = new.drop_duplicates("EAN", keep="last").set_index("EAN")[DIFF_COLUMNS]
+
+    added = n.index.difference(o.index)
+    removed = o.index.difference(n.index)
+    common = n.index.intersection(o.index)
+    neq = (o.loc[common].astype(str).values != n.loc[common].astype(str).values).any(axis=1)
+    changed = common[neq]
+
+    # EANs duplicados dentro de un catálogo: siempre se tratan como cambiados
+    dups = pd.Index(old.loc[old["EAN"].duplicated(keep=False), "EAN"]).union(
+        pd.Index(new.loc[new["EAN"].duplicated(keep=False), "EAN"])
+    ).intersection(common)
+    changed = changed.union(dups)
+
+    refs = set(o.loc[removed.union(changed), "Referencia"]) | set(n.loc[added.union(changed), "Referencia"])
+
+    parts = [
+        n.loc[added].assign(Cambio="alta"),
+        o.loc[removed].assign(Cambio="baja"),
+        n.loc[changed].assign(Cambio="cambio"),
+    ]
+    # Sin las partes vacías (pandas 2.x avisa al concatenarlas); si todas lo están, queda una vacía
+    detail = pd.concat([p for p in parts if len(p)] or parts[:1]).rename_axis("EAN").reset_index()
+
+    return {"added": added, "removed": removed, "changed": changed, "refs": refs, "detail": detail}
+
+
+@timed_fn("catalog_incremental")
+def update_catalog_artifacts(prev: CatalogVersion, new_df: pd.DataFrame, diff: dict) -> dict:
+    """
+    Deriva los artefactos de new_df a partir de los de `prev`, recalculando solo lo afectado por `diff`.
+    Solo se actualizan los que `prev` ya tenía construidos; el resto se construirá al primer acceso.
+    No muta nada de `prev` (las sesiones pueden estar leyéndolo): copia superficial de los dicts.
+    """
+    refs = diff["refs"]
+    touched = diff["added"].union(diff["changed"])
+    values = {}
+
+    # Blob de búsqueda: se reutiliza por EAN y solo se calculan las filas nuevas/cambiadas
+    if prev.has("search_blob"):
+        prev_df = prev.catalog_df
+        old_blob = pd.Series(prev.search_blob.values, index=prev_df["EAN"].values)
+        old_blob = old_blob[~old_blob.index.duplicated(keep="last")]
+        blob = pd.Series(old_blob.reindex(new_df["EAN"].values).values, index=new_df.index)
+        redo = new_df["EAN"].isin(touched) | blob.isna()
+        if redo.any():
+            blob[redo] = build_search_blob(new_df.loc[redo])
+        values["search_blob"] = blob
+
+    # Índice EAN
+    if prev.has("ean_index"):
+        ean_index = dict(prev.ean_index)
+        for ean in diff["removed"]:
+            ean_index.pop(ean, None)
+        if len(touched):
+            ean_index.update(build_ean_index(new_df[new_df["EAN"].isin(touched)]))
+        values["ean_index"] = ean_index
+
+    # Índices de match: se quitan todas las claves de las refs afectadas y se reconstruyen con sus filas nuevas
+    if prev.has("match_indexes"):
+        idx_exact, idx_ref_color, idx_ref_talla, idx_ref = (dict(d) for d in prev.match_indexes)
+        for ref in refs:
+            for r in prev.match_indexes[3].get(ref, []):
+                idx_exact.pop((ref, r["Color"], r["Talla"]), None)
+                idx_ref_color.pop((ref, r["Color"]), None)
+                idx_ref_talla.pop((ref, r["Talla"]), None)
+            idx_ref.pop(ref, None)
+        part = build_catalog_indexes(new_df[new_df["Referencia"].isin(refs)])
+        for full, delta in zip((idx_exact, idx_ref_color, idx_ref_talla, idx_ref), part):
+            full.update(delta)
+        values["match_indexes"] = (idx_exact, idx_ref_color, idx_ref_talla, idx_ref)
+
+    return {
+        "catalog_df": new_df,
+        "artifacts": _ArtifactCache(values),
+        "ref_grids": {r: g for r, g in prev.ref_grids.items() if r not in refs},
+    }
+
+
+def _changelog(version: int, diff: dict, incremental: bool) -> dict:
+    return {
+        "version": version,
+        "at": time.time(),
+        "added": len(diff["added"]),
+        "removed": len(diff["removed"]),
+        "changed": len(diff["changed"]),
+        "refs": sorted(diff["refs"]),
+        "incremental": incremental,
+        "detail": diff["detail"],
+    }
+
+
+class CatalogStore:
+    def __init__(self, catalog_path: str = DEFAULT_CATALOG_PATH, template_path: str = DEFAULT_TEMPLATE_PATH,
+                 poll_seconds: float = POLL_SECONDS, bundle_path: Optional[str] = DEFAULT_BUNDLE_PATH):
+        self.catalog_path = catalog_path
+        self.template_path = template_path
+        self.bundle_path = bundle_path
+        self.poll_seconds = poll_seconds
+        self.last_error: Optional[str] = None
+        # Bundle presente pero ilegible: se arrancó parseando el xlsx
+        self.bundle_error: Optional[str] = None
+        self.changelogs: deque = deque(maxlen=20)
+        self._current: Optional[CatalogVersion] = None
+        self._build_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._warmer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def current(self) -> Optional[CatalogVersion]:
+        """Versión publicada. Lectura sin lock: la sustitución es atómica."""
+        return self._current
+
+    def _is_settled(self, mtime: Optional[float]) -> bool:
+        return mtime is None or (time.time() - mtime) >= SETTLE_SECONDS
+
+    def refresh(self) -> bool:
+        """
+        Reconstruye lo que haya cambiado y publica una versión nueva.
+        Devuelve True si se publicó algo. Si el catálogo nuevo falla al leerse,
+        se mantiene la versión anterior y se reintenta en el siguiente ciclo.
+        """
+        with self._build_lock:
+            cur = self._current
+            cat_mtime = _mtime(self.catalog_path)
+            tpl_mtime = _mtime(self.template_path)
+
+            cat_changed = cur is None or cat_mtime != cur.catalog_mtime
+            tpl_changed = cur is None or tpl_mtime != cur.template_mtime
+            if not (cat_changed or tpl_changed):
+                return False
+            if cur is not None and not (self._is_settled(cat_mtime) and self._is_settled(tpl_mtime)):
+                return False
+
+            if cat_changed:
+                try:
+                    if cat_mtime is None:
+                        raise FileNotFoundError(f"No existe {self.catalog_path}")
+                    artifacts = self._build_catalog(cur)
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    if cur is not None and cur.cat_loaded:
+                        return False
+                    artifacts = {}
+                    # Sin catálogo que conservar: se publica vacío, sin mtime, para reintentar en el siguiente ciclo
+                    cat_mtime = None
+                base = {"catalog_df": None, "ref_grids": {}, "changelog": None, **artifacts}
+            else:
+                # Mismo catálogo: la versión nueva comparte sus derivados (construidos o pendientes)
+                base = {
+                    "catalog_df": cur.catalog_df,
+                    "artifacts": cur.artifacts,
+                    "ref_grids": cur.ref_grids,
+                    "changelog": cur.changelog,
+                }
+            if not tpl_changed:
+                base["template"] = cur.template
+
+            new = CatalogVersion(
+                version=(cur.version + 1) if cur is not None else 1,
+                catalog_mtime=cat_mtime,
+                template_mtime=tpl_mtime,
+                built_at=time.time(),
+                template_path=self.template_path,
+                **base,
+            )
+            self._current = new
+            if cat_changed and new.changelog is not None:
+                self.changelogs.appendleft(new.changelog)
+            return True
+
+    def ensure_loaded(self) -> Optional[CatalogVersion]:
+        """
+        Versión publicada; si aún no hay ninguna, la carga aquí. Si la precarga está en marcha,
+        espera a que termine (refresh comparte el lock de construcción) en vez de parsear dos veces.
+        """
+        if self._current is None:
+            self.refresh()
+        return self._current
+
+    @property
+    def warming(self) -> bool:
+        return self._warmer is not None and self._warmer.is_alive()
+
+    def _warm(self):
+        try:
+            self.refresh()
+            if self._current is not None:
+                self._current.warm()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+
+    def start_warmup(self):
+        """Precarga en segundo plano: parseo del catálogo y todos sus derivados, sin bloquear el primer pintado."""
+        if self.warming:
+            return
+        self._warmer = threading.Thread(target=self._warm, name="catalog-warmup", daemon=True)
+        self._warmer.start()
+
+    def _build_catalog(self, cur: Optional[CatalogVersion]) -> dict:
+        """
+        Lee el catálogo y deriva sus artefactos: incremental si hay versión previa; si no, desde
+        el bundle de arranque cuando corresponde al catálogo actual, o parseando el xlsx.
+        """
+        version = (cur.version + 1) if cur is not None else 1
+        if cur is None or not cur.cat_loaded:
+            payload = None
+            if self.bundle_path:
+                try:
+                    payload = load_bundle(self.bundle_path, self.catalog_path, self.template_path)
+                except Exception as e:
+                    # Bundle corrupto o escrito con otras versiones de pandas/numpy: se parsea el xlsx
+                    self.bundle_error = f"{type(e).__name__}: {e}"
+                    log.warning("Bundle %s ilegible, se parsea el catálogo: %s", self.bundle_path, self.bundle_error)
+            if payload is not None:
+                return catalog_artifacts_from_bundle(payload)
+            return build_catalog_artifacts(self.catalog_path)
+
+        new_df = _read_catalog_xlsx(self.catalog_path)
+        diff = diff_catalogs(cur.catalog_df, new_df)
+        n_refs = max(cur.catalog_df["Referencia"].nunique(), 1)
+        if len(diff["refs"]) / n_refs > FULL_REBUILD_RATIO:
+            artifacts = build_catalog_artifacts_from_df(new_df)
+            incremental = False
+        else:
+            artifacts = update_catalog_artifacts(cur, new_df, diff)
+            incremental = True
+        artifacts["changelog"] = _changelog(version, diff, incremental)
+        return artifacts
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                # La versión nueva se precalienta aquí para que ninguna sesión pague sus derivados
+                if self.refresh():
+                    self._current.warm()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def start_watcher(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+
+def find_orphan_eans(carts, ean_index: Optional[Dict[str, dict]]) -> list:
+    """EANs presentes en los carritos que ya no existen en el catálogo publicado."""
+    if ean_index is None:
+        return []
+    out = set()
+    for cart in carts:
+        out.update(e for e in (cart or {}) if e not in ean_index)
+    return sorted(out)
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog_store() -> CatalogStore:
+    """Store único por proceso: precarga y vigilante en segundo plano; no bloquea a quien lo pide."""
+    store = CatalogStore()
+    store.start_warmup()
+    store.start_watcher()
+    return store
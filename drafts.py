@@ -0,0 +1,219 @@
+# drafts.py
+"""
+Persistencia en servidor de las peticiones en curso (SQLite en modo WAL).
+
+- Cabecera por borrador: ref_peticion, fecha, origen, destino, pendientes.
+- Líneas de carrito guardadas como deltas: upsert por (borrador, carrito, EAN) en cada edición;
+  cantidad <= 0 borra la línea. Nunca se reescribe el carrito entero.
+- Una conexión por hilo (cada sesión de Streamlit corre en su propio hilo).
+
+tests/test_drafts.py lanza muchas sesiones simuladas escribiendo a la vez.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import streamlit as st
+
+DEFAULT_DB_PATH = os.environ.get("PETICIONES_DB", "peticiones.sqlite3")
+CART_NAMES = ("carrito_import", "carrito_manual")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    draft_id     TEXT PRIMARY KEY,
+    ref_peticion TEXT NOT NULL DEFAULT '',
+    fecha        TEXT,
+    origen       TEXT,
+    destino      TEXT,
+    pending_json TEXT NOT NULL DEFAULT '[]',
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_drafts_ref ON drafts(ref_peticion);
+CREATE INDEX IF NOT EXISTS ix_drafts_updated ON drafts(updated_at);
+
+CREATE TABLE IF NOT EXISTS draft_lines (
+    draft_id TEXT NOT NULL,
+    cart     TEXT NOT NULL,
+    ean      TEXT NOT NULL,
+    ref      TEXT NOT NULL DEFAULT '',
+    nom      TEXT NOT NULL DEFAULT '',
+    col      TEXT NOT NULL DEFAULT '',
+    tal      TEXT NOT NULL DEFAULT '',
+    qty      INTEGER NOT NULL,
+    PRIMARY KEY (draft_id, cart, ean)
+) WITHOUT ROWID;
+"""
+
+_TOUCH_SQL = """
+INSERT INTO drafts (draft_id, created_at, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(draft_id) DO UPDATE SET updated_at = excluded.updated_at
+"""
+_UPSERT_LINE_SQL = """
+INSERT INTO draft_lines (draft_id, cart, ean, ref, nom, col, tal, qty) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(draft_id, cart, ean) DO UPDATE SET
+    ref = excluded.ref, nom = excluded.nom, col = excluded.col, tal = excluded.tal, qty = excluded.qty
+"""
+
+
+def escape_like(text: str) -> str:
+    """Texto literal para un patrón LIKE ... ESCAPE '\\': % y _ del usuario no son comodines."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class DraftStore:
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as con:
+            con.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: sin fsync por transacción (solo en checkpoint); sigue siendo consistente
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=5000")
+            self._local.con = con
+        return con
+
+    def _write(self, fn):
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            fn(con)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    # -------- escritura --------
+
+    def save_header(self, draft_id: str, ref_peticion: str, fecha: Optional[date], origen: str, destino: str):
+        now = time.time()
+        fecha_txt = fecha.isoformat() if fecha else None
+
+        def op(con):
+            con.execute(
+                """
+                INSERT INTO drafts (draft_id, ref_peticion, fecha, origen, destino, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(draft_id) DO UPDATE SET
+                    ref_peticion = excluded.ref_peticion, fecha = excluded.fecha,
+                    origen = excluded.origen, destino = excluded.destino, updated_at = excluded.updated_at
+                """,
+                (draft_id, ref_peticion or "", fecha_txt, origen, destino, now, now),
+            )
+
+        self._write(op)
+
+    def upsert_lines(self, draft_id: str, cart: str, items: Iterable[dict]):
+        """Aplica el estado actual de las líneas dadas (formato de carrito). Cantidad <= 0 = borrar."""
+        up, dele = [], []
+        for it in items:
+            ean = str(it.get("EAN", ""))
+            if not ean:
+                continue
+            qty = int(it.get("Cantidad", 0) or 0)
+            if qty <= 0:
+                dele.append((draft_id, cart, ean))
+            else:
+                up.append((draft_id, cart, ean, it.get("Ref", ""), it.get("Nom", ""), it.get("Col", ""),
+                           it.get("Tal", ""), qty))
+        if not up and not dele:
+            return
+        now = time.time()
+
+        def op(con):
+            con.execute(_TOUCH_SQL, (draft_id, now, now))
+            if up:
+                con.executemany(_UPSERT_LINE_SQL, up)
+            if dele:
+                con.executemany("DELETE FROM draft_lines WHERE draft_id = ? AND cart = ? AND ean = ?", dele)
+
+        self._write(op)
+
+    def clear_cart(self, draft_id: str, cart: str):
+        now = time.time()
+
+        def op(con):
+            con.execute(_TOUCH_SQL, (draft_id, now, now))
+            con.execute("DELETE FROM draft_lines WHERE draft_id = ? AND cart = ?", (draft_id, cart))
+
+        self._write(op)
+
+    def save_pending(self, draft_id: str, rows: List[dict]):
+        now = time.time()
+        payload = json.dumps(rows or [], ensure_ascii=False, default=str)
+
+        def op(con):
+            con.execute(_TOUCH_SQL, (draft_id, now, now))
+            con.execute("UPDATE drafts SET pending_json = ? WHERE draft_id = ?", (payload, draft_id))
+
+        self._write(op)
+
+    def delete_draft(self, draft_id: str):
+        def op(con):
+            con.execute("DELETE FROM draft_lines WHERE draft_id = ?", (draft_id,))
+            con.execute("DELETE FROM drafts WHERE draft_id = ?", (draft_id,))
+
+        self._write(op)
+
+    # -------- lectura --------
+
+    def list_drafts(self, ref_filter: str = "", limit: int = 50) -> pd.DataFrame:
+        """Borradores más recientes primero, con nº de líneas y unidades. Filtro por prefijo de ref_peticion."""
+        rows = self._conn().execute(
+            """
+            SELECT d.draft_id, d.ref_peticion, d.fecha, d.origen, d.destino, d.updated_at,
+                   COUNT(l.ean) AS lineas, COALESCE(SUM(l.qty), 0) AS uds
+            FROM drafts d LEFT JOIN draft_lines l ON l.draft_id = d.draft_id
+            WHERE d.ref_peticion LIKE ? || '%' ESCAPE '\\'
+            GROUP BY d.draft_id
+            ORDER BY d.updated_at DESC
+            LIMIT ?
+            """,
+            (escape_like(ref_filter or ""), int(limit)),
+        ).fetchall()
+        cols = ["draft_id", "ref_peticion", "fecha", "origen", "destino", "updated_at", "lineas", "uds"]
+        return pd.DataFrame(rows, columns=cols)
+
+    def load_draft(self, draft_id: str) -> Optional[dict]:
+        con = self._conn()
+        head = con.execute(
+            "SELECT ref_peticion, fecha, origen, destino, pending_json FROM drafts WHERE draft_id = ?",
+            (draft_id,),
+        ).fetchone()
+        if head is None:
+            return None
+        carts: Dict[str, Dict[str, dict]] = {c: {} for c in CART_NAMES}
+        for cart, ean, ref, nom, col, tal, qty in con.execute(
+            "SELECT cart, ean, ref, nom, col, tal, qty FROM draft_lines WHERE draft_id = ?", (draft_id,)
+        ):
+            carts.setdefault(cart, {})[ean] = {"EAN": ean, "Ref": ref, "Nom": nom, "Col": col, "Tal": tal,
+                                               "Cantidad": int(qty)}
+        ref_peticion, fecha, origen, destino, pending_json = head
+        return {
+            "draft_id": draft_id,
+            "ref_peticion": ref_peticion,
+            "fecha": date.fromisoformat(fecha) if fecha else None,
+            "origen": origen,
+            "destino": destino,
+            "pending_rows": json.loads(pending_json or "[]"),
+            "carts": carts,
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_draft_store() -> DraftStore:
+    return DraftStore(DEFAULT_DB_PATH)
+
@@ -0,0 +1,315 @@
+# history.py
+"""
+Histórico de traspasos exportados (SQLite, solo inserción).
+
+- Cada descarga en 4 · Exportar registra el traspaso y sus líneas. El id del traspaso es un hash
+  de todo lo que lleva el Excel (cabecera, observaciones/ref. de petición y líneas): descargar dos
+  veces el mismo Excel no duplica nada; con otra ref. de petición es otro traspaso.
+- Las líneas llevan fecha y destino desnormalizados, con índice (fecha, destino) e índice por ref
+  para las consultas directas.
+- Analítica: como la tabla solo crece, el proceso mantiene un DataFrame en memoria (categóricas)
+  y en cada consulta solo lee las filas con id mayor que la última cargada; un snapshot en disco
+  evita releerlo todo al reiniciar. Las agregaciones son groupbys vectorizados sobre ese DataFrame.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+import streamlit as st
+
+from drafts import escape_like
+
+DEFAULT_HISTORY_PATH = os.environ.get("PETICIONES_HISTORY_DB", "historico.sqlite3")
+LINE_CATEGORIES = ["destino", "origen", "ref", "col", "tal", "ean"]
+# Filas nuevas acumuladas antes de reescribir el snapshot del DataFrame
+SNAPSHOT_EVERY_ROWS = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    transfer_id  TEXT PRIMARY KEY,
+    exported_at  REAL NOT NULL,
+    fecha        TEXT NOT NULL,
+    origen       TEXT NOT NULL,
+    destino      TEXT NOT NULL,
+    ref_peticion TEXT NOT NULL DEFAULT '',
+    draft_id     TEXT,
+    n_lines      INTEGER NOT NULL,
+    units        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_transfers_fecha ON transfers(fecha);
+CREATE INDEX IF NOT EXISTS ix_transfers_destino ON transfers(destino, fecha);
+
+CREATE TABLE IF NOT EXISTS transfer_lines (
+    id          INTEGER PRIMARY KEY,
+    transfer_id TEXT NOT NULL,
+    fecha       TEXT NOT NULL,
+    origen      TEXT NOT NULL,
+    destino     TEXT NOT NULL,
+    ean         TEXT NOT NULL,
+    ref         TEXT NOT NULL DEFAULT '',
+    col         TEXT NOT NULL DEFAULT '',
+    tal         TEXT NOT NULL DEFAULT '',
+    qty         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_lines_fecha_destino ON transfer_lines(fecha, destino);
+CREATE INDEX IF NOT EXISTS ix_lines_ref ON transfer_lines(ref);
+CREATE INDEX IF NOT EXISTS ix_lines_transfer ON transfer_lines(transfer_id);
+"""
+
+_LINE_COLUMNS = ["id", "transfer_id", "fecha", "origen", "destino", "ean", "ref", "col", "tal", "qty"]
+
+
+def transfer_id(draft_id: str, fecha: Optional[date], origen: str, destino: str, obs: str,
+                lines: Dict[str, dict]) -> str:
+    h = hashlib.sha1(f"{draft_id}|{fecha}|{origen}|{destino}|{obs or ''}".encode())
+    for ean in sorted(lines):
+        h.update(f"|{ean}:{int(lines[ean].get('Cantidad', 0) or 0)}".encode())
+    return h.hexdigest()
+
+
+class HistoryStore:
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._frame_lock = threading.Lock()
+        self._frame: Optional[pd.DataFrame] = None
+        self._last_id = 0
+        self._unsaved = 0
+        with self._conn() as con:
+            con.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=5000")
+            self._local.con = con
+        return con
+
+    # -------- escritura --------
+
+    def record_transfer(self, draft_id: str, fecha: Optional[date], origen: str, destino: str, obs: str,
+                        lines: Dict[str, dict]) -> bool:
+        """Registra un traspaso exportado. Devuelve False si ya estaba (mismo contenido y misma ref.)."""
+        fecha = fecha or date.today()
+        rows = [
+            (str(ean), it.get("Ref", "") or "", it.get("Col", "") or "", it.get("Tal", "") or "",
+             int(it.get("Cantidad", 0) or 0))
+            for ean, it in lines.items()
+        ]
+        rows = [r for r in rows if r[4] > 0]
+        if not rows:
+            return False
+        tid = transfer_id(draft_id, fecha, origen, destino, obs, lines)
+        fecha_txt = fecha.isoformat()
+
+        con = self._conn()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            cur = con.execute(
+                """
+                INSERT OR IGNORE INTO transfers
+                    (transfer_id, exported_at, fecha, origen, destino, ref_peticion, draft_id, n_lines, units)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (tid, time.time(), fecha_txt, origen, destino, obs or "", draft_id, len(rows),
+                 sum(r[4] for r in rows)),
+            )
+            if cur.rowcount:
+                con.executemany(
+                    """
+                    INSERT INTO transfer_lines (transfer_id, fecha, origen, destino, ean, ref, col, tal, qty)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [(tid, fecha_txt, origen, destino, *r) for r in rows],
+                )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return bool(cur.rowcount)
+
+    # -------- lectura --------
+
+    def list_transfers(self, limit: int = 50) -> pd.DataFrame:
+        rows = self._conn().execute(
+            """
+            SELECT fecha, origen, destino, ref_peticion, n_lines, units, exported_at
+            FROM transfers ORDER BY exported_at DESC LIMIT ?
+            """,
+            (int(limit),),
+        ).fetchall()
+        return pd.DataFrame(rows, columns=["fecha", "origen", "destino", "ref_peticion", "lineas", "uds", "exported_at"])
+
+    def destinos(self) -> list:
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT destino FROM transfers ORDER BY destino")]
+
+    def find_transfers(self, destino: str = "", ref_peticion: str = "", date_from: Optional[date] = None,
+                       date_to: Optional[date] = None, limit: int = 100) -> pd.DataFrame:
+        """
+        Biblioteca de traspasos para repetir: filtra por destino, ref. de petición (contiene, sin
+        distinguir mayúsculas) y fechas; los más recientes primero.
+        """
+        sql = """
+            SELECT transfer_id, fecha, origen, destino, ref_peticion, n_lines, units
+            FROM transfers WHERE 1 = 1
+        """
+        params: list = []
+        if destino:
+            sql += " AND destino = ?"
+            params.append(destino)
+        if ref_peticion:
+            sql += " AND ref_peticion LIKE ? ESCAPE '\\'"
+            params.append(f"%{escape_like(ref_peticion)}%")
+        if date_from:
+            sql += " AND fecha >= ?"
+            params.append(date_from.isoformat())
+        if date_to:
+            sql += " AND fecha <= ?"
+            params.append(date_to.isoformat())
+        sql += " ORDER BY fecha DESC, exported_at DESC LIMIT ?"
+        params.append(int(limit))
+        rows = self._conn().execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=["transfer_id", "fecha", "origen", "destino", "ref_peticion", "lineas", "uds"])
+
+    def transfer_lines(self, transfer_id: str) -> pd.DataFrame:
+        """Líneas de un traspaso (EAN, ref/color/talla tal como se exportaron y cantidad), por el índice transfer_id."""
+        rows = self._conn().execute(
+            "SELECT ean, ref, col, tal, qty FROM transfer_lines WHERE transfer_id = ? ORDER BY id", (transfer_id,)
+        ).fetchall()
+        return pd.DataFrame(rows, columns=["EAN", "Ref", "Col", "Tal", "qty"])
+
+    def query_lines(self, date_from: date, date_to: date, destinos: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Líneas en un rango de fechas (y destinos), por el índice (fecha, destino). Para detalle/descarga."""
+        sql = "SELECT * FROM transfer_lines WHERE fecha BETWEEN ? AND ?"
+        params: list = [date_from.isoformat(), date_to.isoformat()]
+        destinos = list(destinos or [])
+        if destinos:
+            sql += f" AND destino IN ({','.join('?' * len(destinos))})"
+            params += destinos
+        return pd.DataFrame(self._conn().execute(sql, params).fetchall(), columns=_LINE_COLUMNS)
+
+    def frame(self) -> pd.DataFrame:
+        """Todas las líneas en memoria, al día: solo se leen las filas nuevas desde la última llamada."""
+        with self._frame_lock:
+            if self._frame is None:
+                self._load_snapshot()
+            rows = self._conn().execute(
+                "SELECT id, fecha, origen, destino, ean, ref, col, tal, qty FROM transfer_lines WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+            if rows or self._frame is None:
+                new = _encode_lines(pd.DataFrame(rows, columns=[c for c in _LINE_COLUMNS if c != "transfer_id"]))
+                self._frame = new if self._frame is None else _append_lines(self._frame, new)
+                if rows:
+                    self._last_id = rows[-1][0]
+                    self._unsaved += len(rows)
+                if self._unsaved >= SNAPSHOT_EVERY_ROWS:
+                    self._save_snapshot()
+            return self._frame
+
+    # Leer millones de filas de SQLite cuesta segundos: el DataFrame se guarda como snapshot
+    # (pickle local) y al arrancar solo se leen de SQLite las filas posteriores.
+
+    @property
+    def snapshot_path(self) -> str:
+        return self.path + ".frame.pkl"
+
+    def _load_snapshot(self):
+        try:
+            df = pd.read_pickle(self.snapshot_path)
+            last_id = int(df.attrs["last_id"])
+        except Exception:
+            return
+        max_id = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM transfer_lines").fetchone()[0]
+        if last_id > max_id:
+            return  # la base de datos no es la del snapshot
+        self._frame, self._last_id = df, last_id
+
+    def _save_snapshot(self):
+        df = self._frame
+        df.attrs["last_id"] = self._last_id
+        tmp = self.snapshot_path + ".tmp"
+        try:
+            df.to_pickle(tmp)
+            os.replace(tmp, self.snapshot_path)
+            self._unsaved = 0
+        except OSError:
+            pass
+
+
+def _encode_lines(df: pd.DataFrame) -> pd.DataFrame:
+    df["fecha"] = pd.to_datetime(df["fecha"])
+    # Lunes de la semana, precalculado para las vistas semanales
+    df["semana"] = df["fecha"] - pd.to_timedelta(df["fecha"].dt.dayofweek, unit="D")
+    df["qty"] = df["qty"].astype("int32")
+    for c in LINE_CATEGORIES:
+        df[c] = df[c].astype("category")
+    return df.set_index("id")
+
+
+def _append_lines(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Concatena manteniendo las categóricas: se amplían las categorías de `old` con las nuevas
+    (concat de categóricas con categorías distintas pasaría a object). No muta `old`.
+    """
+    if new.empty:
+        return old
+    old = old.copy(deep=False)
+    new = new.copy(deep=False)
+    for c in LINE_CATEGORIES:
+        missing = new[c].cat.categories.difference(old[c].cat.categories)
+        if len(missing):
+            old[c] = old[c].cat.add_categories(missing)
+        new[c] = new[c].cat.set_categories(old[c].cat.categories)
+    return pd.concat([old, new])
+
+
+# -----------------------------
+# Agregaciones (sobre HistoryStore.frame())
+# -----------------------------
+def filter_lines(df: pd.DataFrame, date_from: date, date_to: date, destinos: Optional[Iterable[str]] = None):
+    mask = (df["fecha"] >= pd.Timestamp(date_from)) & (df["fecha"] <= pd.Timestamp(date_to))
+    destinos = list(destinos or [])
+    if destinos:
+        mask &= df["destino"].isin(destinos)
+    return df[mask]
+
+
+def units_by_week(df: pd.DataFrame) -> pd.DataFrame:
+    """Unidades por semana (lunes) y destino; una columna por destino."""
+    out = df.groupby(["semana", "destino"], observed=True)["qty"].sum().unstack("destino", fill_value=0)
+    out.index.name = "semana"
+    return out
+
+
+def top_refs(df: pd.DataFrame, n: int = 20) -> pd.DataFrame:
+    """Referencias más pedidas: unidades, líneas y nº de destinos."""
+    g = df.groupby("ref", observed=True)
+    out = pd.DataFrame({
+        "uds": g["qty"].sum(),
+        "lineas": g.size(),
+        "destinos": g["destino"].nunique(),
+    })
+    return out.nlargest(n, "uds").reset_index()
+
+
+def units_by_destino(df: pd.DataFrame) -> pd.DataFrame:
+    g = df.groupby("destino", observed=True)
+    return pd.DataFrame({"uds": g["qty"].sum(), "lineas": g.size(), "refs": g["ref"].nunique()}).sort_values(
+        "uds", ascending=False
+    ).reset_index()
+
+
+@st.cache_resource(show_spinner=False)
+def get_history_store() -> HistoryStore:
+    return HistoryStore(DEFAULT_HISTORY_PATH)
@@ -0,0 +1,363 @@
+# jobs.py
+"""
+Trabajos pesados en segundo plano (importaciones), fuera del hilo del script de Streamlit.
+
+Dos piezas:
+- JobManager: hilos que orquestan un trabajo de una sesión (progreso, cancelación, resultado).
+- Scheduler: pool de procesos compartido por todas las sesiones donde corre el cálculo pesado
+  (leer Excel, matching, generar el Excel de traspaso), fuera del GIL del servidor. Cola con
+  prioridades (interactivo > importación > lotes), tope de cola (backpressure) y estadísticas.
+
+Trabajos:
+- Cada sesión guarda solo el id del trabajo; el estado vive en el JobManager del proceso.
+- La página consulta el progreso con un fragmento que se refresca solo.
+- Cancelación cooperativa: el trabajo comprueba `job.check_cancelled()` entre etapas/bloques;
+  una etapa en curso (p.ej. leer el Excel) termina antes de que se note la cancelación.
+- El resultado no toca session_state (otro hilo): la sesión lo recoge en su siguiente rerun.
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+import streamlit as st
+
+JOB_WORKERS = int(os.environ.get("PETICIONES_JOB_WORKERS", "4"))
+# Procesos del pool compartido; 0 = ejecutar en el hilo que llama (depuración)
+POOL_WORKERS = int(os.environ.get("PETICIONES_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Tareas no interactivas admitidas en cola por proceso del pool antes de rechazar/esperar
+QUEUE_PER_WORKER = 4
+
+PRIORITY_INTERACTIVE, PRIORITY_IMPORT, PRIORITY_BULK = 0, 1, 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactiva", PRIORITY_IMPORT: "importación", PRIORITY_BULK: "lote"}
+# Trabajos terminados que nadie recoge se olvidan pasado este tiempo
+JOB_TTL_SECONDS = 3600
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = "queued", "running", "done", "error", "cancelled"
+FINISHED = (DONE, ERROR, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = QUEUED
+    progress: float = 0.0
+    message: str = "En cola…"
+    result: Any = None
+    error: Optional[str] = None
+    traceback: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def report(self, progress: float, message: str = ""):
+        """Llamado desde el trabajo: progreso 0..1 y texto de la etapa. También es punto de cancelación."""
+        self.check_cancelled()
+        self.progress = max(0.0, min(1.0, float(progress)))
+        if message:
+            self.message = message
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def wait(self, fut: Future, poll: float = 0.2):
+        """Espera una tarea del Scheduler atendiendo la cancelación del trabajo mientras tanto."""
+        while True:
+            try:
+                return fut.result(timeout=poll)
+            except FutureTimeout:
+                if self._cancel.is_set():
+                    fut.cancel()
+                    raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.status == QUEUED:
+            self.message = "Cancelando…"
+
+
+class JobManager:
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """Lanza fn(job, *args, **kwargs) en el pool y devuelve el Job (su id va a session_state)."""
+        job = Job(id=uuid.uuid4().hex, kind=kind)
+        with self._lock:
+            self._gc()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.started_at = time.time()
+        try:
+            job.check_cancelled()
+            job.status = RUNNING
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+            job.message = "Cancelado."
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.traceback = traceback.format_exc()
+            job.status = ERROR
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _gc(self):
+        now = time.time()
+        for jid in [j.id for j in self._jobs.values() if j.finished and now - (j.finished_at or now) > JOB_TTL_SECONDS]:
+            self._jobs.pop(jid, None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_manager() -> JobManager:
+    return JobManager()
+
+
+# -----------------------------
+# Pool de procesos compartido
+# -----------------------------
+class SchedulerBusy(Exception):
+    """La cola del pool está llena: el llamante debe reintentar más tarde."""
+
+
+@dataclass
+class _Task:
+    priority: int
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    future: Future
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class Scheduler:
+    """
+    Cola con prioridad delante de un ProcessPoolExecutor. El despachador solo entrega al pool
+    tantas tareas como procesos hay, así la prioridad decide qué entra cuando se libera uno
+    (el pool por sí solo sería FIFO). Las funciones y argumentos deben ser picklables.
+    """
+
+    def __init__(self, workers: int = POOL_WORKERS, queue_per_worker: int = QUEUE_PER_WORKER):
+        self.workers = max(0, int(workers))
+        self.max_queued = max(1, self.workers) * queue_per_worker
+        # spawn: el servidor tiene hilos vivos y fork con hilos no es seguro
+        self._pool = (
+            ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.workers else None
+        )
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._slots = threading.Semaphore(max(1, self.workers))
+        self._room = threading.Condition()
+        self._lock = threading.Lock()
+        self._queued = {p: 0 for p in PRIORITY_NAMES}
+        self._stats = {p: {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                           "wait": deque(maxlen=500), "run": deque(maxlen=500)} for p in PRIORITY_NAMES}
+        self.in_flight = 0
+        if self._pool is not None:
+            threading.Thread(target=self._dispatch, name="scheduler", daemon=True).start()
+
+    # -------- envío --------
+
+    def queued(self, priority: Optional[int] = None) -> int:
+        with self._lock:
+            return self._queued[priority] if priority is not None else sum(self._queued.values())
+
+    def busy(self) -> bool:
+        """True si una tarea no interactiva sería rechazada ahora mismo."""
+        return self.queued() >= self.max_queued
+
+    def submit(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_IMPORT, block: bool = False,
+               admitted: bool = False, **kwargs) -> Future:
+        """
+        Encola fn(*args, **kwargs). Las tareas interactivas se admiten siempre; el resto, con la
+        cola llena, lanza SchedulerBusy (o espera hueco si block=True). admitted=True: la tarea es
+        parte de un lote ya admitido (as_executor) y no vuelve a pasar por el límite de cola.
+        """
+        stats = self._stats[priority]
+        if self._pool is None:
+            return self._run_inline(fn, args, kwargs, stats)
+
+        with self._room:
+            while priority != PRIORITY_INTERACTIVE and not admitted and self.busy():
+                if not block:
+                    with self._lock:
+                        stats["rejected"] += 1
+                    raise SchedulerBusy(f"Cola llena ({self.max_queued} tareas en espera)")
+                self._room.wait(0.5)
+            task = _Task(priority, fn, args, kwargs, Future())
+            with self._lock:
+                self._queued[priority] += 1
+                stats["submitted"] += 1
+            self._queue.put((priority, next(self._seq), task))
+        return task.future
+
+    def run(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """submit + result: para llamadas desde el hilo del script que esperan el resultado."""
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    def warm_up(self):
+        """Arranca todos los procesos del pool en segundo plano."""
+        for _ in range(self.workers):
+            self.submit(_warm_worker, priority=PRIORITY_INTERACTIVE)
+
+    def as_executor(self, priority: int, block: bool = True) -> "_PriorityExecutor":
+        """
+        Adaptador con la interfaz submit(fn, *args) de concurrent.futures (p.ej. build_transfer_zip).
+        Las tareas que recibe son un lote: la admisión se decide en la primera y el resto entra
+        detrás aunque supere max_queued (un zip con más destinos que huecos no se rechaza nunca).
+        """
+        return _PriorityExecutor(self, priority, block)
+
+    def _run_inline(self, fn, args, kwargs, stats) -> Future:
+        fut: Future = Future()
+        t0 = time.time()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+            ok = True
+        except Exception as e:
+            fut.set_exception(e)
+            ok = False
+        with self._lock:
+            stats["submitted"] += 1
+            stats["completed" if ok else "failed"] += 1
+            stats["wait"].append(0.0)
+            stats["run"].append(time.time() - t0)
+        return fut
+
+    # -------- despacho --------
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            _, _, task = self._queue.get()
+            with self._lock:
+                self._queued[task.priority] -= 1
+            with self._room:
+                self._room.notify_all()
+            if not task.future.set_running_or_notify_cancel():
+                self._slots.release()
+                continue
+            started = time.time()
+            with self._lock:
+                self._stats[task.priority]["wait"].append(started - task.enqueued_at)
+                self.in_flight += 1
+            try:
+                inner = self._pool.submit(task.fn, *task.args, **task.kwargs)
+            except Exception as e:
+                self._finish(task, started, None, e)
+                continue
+            inner.add_done_callback(lambda f, task=task, started=started: self._finish(task, started, f, None))
+
+    def _finish(self, task: _Task, started: float, inner: Optional[Future], error: Optional[BaseException]):
+        if inner is not None:
+            error = inner.exception()
+        stats = self._stats[task.priority]
+        with self._lock:
+            self.in_flight -= 1
+            stats["run"].append(time.time() - started)
+            stats["failed" if error is not None else "completed"] += 1
+        self._slots.release()
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(inner.result())
+
+    # -------- estadísticas --------
+
+    def stats(self) -> pd.DataFrame:
+        """Una fila por prioridad: en cola, enviadas, completadas, fallidas, rechazadas, espera y ejecución."""
+        rows = []
+        with self._lock:
+            snap = {p: (self._queued[p], dict(s), list(s["wait"]), list(s["run"])) for p, s in self._stats.items()}
+        for p, (queued, s, wait, run) in snap.items():
+            w = pd.Series(wait, dtype=float) * 1000
+            r = pd.Series(run, dtype=float) * 1000
+            rows.append({
+                "Prioridad": PRIORITY_NAMES[p],
+                "En cola": queued,
+                "Enviadas": s["submitted"],
+                "Completadas": s["completed"],
+                "Fallidas": s["failed"],
+                "Rechazadas": s["rejected"],
+                "espera p50 ms": round(w.quantile(0.5), 1) if len(w) else None,
+                "espera p95 ms": round(w.quantile(0.95), 1) if len(w) else None,
+                "ejecución p50 ms": round(r.quantile(0.5), 1) if len(r) else None,
+            })
+        return pd.DataFrame(rows)
+
+
+def _warm_worker():
+    """Importa en el proceso hijo lo que usan las tareas (la primera tarea real no paga el arranque)."""
+    import utils  # noqa: F401
+
+    return os.getpid()
+
+
+class _PriorityExecutor:
+    def __init__(self, scheduler: Scheduler, priority: int, block: bool):
+        self._scheduler = scheduler
+        self._priority = priority
+        self._block = block
+        self._admitted = False
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        fut = self._scheduler.submit(fn, *args, priority=self._priority, block=self._block,
+                                     admitted=self._admitted, **kwargs)
+        self._admitted = True
+        return fut
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler() -> Scheduler:
+    scheduler = Scheduler()
+    scheduler.warm_up()
+    return scheduler
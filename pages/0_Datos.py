@@ -1,25 +1,58 @@
 # pages/0_Datos.py
+from datetime import datetime
+
 import streamlit as st
 from utils import init_state, ensure_style, load_repo_data
+from catalog_store import get_catalog_store
 
 st.set_page_config(page_title="Datos", page_icon="🗂️", layout="wide")
 ensure_style()
 init_state()
-load_repo_data()
 
 st.markdown("# 0 · Estado de datos")
 st.markdown("<div class='small'>Aquí solo validamos que el repositorio tenga los ficheros base.</div>", unsafe_allow_html=True)
 
-ok_cat = st.session_state.get("cat_loaded")
-ok_tpl = st.session_state.get("tpl_bytes") is not None
+# Solo estado: no se espera a la precarga ni se fuerza ningún derivado
+v = load_repo_data()
+store = get_catalog_store()
 
 c1, c2 = st.columns(2)
-with c1:
-    st.markdown("### Catálogo")
-    st.write("✅ Cargado desde repo (`catalogue.xlsx`)" if ok_cat else "❌ No encontrado / formato incorrecto (`catalogue.xlsx`)")
-with c2:
-    st.markdown("### Plantilla")
-    st.write("✅ Encontrada (`plantilla_pedido.xlsx`)" if ok_tpl else "⚠️ No encontrada (`plantilla_pedido.xlsx`) — no podrás exportar")
+if v is None:
+    with c1:
+        st.markdown("### Catálogo")
+        st.write("⏳ Cargando en segundo plano (`catalogue.xlsx`)…")
+    with c2:
+        st.markdown("### Plantilla")
+        st.write("⏳ Pendiente")
+else:
+    with c1:
+        st.markdown("### Catálogo")
+        st.write("✅ Cargado desde repo (`catalogue.xlsx`)" if v.cat_loaded else "❌ No encontrado / formato incorrecto (`catalogue.xlsx`)")
+    with c2:
+        st.markdown("### Plantilla")
+        st.write("✅ Encontrada (`plantilla_pedido.xlsx`)" if v.has_template else "⚠️ No encontrada (`plantilla_pedido.xlsx`) — no podrás exportar")
+
+if v is not None:
+    st.caption(
+        f"Versión de datos publicada: **{v.version}** · "
+        f"construida {datetime.fromtimestamp(v.built_at):%Y-%m-%d %H:%M:%S} · "
+        + ("desde el bundle de arranque · " if v.source == "bundle" else "")
+        + f"se revisan cambios cada {store.poll_seconds:g} s"
+    )
+if store.changelogs:
+    with st.expander("Cambios de catálogo recientes", expanded=False):
+        for ch in store.changelogs:
+            st.markdown(
+                f"**Versión {ch['version']}** · {datetime.fromtimestamp(ch['at']):%Y-%m-%d %H:%M} · "
+                f"{ch['added']} altas · {ch['removed']} bajas · {ch['changed']} cambios · "
+                f"{len(ch['refs'])} referencias afectadas"
+                + ("" if ch["incremental"] else " · reconstrucción completa")
+            )
+            st.dataframe(ch["detail"], use_container_width=True, hide_index=True)
+if store.bundle_error:
+    st.caption(f"⚠️ El bundle de arranque no se pudo leer; se cargó el catálogo desde el xlsx: {store.bundle_error}")
+if store.last_error:
+    st.warning(f"Último intento de recarga fallido (se mantiene la versión anterior): {store.last_error}")
 
 st.markdown("<hr/>", unsafe_allow_html=True)
 st.info("El fichero de **ventas/reposición** se sube en la página **1 · Importar** (es opcional).")
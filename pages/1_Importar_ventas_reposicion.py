@@ -5,10 +5,27 @@ from utils import (
     init_state,
     ensure_style,
     load_repo_data,
-    read_petition_excel,
-    build_catalog_indexes,
-    match_petition_to_catalog,
-    add_to_cart,
+    catalog_loaded,
+    get_catalog_df,
+    get_match_indexes,
+    run_petition_import,
+    DEST_CART_PREFIX,
+    IMPORT_POLL_SECONDS,
+    persist_cart_clear,
+    persist_pending,
+    pending_frame,
+    apply_suggestion,
+)
+from jobs import get_job_manager, get_scheduler
+from perf import timed
+from stock import on_stock_upload
+from suggest import (
+    DEFAULT_COVER_DAYS,
+    DEFAULT_WINDOW_DAYS,
+    default_as_of,
+    load_sales_file,
+    suggest_replenishment,
+    summarize_by_ref,
 )
 
 st.set_page_config(page_title="Importar ventas/reposición", page_icon="📤", layout="wide")
@@ -25,16 +42,12 @@ st.markdown(
 
 # Estado mínimo
 st.session_state.setdefault("carrito_import", {})
-st.session_state.setdefault("pending_rows", [])
 st.session_state.setdefault("last_import_stats", None)
 
-if not st.session_state.get("cat_loaded"):
+if not catalog_loaded():
     st.error("No se encontró `catalogue.xlsx` en la raíz del repositorio.")
     st.stop()
 
-cat = st.session_state.catalog_df
-idx_exact, idx_ref_color, idx_ref_talla, idx_ref = build_catalog_indexes(cat)
-
 c1, c2 = st.columns([2.2, 1.0])
 
 with c1:
@@ -57,17 +70,28 @@ with c2:
     a, b = st.columns(2)
     with a:
         if st.button("Vaciar carrito importado", use_container_width=True):
+            for dest in st.session_state.carritos_destino:
+                persist_cart_clear(f"{DEST_CART_PREFIX}{dest}")
+            st.session_state.carritos_destino = {}
             st.session_state.carrito_import = {}
-            st.session_state.pending_rows = []
+            st.session_state.pending_rows = pending_frame()
             st.session_state.last_import_stats = None
+            persist_cart_clear("carrito_import")
+            persist_pending()
     with b:
         if st.button("Vaciar pendientes", use_container_width=True):
-            st.session_state.pending_rows = []
+            st.session_state.pending_rows = pending_frame()
+            persist_pending()
+
+jobs = get_job_manager()
+# Crear el pool al abrir la página: sus procesos arrancan mientras se elige el fichero
+pool = get_scheduler()
+running = jobs.get(st.session_state.import_job)
 
 if petition_file is None:
     st.info("No has subido fichero. Este paso es opcional — puedes continuar a **2 · Selección manual**.")
 else:
-    if st.button("Procesar importación", type="primary"):
+    if st.button("Procesar importación", type="primary", disabled=running is not None):
         try:
             raw = petition_file.getvalue()
         except Exception:
@@ -80,33 +104,37 @@ else:
             )
             st.stop()
 
-        # Leer excel
-        try:
-            pet_df = read_petition_excel(raw)
-        except Exception as e:
-            st.error("Error leyendo el Excel con `read_petition_excel()`.")
-            st.exception(e)
+        if pool.busy():
+            st.warning("Hay muchas importaciones/exportaciones en curso. Vuelve a intentarlo en unos segundos.")
             st.stop()
 
-        if pet_df is None or len(pet_df) == 0:
-            st.error("El Excel se ha leído pero no se obtienen filas útiles (posible tabla dinámica/cabecera rara).")
-            st.caption(f"Columnas detectadas: {list(getattr(pet_df, 'columns', []))}")
-            st.stop()
+        # Lectura + matching en segundo plano: la sesión sigue respondiendo mientras tanto
+        running = jobs.submit("import", run_petition_import, raw, get_match_indexes())
+        st.session_state.import_job = running.id
+        st.session_state.import_notice = None
 
-        matched, pending = match_petition_to_catalog(pet_df, idx_exact, idx_ref_color, idx_ref_talla, idx_ref)
 
-        added_lines = 0
-        for m in matched:
-            add_to_cart(st.session_state.carrito_import, m, int(m["Cantidad"]))
-            added_lines += 1
+@st.fragment(run_every=IMPORT_POLL_SECONDS)
+def import_job_panel():
+    job = jobs.get(st.session_state.import_job)
+    if job is None or job.finished:
+        # Rerun completo: init_state -> collect_import_job aplica el resultado
+        st.rerun()
+    st.progress(job.progress, text=job.message)
+    if st.button("Cancelar importación"):
+        job.cancel()
 
-        st.session_state.pending_rows = pending
-        st.session_state.last_import_stats = {
-            "matched_lines": len(matched),
-            "pending_lines": len(pending),
-            "added_lines": added_lines,
-        }
-        st.success("Importación aplicada.")
+
+if running is not None:
+    import_job_panel()
+
+notice = st.session_state.get("import_notice")
+if notice:
+    kind, text, trace = notice
+    getattr(st, kind)(text)
+    if trace:
+        with st.expander("Detalle del error", expanded=False):
+            st.code(trace, language="text")
 
 if st.session_state.get("last_import_stats"):
     s = st.session_state.last_import_stats
@@ -114,10 +142,135 @@ if st.session_state.get("last_import_stats"):
     m1.metric("Líneas matcheadas", s["matched_lines"])
     m2.metric("Pendientes", s["pending_lines"])
     m3.metric("Líneas añadidas", s["added_lines"])
+    if s.get("carried_lines"):
+        st.info(
+            f"Las {s['carried_lines']} líneas que ya había en el carrito importado se han pasado al "
+            f"carrito del destino {s['carried_to']}."
+        )
+
+# -----------------------------
+# Sugerencia de reposición a partir de ventas -> carrito importado
+# -----------------------------
+def on_sales_upload():
+    up = st.session_state.get("u_sales")
+    st.session_state.suggestion = None
+    if up is None:
+        st.session_state.sales_df = None
+        st.session_state.sales_error = None
+        return
+    try:
+        st.session_state.sales_df = load_sales_file(up.getvalue(), up.name)
+        st.session_state.sales_error = None
+    except Exception as e:
+        st.session_state.sales_df = None
+        st.session_state.sales_error = f"{type(e).__name__}: {e}"
+
+
+with st.expander("Sugerir cantidades a partir de ventas", expanded=st.session_state.sales_df is not None):
+    st.markdown(
+        "<div class='small'>Calcula la reposición de <b>cada EAN vendido</b> en el destino: "
+        "venta diaria × días de cobertura, menos el stock del destino y sin pasar del stock del origen "
+        "(si hay snapshot de stock).</div>",
+        unsafe_allow_html=True,
+    )
+    u1, u2 = st.columns(2)
+    with u1:
+        st.file_uploader(
+            "Histórico de ventas (xlsx/CSV: fecha, almacén, EAN, unidades)",
+            type=["xlsx", "csv"],
+            key="u_sales",
+            on_change=on_sales_upload,
+        )
+    with u2:
+        st.file_uploader(
+            "Snapshot de stock (opcional; xlsx/CSV: almacén, EAN, stock)",
+            type=["xlsx", "csv"],
+            key="u_suggest_stock",
+            on_change=on_stock_upload,
+            args=("u_suggest_stock",),
+        )
+    if st.session_state.get("sales_error"):
+        st.error(f"No se pudo leer el fichero de ventas: {st.session_state.sales_error}")
+    if st.session_state.get("stock_error"):
+        st.error(f"No se pudo leer el fichero de stock: {st.session_state.stock_error}")
+
+    sales = st.session_state.sales_df
+    snapshot = st.session_state.stock_snapshot
+    if sales is not None:
+        st.caption(
+            f"{len(sales)} filas de ventas · {sales['fecha'].min():%d/%m/%Y} – {sales['fecha'].max():%d/%m/%Y} · "
+            f"{sales['almacen'].nunique()} almacenes"
+            + (f" · stock: {snapshot.name}" if snapshot is not None else " · sin snapshot de stock")
+        )
+        p1, p2, p3 = st.columns(3)
+        with p1:
+            cover = st.number_input("Días de cobertura", min_value=1, max_value=180, value=DEFAULT_COVER_DAYS)
+        with p2:
+            window = st.number_input("Ventana de ventas (días)", min_value=1, max_value=365, value=DEFAULT_WINDOW_DAYS)
+        with p3:
+            as_of = st.date_input("Hasta", value=default_as_of(sales))
+
+        if st.button(f"Calcular sugerencia para {st.session_state.destino}", use_container_width=True):
+            with timed("suggest"):
+                lines, missing = suggest_replenishment(
+                    sales,
+                    get_catalog_df(),
+                    st.session_state.destino,
+                    origen=st.session_state.origen,
+                    cover_days=cover,
+                    window_days=window,
+                    snapshot=snapshot,
+                    as_of=as_of,
+                )
+            st.session_state.suggestion = {"destino": st.session_state.destino, "lines": lines, "missing": missing}
+
+    sug = st.session_state.get("suggestion")
+    if sug is not None:
+        lines = sug["lines"]
+        if lines.empty:
+            st.info(f"Nada que reponer en {sug['destino']} con esos parámetros.")
+        else:
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Referencias", lines["Referencia"].nunique())
+            m2.metric("EAN", len(lines))
+            m3.metric("Unidades", int(lines["Cantidad"].sum()))
+            st.dataframe(summarize_by_ref(lines), use_container_width=True, hide_index=True)
+            with st.expander("Detalle por EAN", expanded=False):
+                st.dataframe(lines, use_container_width=True, hide_index=True)
+            if st.button(
+                f"Cargar como carrito importado ({sug['destino']})",
+                type="primary",
+                use_container_width=True,
+                disabled=sug["destino"] != st.session_state.destino,
+            ):
+                apply_suggestion(lines)
+                st.session_state.suggestion = None
+                st.session_state.import_notice = (
+                    "success", f"Sugerencia cargada: {len(lines)} líneas en el carrito importado.", None
+                )
+                st.rerun()
+        if len(sug["missing"]):
+            st.warning(f"{len(sug['missing'])} EAN vendidos no están en el catálogo y se han omitido.")
+
+if st.session_state.get("carritos_destino"):
+    st.markdown("### Carritos por destino")
+    st.caption(
+        f"Destino activo: **{st.session_state.destino}** (cámbialo en 0 · Datos del pedido para revisar otro)."
+    )
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {"Destino": d, "Líneas": len(c), "Unidades": sum(int(v["Cantidad"]) for v in c.values())}
+                for d, c in st.session_state.carritos_destino.items()
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
 
-if st.session_state.get("pending_rows"):
+if len(st.session_state.pending_rows):
     st.markdown("### Pendientes")
-    st.dataframe(pd.DataFrame(st.session_state.pending_rows), use_container_width=True, hide_index=True)
+    st.dataframe(st.session_state.pending_rows, use_container_width=True, hide_index=True)
 
 st.markdown("<hr/>", unsafe_allow_html=True)
 st.page_link("pages/2_Seleccion_manual.py", label="Continuar a 2 · Selección manual →", use_container_width=True)
@@ -1,17 +1,48 @@
 # pages/2_Seleccion_manual.py
 import re
+from datetime import date, timedelta
+
 import streamlit as st
 import pandas as pd
-from utils import init_state, ensure_style, load_repo_data, add_to_cart
+from utils import (
+    init_state,
+    ensure_style,
+    load_repo_data,
+    catalog_loaded,
+    get_catalog_df,
+    get_ean_index,
+    get_search_blob,
+    add_to_cart,
+    parse_scan_codes,
+    apply_scanned_eans,
+    parse_bulk_lines,
+    resolve_bulk_lines,
+    add_lines_to_cart,
+    get_ref_grid,
+    persist_cart_lines,
+    persist_cart_clear,
+    cart_frame,
+    filter_cart_df,
+    paginate,
+    render_pager,
+    render_cart_view_mode,
+    reorder_transfer,
+    ref_grid_frame,
+    apply_grid_edits,
+    COMPACT_PAGE_SIZES,
+)
+from history import get_history_store
+from perf import timed
 
 st.set_page_config(page_title="Selección manual", page_icon="🔎", layout="wide")
 ensure_style()
 init_state()
 load_repo_data()
 
-# CSS: JOOR-ish (limpio, tabular, jerarquía visual)
-st.markdown(
-    """
+# CSS: JOOR-ish (limpio, tabular, jerarquía visual); en modo ligero no se envía
+if not st.session_state.light_mode:
+    st.markdown(
+        """
 <style>
 /* Tipografía / jerarquía */
 .joor-kicker { font-size: 12px; opacity: .75; letter-spacing: .06em; text-transform: uppercase; }
@@ -81,8 +112,8 @@ st.markdown(
 }
 </style>
 """,
-    unsafe_allow_html=True,
-)
+        unsafe_allow_html=True,
+    )
 
 st.markdown("# 2 · Selección manual")
 st.markdown(
@@ -91,11 +122,124 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-if not st.session_state.get("cat_loaded"):
+if not catalog_loaded():
     st.error("No se encontró `catalogue.xlsx` en la raíz del repositorio.")
     st.stop()
 
-cat = st.session_state.catalog_df
+cat = get_catalog_df()
+ean_index = get_ean_index()
+
+# -----------------------------
+# Modo escáner: ráfaga de EANs -> carrito manual (un solo rerun por lote)
+# -----------------------------
+if st.toggle("Modo escáner (EAN)", key="scan_mode", help="Para lector de códigos de barras: cada lectura es una línea."):
+    with st.form("scan_form", clear_on_submit=True):
+        scan_txt = st.text_area(
+            "Códigos escaneados (uno por línea)",
+            height=140,
+            placeholder="8445790046890\n8445790005491\n…",
+        )
+        scan_submit = st.form_submit_button("Añadir escaneados al carrito", type="primary", use_container_width=True)
+
+    if scan_submit:
+        codes = parse_scan_codes(scan_txt)
+        added, unknown = apply_scanned_eans(st.session_state.carrito_manual, codes, ean_index)
+        persist_cart_lines("carrito_manual", set(codes) - set(unknown))
+        st.session_state.scan_last = {"codes": len(codes), "added": added, "unknown": unknown}
+
+    last = st.session_state.get("scan_last")
+    if last:
+        st.success(f"Último lote: {last['codes']} lecturas · {last['added']} uds añadidas al carrito manual.")
+        if last["unknown"]:
+            st.warning("EAN no encontrados en catálogo: " + ", ".join(last["unknown"]))
+
+# -----------------------------
+# Pegar lista: EAN;cant o Ref;Color;Talla;cant -> carrito manual en un lote
+# -----------------------------
+with st.expander("Pegar lista (EAN;cantidad o Ref;Color;Talla;cantidad)", expanded=False):
+    with st.form("bulk_form", clear_on_submit=True):
+        bulk_txt = st.text_area(
+            "Una línea por artículo",
+            height=180,
+            placeholder="8445790046890;3\n8445790005491;1\n214803;Blanco;L;2",
+        )
+        bulk_submit = st.form_submit_button("Añadir lista al carrito", use_container_width=True)
+
+    if bulk_submit:
+        lines = parse_bulk_lines(bulk_txt)
+        resolved, errors = resolve_bulk_lines(lines, cat, ean_index)
+        n_eans = add_lines_to_cart(st.session_state.carrito_manual, resolved)
+        persist_cart_lines("carrito_manual", resolved["EAN"].unique())
+        st.session_state.bulk_last = {
+            "lines": len(lines),
+            "ok": len(resolved),
+            "eans": n_eans,
+            "units": int(resolved["Cantidad"].sum()) if len(resolved) else 0,
+            "errors": errors,
+        }
+
+    last = st.session_state.get("bulk_last")
+    if last:
+        st.success(
+            f"{last['ok']} de {last['lines']} líneas añadidas · {last['eans']} EAN · {last['units']} uds."
+        )
+        if len(last["errors"]):
+            st.warning(f"{len(last['errors'])} líneas con error:")
+            st.dataframe(last["errors"], use_container_width=True, hide_index=True)
+
+# -----------------------------
+# Repetir un traspaso anterior (histórico) -> carrito manual
+# -----------------------------
+with st.expander("Repetir un traspaso anterior", expanded=False):
+    # El cuerpo del expander se ejecuta aunque esté cerrado: el histórico solo se consulta
+    # cuando el usuario activa la búsqueda, no en cada +/−, escaneo o edición del grid
+    if st.toggle("Buscar en el histórico", key="reorder_open"):
+        history = get_history_store()
+        ALL_DEST = "Todos los destinos"
+        dest_opts = [ALL_DEST] + history.destinos()
+        dest_idx = dest_opts.index(st.session_state.destino) if st.session_state.destino in dest_opts else 0
+        f1, f2, f3 = st.columns([1.2, 1, 0.8])
+        with f1:
+            re_dest = st.selectbox("Destino", dest_opts, index=dest_idx, key="reorder_dest")
+        with f2:
+            re_ref = st.text_input("Ref. petición contiene", key="reorder_ref")
+        with f3:
+            re_from = st.date_input("Desde", value=date.today() - timedelta(days=90), key="reorder_from")
+
+        transfers = history.find_transfers(
+            destino="" if re_dest == ALL_DEST else re_dest, ref_peticion=re_ref.strip(), date_from=re_from
+        )
+        if transfers.empty:
+            st.info("No hay traspasos exportados con esos filtros.")
+        else:
+            labels = [
+                f"{t.fecha} · {t.destino} · {t.ref_peticion or 'sin ref.'} · {t.lineas} líneas · {t.uds} uds · #{t.transfer_id[:6]}"
+                for t in transfers.itertuples()
+            ]
+            g1, g2 = st.columns([3, 1])
+            with g1:
+                pick = labels.index(st.selectbox("Traspaso", labels, key="reorder_pick"))
+            with g2:
+                factor = st.number_input(
+                    "Factor", min_value=0.1, max_value=10.0, value=1.0, step=0.1, key="reorder_factor",
+                    help="Multiplica las cantidades (redondeo, mínimo 1 ud).",
+                )
+            st.button(
+                "Añadir al carrito manual",
+                use_container_width=True,
+                on_click=reorder_transfer,
+                args=(transfers["transfer_id"].iloc[pick], factor),
+            )
+
+    last = st.session_state.get("reorder_last")
+    if last:
+        st.success(
+            f"Traspaso repetido (×{last['factor']:g}): {last['eans']} EAN · {last['units']} uds "
+            f"de {last['lines']} líneas."
+        )
+        if len(last["discontinued"]):
+            st.warning(f"{len(last['discontinued'])} EAN ya no están en el catálogo (descatalogados):")
+            st.dataframe(last["discontinued"], use_container_width=True, hide_index=True)
 
 # -----------------------------
 # Layout 2 columnas (JOOR-ish)
@@ -121,6 +265,7 @@ with left:
     with b1:
         if st.button("Vaciar carrito manual", use_container_width=True):
             st.session_state.carrito_manual = {}
+            persist_cart_clear("carrito_manual")
     with b2:
         if st.button("Limpiar búsqueda", use_container_width=True):
             st.session_state.search_query = ""
@@ -128,11 +273,15 @@ with left:
             st.rerun()
 
     q = (st.session_state.search_query or "").strip().lower()
-    if q:
-        mask = st.session_state.search_blob.str.contains(re.escape(q), na=False)
-        hits = cat.loc[mask, ["Referencia", "Nombre", "Color", "Talla", "EAN"]].copy()
-    else:
-        hits = cat.loc[:, ["Referencia", "Nombre", "Color", "Talla", "EAN"]].head(0)
+    with timed("search"):
+        if q in ean_index:
+            # EAN exacto: lookup directo, sin recorrer el search_blob
+            hits = pd.DataFrame([ean_index[q]])[["Referencia", "Nombre", "Color", "Talla", "EAN"]]
+        elif q:
+            mask = get_search_blob().str.contains(re.escape(q), na=False)
+            hits = cat.loc[mask, ["Referencia", "Nombre", "Color", "Talla", "EAN"]].copy()
+        else:
+            hits = cat.loc[:, ["Referencia", "Nombre", "Color", "Talla", "EAN"]].head(0)
 
     # Deduplicamos por referencia+nombre para selector
     hits2 = hits.drop_duplicates(subset=["Referencia", "Nombre"]).head(show_limit).copy()
@@ -171,88 +320,96 @@ with left:
         )
         st.session_state.selected_ref = sel_ref
 
-        # Vista rápida opcional (ref + nombre)
-        with st.expander("Ver lista", expanded=False):
-            df_list = pd.DataFrame(
-                [{"Referencia": r, "Nombre": ref_name.get(r, "")} for r in ref_options]
-            )
-            st.dataframe(df_list, use_container_width=True, hide_index=True)
+        # Vista rápida opcional (ref + nombre); en modo ligero basta el selector
+        if not st.session_state.light_mode:
+            with st.expander("Ver lista", expanded=False):
+                df_list = pd.DataFrame(
+                    [{"Referencia": r, "Nombre": ref_name.get(r, "")} for r in ref_options]
+                )
+                st.dataframe(df_list, use_container_width=True, hide_index=True)
 
 with right:
     st.markdown("<div class='joor-kicker'>Product grid</div>", unsafe_allow_html=True)
     if st.session_state.get("selected_ref"):
         ref = st.session_state.selected_ref
-        ref_df = cat[cat["Referencia"] == ref].copy()
+        grid = get_ref_grid(ref)
 
-        if ref_df.empty:
+        if grid is None:
             st.warning("No se encontraron variantes para esa referencia en catálogo.")
             st.stop()
 
-        nombre = ref_df["Nombre"].iloc[0] if "Nombre" in ref_df.columns else ""
-        st.markdown(
-            f"<div class='card'>"
-            f"<div style='display:flex; gap:8px; align-items:center;'>"
-            f"<span class='joor-chip'>REF</span><span class='mono' style='font-weight:800'>{ref}</span>"
-            f"</div>"
-            f"<div style='margin-top:6px; font-weight:800; font-size:16px;'>{nombre}</div>"
-            f"<div class='joor-sub' style='margin-top:4px;'>Ajusta cantidades por color y talla.</div>"
-            f"</div>",
-            unsafe_allow_html=True,
-        )
-
-        colors = sorted(ref_df["Color"].dropna().astype(str).unique().tolist())
-        tallas = sorted(ref_df["Talla"].dropna().astype(str).unique().tolist(), key=lambda x: (len(x), x))
-
-        # Mapa de variantes
-        var_map = {}
-        for _, r in ref_df.iterrows():
-            var_map[(str(r["Color"]), str(r["Talla"]))] = {
-                "EAN": str(r["EAN"]),
-                "Referencia": str(r["Referencia"]),
-                "Nombre": str(r["Nombre"]),
-                "Color": str(r["Color"]),
-                "Talla": str(r["Talla"]),
-            }
-
-        # Cabecera sticky (por CSS)
-        header_cols = st.columns([1.2] + [1.0] * len(colors))
-        header_cols[0].markdown("<div class='grid-header-row grid-hdr-left'>Talla \\ Color</div>", unsafe_allow_html=True)
-        for j, col in enumerate(colors, start=1):
-            header_cols[j].markdown(f"<div class='grid-header-row grid-hdr'>{col}</div>", unsafe_allow_html=True)
-
-        # Filas por talla
-        for talla in tallas:
-            row_cols = st.columns([1.2] + [1.0] * len(colors))
-            row_cols[0].markdown(f"<div class='grid-rowlabel'>{talla}</div>", unsafe_allow_html=True)
-
-            for j, col in enumerate(colors, start=1):
-                variant = var_map.get((col, talla))
-
-                if not variant:
-                    row_cols[j].markdown(
-                        "<div class='grid-colcell'><div class='cellqty small'>—</div></div>",
-                        unsafe_allow_html=True,
-                    )
-                    continue
-
-                ean = variant["EAN"]
-                current_qty = int(st.session_state.carrito_manual.get(ean, {}).get("Cantidad", 0))
+        nombre = grid["nombre"]
+        if st.session_state.light_mode:
+            st.markdown(f"**{ref}** · {nombre}")
+            # Una tabla editable por referencia en lugar de tres botones por celda
+            grid_key = f"light_grid_{ref}_{st.session_state.cart_rev}"
+            st.data_editor(
+                ref_grid_frame(grid, st.session_state.carrito_manual),
+                key=grid_key,
+                on_change=apply_grid_edits,
+                args=(ref, grid_key),
+                column_config={c: st.column_config.NumberColumn(c, min_value=0, step=1) for c in grid["colors"]},
+                use_container_width=True,
+            )
+        else:
+            st.markdown(
+                f"<div class='card'>"
+                f"<div style='display:flex; gap:8px; align-items:center;'>"
+                f"<span class='joor-chip'>REF</span><span class='mono' style='font-weight:800'>{ref}</span>"
+                f"</div>"
+                f"<div style='margin-top:6px; font-weight:800; font-size:16px;'>{nombre}</div>"
+                f"<div class='joor-sub' style='margin-top:4px;'>Ajusta cantidades por color y talla.</div>"
+                f"</div>",
+                unsafe_allow_html=True,
+            )
 
-                row_cols[j].markdown("<div class='grid-colcell'>", unsafe_allow_html=True)
+            colors = grid["colors"]
+            tallas = grid["tallas"]
 
-                b1, b2, b3 = row_cols[j].columns([1, 1, 1])
-                with b1:
-                    if st.button("−", key=f"minus_{ref}_{col}_{talla}", use_container_width=True):
-                        add_to_cart(st.session_state.carrito_manual, variant, -1)
-                        st.rerun()
-                with b2:
-                    st.markdown(f"<div class='cellqty'>{current_qty}</div>", unsafe_allow_html=True)
-                with b3:
-                    if st.button("＋", key=f"plus_{ref}_{col}_{talla}", use_container_width=True):
-                        add_to_cart(st.session_state.carrito_manual, variant, +1)
-                        st.rerun()
+            # Mapa de variantes
+            var_map = grid["var_map"]
 
-                row_cols[j].markdown("</div>", unsafe_allow_html=True)
+            # Cabecera sticky (por CSS)
+            header_cols = st.columns([1.2] + [1.0] * len(colors))
+            header_cols[0].markdown("<div class='grid-header-row grid-hdr-left'>Talla \\ Color</div>", unsafe_allow_html=True)
+            for j, col in enumerate(colors, start=1):
+                header_cols[j].markdown(f"<div class='grid-header-row grid-hdr'>{col}</div>", unsafe_allow_html=True)
+
+            # Filas por talla
+            for talla in tallas:
+                row_cols = st.columns([1.2] + [1.0] * len(colors))
+                row_cols[0].markdown(f"<div class='grid-rowlabel'>{talla}</div>", unsafe_allow_html=True)
+
+                for j, col in enumerate(colors, start=1):
+                    variant = var_map.get((col, talla))
+
+                    if not variant:
+                        row_cols[j].markdown(
+                            "<div class='grid-colcell'><div class='cellqty small'>—</div></div>",
+                            unsafe_allow_html=True,
+                        )
+                        continue
+
+                    ean = variant["EAN"]
+                    current_qty = int(st.session_state.carrito_manual.get(ean, {}).get("Cantidad", 0))
+
+                    row_cols[j].markdown("<div class='grid-colcell'>", unsafe_allow_html=True)
+
+                    b1, b2, b3 = row_cols[j].columns([1, 1, 1])
+                    with b1:
+                        if st.button("−", key=f"minus_{ref}_{col}_{talla}", use_container_width=True):
+                            add_to_cart(st.session_state.carrito_manual, variant, -1)
+                            persist_cart_lines("carrito_manual", [ean])
+                            st.rerun()
+                    with b2:
+                        st.markdown(f"<div class='cellqty'>{current_qty}</div>", unsafe_allow_html=True)
+                    with b3:
+                        if st.button("＋", key=f"plus_{ref}_{col}_{talla}", use_container_width=True):
+                            add_to_cart(st.session_state.carrito_manual, variant, +1)
+                            persist_cart_lines("carrito_manual", [ean])
+                            st.rerun()
+
+                    row_cols[j].markdown("</div>", unsafe_allow_html=True)
 
     else:
         st.info("Selecciona una referencia desde la izquierda para ver el grid.")
@@ -262,9 +419,10 @@ with right:
 # -----------------------------
 st.markdown("<hr/>", unsafe_allow_html=True)
 
-carrito = st.session_state.get("carrito_manual", {}) or {}
-total_lines = len(carrito)
-total_units = sum(int(v.get("Cantidad", 0)) for v in carrito.values())
+carrito = st.session_state.carrito_manual
+carrito_df = cart_frame("carrito_manual", carrito)
+total_lines = len(carrito_df)
+total_units = int(carrito_df["Cantidad"].sum())
 
 with st.expander(f"Carrito manual · {total_lines} líneas · {total_units} uds", expanded=True):
     st.markdown("<div class='cartpanel'>", unsafe_allow_html=True)
@@ -279,15 +437,17 @@ with st.expander(f"Carrito manual · {total_lines} líneas · {total_units} uds"
             disabled=not bool(selected_ref),
         )
 
-        items = []
-        for ean, it in carrito.items():
-            if show_only_ref and selected_ref and it.get("Ref") != selected_ref:
-                continue
-            items.append((ean, it))
+        # Orden y filtro en servidor; solo se pintan las líneas de la página visible
+        cart_df = filter_cart_df(carrito_df, ref=selected_ref if show_only_ref else "")
 
-        if not items:
+        if cart_df.empty:
             st.info("No hay líneas del carrito manual para esa referencia.")
+        elif render_cart_view_mode("mcart", len(cart_df)):
+            page, size = render_pager("mcart_c", len(cart_df), COMPACT_PAGE_SIZES, reset_on=show_only_ref)
+            st.dataframe(paginate(cart_df, page, size), use_container_width=True, hide_index=True)
         else:
+            page, size = render_pager("mcart", len(cart_df), reset_on=show_only_ref)
+
             h = st.columns([2.4, 1.2, 1.0, 0.6, 0.6, 0.6])
             h[0].markdown("**Ref / Producto**")
             h[1].markdown("**Color / Talla**")
@@ -296,9 +456,8 @@ with st.expander(f"Carrito manual · {total_lines} líneas · {total_units} uds"
             h[4].markdown("")
             h[5].markdown("")
 
-            items_sorted = sorted(items, key=lambda x: (x[1].get("Ref", ""), x[1].get("Col", ""), x[1].get("Tal", "")))
-
-            for ean, it in items_sorted:
+            for it in paginate(cart_df, page, size).to_dict("records"):
+                ean = it["EAN"]
                 ref = it.get("Ref", "")
                 nom = it.get("Nom", "")
                 col = it.get("Col", "-")
@@ -319,14 +478,17 @@ with st.expander(f"Carrito manual · {total_lines} líneas · {total_units} uds"
                 with row[3]:
                     if st.button("−", key=f"cart_minus_{ean}", use_container_width=True):
                         add_to_cart(st.session_state.carrito_manual, variant, -1)
+                        persist_cart_lines("carrito_manual", [ean])
                         st.rerun()
                 with row[4]:
                     if st.button("＋", key=f"cart_plus_{ean}", use_container_width=True):
                         add_to_cart(st.session_state.carrito_manual, variant, +1)
+                        persist_cart_lines("carrito_manual", [ean])
                         st.rerun()
                 with row[5]:
                     if st.button("🗑️", key=f"cart_del_{ean}", use_container_width=True):
                         st.session_state.carrito_manual.pop(ean, None)
+                        persist_cart_lines("carrito_manual", [ean])
                         st.rerun()
 
     st.markdown("</div>", unsafe_allow_html=True)
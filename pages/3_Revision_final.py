@@ -1,7 +1,23 @@
 # pages/3_Revision_final.py
-import re
 import streamlit as st
-from utils import init_state, ensure_style, load_repo_data, merge_carts
+from utils import (
+    init_state,
+    ensure_style,
+    load_repo_data,
+    catalog_loaded,
+    merged_cart,
+    persist_cart_lines,
+    cart_frame,
+    cart_text_index,
+    paginate,
+    render_pager,
+    render_cart_view_mode,
+    COMPACT_PAGE_SIZES,
+    DEST_CART_PREFIX,
+    match_warehouse,
+)
+from perf import timed
+from stock import cap_carts, on_stock_upload, stock_check
 
 st.set_page_config(page_title="Revisión", page_icon="🧾", layout="wide")
 ensure_style()
@@ -14,9 +30,10 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Sticky bar CSS
-st.markdown(
-    """
+# Sticky bar CSS (no en modo ligero)
+if not st.session_state.light_mode:
+    st.markdown(
+        """
 <style>
 .stickybar {
   position: sticky;
@@ -28,10 +45,10 @@ st.markdown(
 }
 </style>
 """,
-    unsafe_allow_html=True,
-)
+        unsafe_allow_html=True,
+    )
 
-if not st.session_state.get("cat_loaded"):
+if not catalog_loaded():
     st.error("No se encontró `catalogue.xlsx` en la raíz del repositorio.")
     st.stop()
 
@@ -49,12 +66,16 @@ def set_qty_in_base_carts(ean: str, new_qty: int):
     if new_qty <= 0:
         st.session_state.carrito_import.pop(ean, None)
         st.session_state.carrito_manual.pop(ean, None)
+        persist_cart_lines("carrito_import", [ean])
+        persist_cart_lines("carrito_manual", [ean])
         return
 
     if ean in st.session_state.carrito_import:
         st.session_state.carrito_import[ean]["Cantidad"] = new_qty
+        persist_cart_lines("carrito_import", [ean])
     elif ean in st.session_state.carrito_manual:
         st.session_state.carrito_manual[ean]["Cantidad"] = new_qty
+        persist_cart_lines("carrito_manual", [ean])
     else:
         # fallback raro: si no está en ninguno, lo metemos en manual
         st.session_state.carrito_manual[ean] = {
@@ -65,14 +86,87 @@ def set_qty_in_base_carts(ean: str, new_qty: int):
             "Tal": "",
             "Cantidad": new_qty,
         }
+        persist_cart_lines("carrito_manual", [ean])
+
+merged = merged_cart()
+
+# Líneas cuyo EAN desapareció del catálogo tras una recarga: las del pedido en revisión y las
+# de los carritos aparcados de otros destinos (multi-destino)
+orphan_set = set(st.session_state.get("cart_orphans", []))
+orphans = [e for e in st.session_state.get("cart_orphans", []) if e in merged]
+parked = {
+    dest: sorted(orphan_set & cart.keys())
+    for dest, cart in (st.session_state.get("carritos_destino") or {}).items()
+    if cart is not st.session_state.carrito_import
+}
+parked = {dest: eans for dest, eans in parked.items() if eans}
+if orphans or parked:
+    if orphans:
+        where = f" (destino {st.session_state.destino})" if st.session_state.get("carritos_destino") else ""
+        st.warning(
+            f"{len(orphans)} líneas{where} ya no existen en el catálogo actualizado: " + ", ".join(orphans)
+        )
+    for dest, eans in parked.items():
+        st.warning(f"Destino {dest}: {len(eans)} líneas ya no existen en el catálogo actualizado: " + ", ".join(eans))
+    if st.button("Quitar líneas descatalogadas", type="primary"):
+        for ean in orphans:
+            set_qty_in_base_carts(ean, 0)
+        for dest, eans in parked.items():
+            cart = st.session_state.carritos_destino[dest]
+            for ean in eans:
+                cart.pop(ean, None)
+            persist_cart_lines(f"{DEST_CART_PREFIX}{dest}", eans, cart=cart)
+        st.session_state.cart_orphans = []
+        st.rerun()
+
+
+def cap_to_stock(caps: dict):
+    """Baja cada EAN a su tope (stock); el exceso se quita primero del carrito manual y luego del importado."""
+    cap_carts(caps, merged, [st.session_state.carrito_manual, st.session_state.carrito_import])
+    persist_cart_lines("carrito_import", caps)
+    persist_cart_lines("carrito_manual", caps)
 
-merged = merge_carts(st.session_state.carrito_import, st.session_state.carrito_manual)
 
 if not merged:
     st.info("No hay prendas en la petición todavía.")
     st.page_link("pages/2_Seleccion_manual.py", label="← Volver a selección manual", use_container_width=True)
     st.stop()
 
+# -----------------------------
+# Stock del almacén de origen (opcional)
+# -----------------------------
+snapshot = st.session_state.get("stock_snapshot")
+with st.expander("Stock del almacén de origen", expanded=snapshot is None):
+    st.file_uploader(
+        "Snapshot de stock (xlsx/CSV: almacén, EAN, stock)",
+        type=["xlsx", "csv"],
+        key="stock_file",
+        on_change=on_stock_upload,
+        args=("stock_file",),
+    )
+    if st.session_state.get("stock_error"):
+        st.error(f"No se pudo leer el fichero de stock: {st.session_state.stock_error}")
+    if snapshot is not None:
+        st.caption(
+            f"{snapshot.name} · {snapshot.rows} filas · almacenes: "
+            f"{', '.join(w or 'todos' for w in snapshot.warehouses)}"
+            + (f" · {snapshot.unknown_rows} filas con almacén no reconocido" if snapshot.unknown_rows else "")
+        )
+        if st.button("Quitar snapshot de stock", use_container_width=True):
+            st.session_state.stock_snapshot = None
+            st.session_state.pop("rev_stock", None)
+            st.rerun()
+
+chk = None
+only_short = False
+# El snapshot va por nombre PET; en sesión el origen puede seguir como código corto ("BAD")
+origen = match_warehouse(st.session_state.origen) or st.session_state.origen
+if snapshot is not None:
+    with timed("review_stock"):
+        chk = stock_check("rev_stock", merged, snapshot, origen)
+    if chk is None:
+        st.warning(f"El snapshot de stock no incluye el almacén de origen ({origen}).")
+
 # -----------------------------
 # Barra herramientas (filtro + expand/collapse)
 # -----------------------------
@@ -97,9 +191,10 @@ q = (st.session_state.rev_filter or "").strip().lower()
 # -----------------------------
 # Totales + sticky bar
 # -----------------------------
-total_lines = len(merged)
-total_units = sum(int(v.get("Cantidad", 0)) for v in merged.values())
-total_refs = len(set(v.get("Ref", "") for v in merged.values() if v.get("Ref", "")))
+merged_df = cart_frame("merged", merged)
+total_lines = len(merged_df)
+total_units = int(merged_df["Cantidad"].sum())
+total_refs = merged_df.loc[merged_df["Ref"] != "", "Ref"].nunique()
 
 st.markdown("<div class='stickybar'>", unsafe_allow_html=True)
 m1, m2, m3, m4 = st.columns([1, 1, 1, 1.2])
@@ -113,100 +208,107 @@ st.markdown("</div>", unsafe_allow_html=True)
 st.markdown("<hr/>", unsafe_allow_html=True)
 
 # -----------------------------
-# Agrupar por referencia
+# Líneas filtradas y paginadas en servidor; se agrupan por referencia solo las de la página
 # -----------------------------
-groups = {}
-for ean, it in merged.items():
-    ref = it.get("Ref", "") or "-"
-    groups.setdefault(ref, []).append((ean, it))
-
-def group_matches(ref: str, items):
-    if not q:
-        return True
-    hay = [ref]
-    for ean, it in items:
-        hay.append(it.get("Nom", ""))
-        hay.append(it.get("Col", ""))
-        hay.append(it.get("Tal", ""))
-        hay.append(str(ean))
-    blob = " ".join(hay).lower()
-    return bool(re.search(re.escape(q), blob))
-
-shown_any = False
-
-for ref in sorted(groups.keys()):
-    items = groups[ref]
-    if not group_matches(ref, items):
-        continue
-
-    shown_any = True
-
-    name = next((it.get("Nom", "") for _, it in items if it.get("Nom")), "")
-    units_ref = sum(int(it.get("Cantidad", 0)) for _, it in items)
-    lines_ref = len(items)
-
-    expanded = True if q else bool(st.session_state.rev_expand_all)
-    title = f"{ref} · {lines_ref} líneas · {units_ref} uds"
-
-    with st.expander(title, expanded=expanded):
-        if name:
-            st.markdown(f"<div class='small'>{name}</div>", unsafe_allow_html=True)
-
-        st.markdown("<div class='card'>", unsafe_allow_html=True)
-
-        # Cabecera: Variante | Qty | - | + | 🗑️
-        header = st.columns([3.6, 0.9, 0.55, 0.55, 0.6])
-        header[0].markdown("**Variante**")
-        header[1].markdown("**Qty**")
-        header[2].markdown("")
-        header[3].markdown("")
-        header[4].markdown("")
-
-        items_sorted = sorted(items, key=lambda x: (x[1].get("Col", ""), x[1].get("Tal", "")))
-
-        for ean, it in items_sorted:
-            col = it.get("Col", "-")
-            tal = it.get("Tal", "-")
-            qty = int(it.get("Cantidad", 0))
-
-            # Filtro a nivel variante (si hay query)
-            if q:
-                vblob = f"{ref} {it.get('Nom','')} {col} {tal} {ean}".lower()
-                if q not in vblob:
-                    continue
-
-            row = st.columns([3.6, 0.9, 0.55, 0.55, 0.6])
-
-            with row[0]:
-                st.markdown(
-                    f"<span class='mono'>{col}</span> / <span class='mono'>{tal}</span><br>"
-                    f"<span class='small'>EAN {ean}</span>",
-                    unsafe_allow_html=True,
-                )
-
-            with row[1]:
-                st.markdown(f"<div class='cellqty'>{qty}</div>", unsafe_allow_html=True)
-
-            with row[2]:
-                if st.button("−", key=f"rev_minus_{ean}", use_container_width=True):
-                    set_qty_in_base_carts(ean, qty - 1)
-                    st.rerun()
-
-            with row[3]:
-                if st.button("＋", key=f"rev_plus_{ean}", use_container_width=True):
-                    set_qty_in_base_carts(ean, qty + 1)
-                    st.rerun()
-
-            with row[4]:
-                # Eliminar variante de golpe
-                if st.button("🗑️", key=f"rev_del_{ean}", use_container_width=True):
-                    set_qty_in_base_carts(ean, 0)
-                    st.rerun()
-
-        st.markdown("</div>", unsafe_allow_html=True)
-
-if not shown_any:
+all_df = merged_df.assign(Ref=merged_df["Ref"].replace("", "-"))
+if chk is not None:
+    all_df = chk.check(all_df)
+    short = all_df[all_df["Falta"] > 0]
+    if short.empty:
+        st.success(f"Hay stock en {origen} para todas las líneas.")
+    else:
+        s1, s2, s3 = st.columns([2.2, 1.0, 1.0])
+        s1.warning(
+            f"{len(short)} líneas piden más de lo disponible en {origen} "
+            f"({int(short['Falta'].sum())} uds de más)."
+        )
+        with s2:
+            only_short = st.toggle("Solo líneas sin stock", key="rev_only_short")
+        with s3:
+            if st.button("Ajustar al stock disponible", type="primary", use_container_width=True):
+                cap_to_stock(dict(zip(short["EAN"], short["Stock"])))
+                st.rerun()
+# Filtro por índice de trigramas (se actualiza solo con las líneas que entran/salen del carrito)
+with timed("review_filter"):
+    if q:
+        hits = cart_text_index("rev_text_index", merged).search(q)
+        view_df = all_df[all_df["EAN"].isin(hits)]
+    else:
+        view_df = all_df
+    if only_short:
+        view_df = view_df[view_df["Falta"] > 0]
+
+# Totales por referencia sobre el carrito completo (la página puede partir un grupo)
+ref_totals = all_df.groupby("Ref").agg(lineas=("EAN", "size"), uds=("Cantidad", "sum"), nom=("Nom", "max"))
+
+if view_df.empty:
     st.info("No hay resultados para ese filtro.")
+elif render_cart_view_mode("rev", len(view_df)):
+    page, size = render_pager("rev_c", len(view_df), COMPACT_PAGE_SIZES, reset_on=(q, only_short))
+    st.dataframe(paginate(view_df, page, size), use_container_width=True, hide_index=True)
+else:
+    page, size = render_pager("rev", len(view_df), reset_on=(q, only_short))
+
+    for ref, grp in paginate(view_df, page, size).groupby("Ref", sort=False):
+        name = ref_totals.at[ref, "nom"]
+        units_ref = int(ref_totals.at[ref, "uds"])
+        lines_ref = int(ref_totals.at[ref, "lineas"])
+
+        expanded = True if q else bool(st.session_state.rev_expand_all)
+        title = f"{ref} · {lines_ref} líneas · {units_ref} uds"
+
+        with st.expander(title, expanded=expanded):
+            if name:
+                st.markdown(f"<div class='small'>{name}</div>", unsafe_allow_html=True)
+
+            st.markdown("<div class='card'>", unsafe_allow_html=True)
+
+            # Cabecera: Variante | Qty | - | + | 🗑️
+            header = st.columns([3.6, 0.9, 0.55, 0.55, 0.6])
+            header[0].markdown("**Variante**")
+            header[1].markdown("**Qty**")
+            header[2].markdown("")
+            header[3].markdown("")
+            header[4].markdown("")
+
+            for it in grp.to_dict("records"):
+                ean = it["EAN"]
+                col = it.get("Col", "-")
+                tal = it.get("Tal", "-")
+                qty = int(it.get("Cantidad", 0))
+                stock_txt = ""
+                if "Stock" in it:
+                    stock_txt = f" · stock {it['Stock']}" + (f" · ⚠️ faltan {it['Falta']}" if it["Falta"] else "")
+
+                row = st.columns([3.6, 0.9, 0.55, 0.55, 0.6])
+
+                with row[0]:
+                    st.markdown(
+                        f"<span class='mono'>{col}</span> / <span class='mono'>{tal}</span><br>"
+                        f"<span class='small'>EAN {ean}{stock_txt}</span>",
+                        unsafe_allow_html=True,
+                    )
+
+                with row[1]:
+                    st.markdown(f"<div class='cellqty'>{qty}</div>", unsafe_allow_html=True)
+
+                with row[2]:
+                    if st.button("−", key=f"rev_minus_{ean}", use_container_width=True):
+                        set_qty_in_base_carts(ean, qty - 1)
+                        st.rerun()
+
+                with row[3]:
+                    if st.button("＋", key=f"rev_plus_{ean}", use_container_width=True):
+                        set_qty_in_base_carts(ean, qty + 1)
+                        st.rerun()
+
+                with row[4]:
+                    # Eliminar variante de golpe
+                    if st.button("🗑️", key=f"rev_del_{ean}", use_container_width=True):
+                        set_qty_in_base_carts(ean, 0)
+                        st.rerun()
+
+            st.markdown("</div>", unsafe_allow_html=True)
 
 st.markdown("<hr/>", unsafe_allow_html=True)
 st.page_link("pages/4_Exportar.py", label="Confirmar y exportar →", use_container_width=True)
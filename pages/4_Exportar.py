@@ -1,9 +1,23 @@
 # pages/4_Exportar.py
-import io
-import re
 import streamlit as st
-from openpyxl import load_workbook
-from utils import init_state, ensure_style, load_repo_data, merge_carts
+from utils import (
+    init_state,
+    ensure_style,
+    load_repo_data,
+    get_template,
+    merge_carts,
+    merged_cart,
+    get_ean_index,
+    session_cached,
+    TEMPLATE_HEADER,
+    template_header_mismatch,
+    build_transfer_xlsx,
+    build_transfer_zip,
+    transfer_filename,
+    record_export,
+)
+from jobs import PRIORITY_BULK, PRIORITY_INTERACTIVE, SchedulerBusy, get_scheduler
+from validation import blocking_eans, drop_blocked, validate_export_lines
 
 st.set_page_config(page_title="Exportar", page_icon="📦", layout="wide")
 ensure_style()
@@ -12,13 +26,13 @@ load_repo_data()
 
 st.markdown("# 4 · Exportar pedido")
 
-merged = merge_carts(st.session_state.get("carrito_import", {}), st.session_state.get("carrito_manual", {}))
+merged = merged_cart()
 if not merged:
     st.warning("No hay líneas en el pedido.")
     st.page_link("pages/3_Revision_final.py", label="← Volver a 3 · Revisión", use_container_width=True)
     st.stop()
 
-tpl = st.session_state.get("tpl_bytes")
+tpl = get_template()
 if tpl is None:
     st.error("No se encontró `plantilla_pedido.xlsx` en el repositorio.")
     st.stop()
@@ -40,66 +54,129 @@ if origen == destino:
     st.error("Origen y destino no pueden coincidir.")
     st.stop()
 
-def _safe(s: str) -> str:
-    return re.sub(r"[^A-Za-z0-9._ -]+", "_", (s or "").strip())
-
-# Cargar plantilla
-wb = load_workbook(io.BytesIO(tpl))
-ws = wb.active
-
 # Validación plantilla EXACTA (no tocamos nada si no coincide)
-expected = ["Fecha", "Almacén de origen", "Almacén de destino", "Observaciones", "EAN", "Cantidad"]
-row1 = [ws.cell(1, c).value for c in range(1, 7)]
-if [str(x).strip() if x is not None else "" for x in row1] != expected:
+found = template_header_mismatch(tpl)
+if found is not None:
     st.error(
         "La plantilla no coincide con la estructura esperada.\n\n"
-        f"Esperado en A1–F1: {expected}\n"
-        f"Encontrado en A1–F1: {row1}"
+        f"Esperado en A1–F1: {TEMPLATE_HEADER}\n"
+        f"Encontrado en A1–F1: {found}"
     )
     st.stop()
 
-# Construir filas (cada línea = una fila en Excel)
-rows = []
-for ean, it in merged.items():
-    qty = int(it.get("Cantidad", 0) or 0)
-    if qty <= 0:
-        continue
-    rows.append((str(ean), qty, it.get("Ref", ""), it.get("Col", ""), it.get("Tal", "")))
-
-# Orden estable
-rows.sort(key=lambda x: (x[2], x[3], x[4], x[0]))
-
-# Limpiar filas antiguas SOLO en el rango usado (no desconfigura estilos del header)
-# Borramos contenido de filas 2..(2+len(rows)+50) en columnas A..F
-max_clear = max(2 + len(rows) + 50, 60)
-for r in range(2, max_clear + 1):
-    for c in range(1, 7):
-        ws.cell(r, c).value = None
-
-# Escribir
-r = 2
-for ean, qty, *_ in rows:
-    ws.cell(r, 1).value = fecha
-    ws.cell(r, 2).value = origen
-    ws.cell(r, 3).value = destino
-    ws.cell(r, 4).value = obs
-    ws.cell(r, 5).value = ean
-    ws.cell(r, 6).value = qty
-    r += 1
-
-filename = f"{fecha:%Y%m%d}_{_safe(obs) if obs else 'SIN_REF'}.xlsx".replace(" ", "_")
-
-out = io.BytesIO()
-wb.save(out)
-out.seek(0)
+# -----------------------------
+# Validación de integridad (el ERP rechaza el fichero entero por una sola línea mala)
+# -----------------------------
+ean_index = get_ean_index()
+check_key = (id(merged), st.session_state.get("cart_rev", 0), st.session_state.get("cat_version"))
+clean, problems = session_cached("export_check", check_key, lambda: validate_export_lines(merged, ean_index))
+n_blocking = len(blocking_eans(problems))
+if len(problems):
+    if n_blocking:
+        st.error(f"{n_blocking} líneas con errores que el ERP rechazaría (revisa en 3 · Revisión):")
+    else:
+        st.info("Avisos que no impiden exportar (Bloquea = no): se exportan tal cual.")
+    st.caption(
+        "Los códigos del catálogo que no son EAN-13 se exportan igual. Los EAN duplicados se fusionan "
+        "en una línea sumando cantidades."
+    )
+    st.dataframe(problems, use_container_width=True, hide_index=True)
+if n_blocking:
+    valid = drop_blocked(clean, problems)
+    if not st.checkbox(f"Excluir las líneas con errores y exportar el resto ({len(valid)} líneas)"):
+        st.stop()
+    clean = valid
+    if not clean:
+        st.warning("No queda ninguna línea válida que exportar.")
+        st.stop()
+
+# Cada línea = una fila en Excel, orden estable Ref/Color/Talla/EAN
+# Se genera en el pool de procesos compartido (prioridad interactiva: el usuario está esperando) y solo
+# cuando cambia algo de lo que lleva: `clean` sale de check_key y cat_version sube también con la plantilla
+pool = get_scheduler()
+xlsx_key = (*check_key, fecha, origen, destino, obs)
+data = session_cached(
+    "export_xlsx",
+    xlsx_key,
+    lambda: pool.run(build_transfer_xlsx, clean, fecha, origen, destino, obs, tpl, priority=PRIORITY_INTERACTIVE),
+)
+filename = transfer_filename(fecha, obs)
 
 st.success("Archivo listo para descargar.")
 st.download_button(
     "Descargar Excel",
-    data=out.getvalue(),
+    data=data,
     file_name=filename,
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     use_container_width=True,
+    # Cada descarga queda en el histórico (idempotente: el mismo contenido no se duplica)
+    on_click=record_export,
+    args=({destino: clean}, fecha, origen, obs),
 )
 
+# -----------------------------
+# Multi-destino: todas las peticiones en un zip
+# -----------------------------
+carts_dest = st.session_state.get("carritos_destino") or {}
+if carts_dest:
+    st.markdown("<hr/>", unsafe_allow_html=True)
+    st.markdown("### Todos los destinos")
+    st.caption(f"El carrito manual se incluye en el destino activo (**{destino}**).")
+
+    plans = {}
+    for dest, cart in carts_dest.items():
+        lines = merge_carts(cart, st.session_state.carrito_manual) if dest == destino else merge_carts(cart, {})
+        if lines:
+            plans[dest] = lines
+    skipped = [d for d in plans if d == origen]
+    for d in skipped:
+        plans.pop(d)
+    if skipped:
+        st.warning("Se omite el destino igual al origen: " + ", ".join(skipped))
+
+    # Misma validación por destino: en el zip solo van líneas válidas y deduplicadas
+    dropped = {}
+    for d, lines in list(plans.items()):
+        ok, probs = validate_export_lines(lines, ean_index)
+        n_bad = len(blocking_eans(probs))
+        if n_bad:
+            ok, dropped[d] = drop_blocked(ok, probs), n_bad
+        if ok:
+            plans[d] = ok
+        else:
+            plans.pop(d)
+    if dropped:
+        st.warning(
+            "Líneas con errores excluidas del zip: " + ", ".join(f"{d} ({n})" for d, n in dropped.items())
+        )
+
+    summary = [
+        {"Destino": d, "Líneas": len(lines), "Unidades": sum(int(v["Cantidad"]) for v in lines.values())}
+        for d, lines in plans.items()
+    ]
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    # El zip preparado solo vale mientras no cambien los carritos
+    sig = (fecha, origen, obs, tuple((r["Destino"], r["Líneas"], r["Unidades"]) for r in summary))
+    if plans and st.button("Preparar zip con todos los destinos", type="primary", use_container_width=True):
+        try:
+            ex = pool.as_executor(PRIORITY_BULK, block=False)
+            st.session_state.export_zip = (sig, build_transfer_zip(plans, fecha, origen, obs, tpl, executor=ex))
+        except SchedulerBusy:
+            st.warning("El servidor está ocupado con otras exportaciones. Vuelve a intentarlo en unos segundos.")
+    ready = st.session_state.get("export_zip")
+    if ready and ready[0] == sig:
+        st.download_button(
+            "Descargar zip",
+            data=ready[1],
+            file_name=filename[: -len(".xlsx")] + "_destinos.zip",
+            mime="application/zip",
+            use_container_width=True,
+            on_click=record_export,
+            args=(plans, fecha, origen, obs),
+        )
+
+if st.session_state.get("history_error"):
+    st.caption(f"⚠️ No se pudo registrar en el histórico: {st.session_state.history_error}")
+
 st.page_link("pages/3_Revision_final.py", label="← Volver a 3 · Revisión", use_container_width=True)
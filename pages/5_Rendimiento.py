@@ -0,0 +1,67 @@
+# pages/5_Rendimiento.py
+import pandas as pd
+import streamlit as st
+import perf
+from jobs import get_scheduler
+from utils import init_state, ensure_style, load_repo_data
+
+st.set_page_config(page_title="Rendimiento", page_icon="⏱️", layout="wide")
+ensure_style()
+init_state()
+load_repo_data()
+
+st.markdown("# Rendimiento")
+st.markdown(
+    "<div class='small'>Tiempos por etapa (catálogo, índices, matching, búsqueda, grid, merge, export). "
+    "Desactivado no mide nada; la activación afecta a todo el proceso.</div>",
+    unsafe_allow_html=True,
+)
+
+c1, c2, c3 = st.columns([1.2, 1, 1])
+with c1:
+    enabled = st.toggle("Instrumentación activa", value=perf.ENABLED)
+    if enabled != perf.ENABLED:
+        perf.set_enabled(enabled)
+        st.rerun()
+with c2:
+    if st.button("Vaciar medidas", use_container_width=True):
+        perf.reset()
+        st.rerun()
+with c3:
+    if st.button("Perfilar siguiente rerun (cProfile)", use_container_width=True):
+        perf.request_profile()
+        st.info("Se capturará el próximo rerun de esta sesión (en cualquier página).")
+
+st.markdown("### Proceso")
+st.dataframe(perf.process_summary(), use_container_width=True, hide_index=True)
+
+st.markdown("### Esta sesión")
+st.dataframe(perf.session_summary(), use_container_width=True, hide_index=True)
+
+st.markdown("### Sesiones")
+st.dataframe(perf.sessions_summary(), use_container_width=True, hide_index=True)
+
+pool = get_scheduler()
+st.markdown("### Cola de trabajos (pool de procesos)")
+st.caption(
+    f"{pool.workers} procesos · {pool.in_flight} en ejecución · {pool.queued()} en cola "
+    f"(máx. {pool.max_queued} no interactivas)"
+)
+st.dataframe(pool.stats(), use_container_width=True, hide_index=True)
+
+# Sin esperar a la precarga: si aún no hay versión publicada, se omite la sección
+cat = v.catalog_df if (v := load_repo_data()) is not None else None
+if cat is not None:
+    st.markdown("### Catálogo en memoria")
+    mem = cat.memory_usage(deep=True, index=False)
+    st.dataframe(
+        pd.DataFrame({"Columna": mem.index, "dtype": cat.dtypes.astype(str).values, "MB": (mem.values / 1e6).round(2)}),
+        use_container_width=True,
+        hide_index=True,
+    )
+    st.caption(f"{len(cat)} variantes · {mem.sum() / 1e6:.2f} MB en total (compartido por todas las sesiones).")
+
+report = st.session_state.get("_perf_profile_report")
+if report:
+    with st.expander("Último perfil cProfile (40 funciones, por tiempo acumulado)", expanded=False):
+        st.code(report, language="text")
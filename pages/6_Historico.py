@@ -0,0 +1,77 @@
+# pages/6_Historico.py
+import time
+from datetime import date, timedelta
+
+import streamlit as st
+from history import filter_lines, get_history_store, top_refs, units_by_destino, units_by_week
+from perf import timed
+from utils import init_state, ensure_style, load_repo_data, get_match_indexes
+
+st.set_page_config(page_title="Histórico", page_icon="📈", layout="wide")
+ensure_style()
+init_state()
+load_repo_data()
+
+st.markdown("# Histórico de traspasos")
+st.markdown(
+    "<div class='small'>Todo lo descargado en 4 · Exportar queda registrado aquí. "
+    "Unidades movidas por tienda y semana y referencias más pedidas.</div>",
+    unsafe_allow_html=True,
+)
+
+store = get_history_store()
+t0 = time.perf_counter()
+with timed("history_load"):
+    lines = store.frame()
+
+if lines.empty:
+    st.info("Todavía no hay traspasos exportados.")
+    st.stop()
+
+c1, c2, c3 = st.columns([1.4, 2, 0.8])
+with c1:
+    rango = st.date_input("Fechas", value=(date.today() - timedelta(days=365), date.today()))
+with c2:
+    destinos = st.multiselect("Destinos", sorted(lines["destino"].cat.categories), placeholder="Todos")
+with c3:
+    top_n = st.selectbox("Top refs", [10, 20, 50, 100], index=1)
+
+# Mientras se elige el rango, date_input devuelve una sola fecha
+date_from, date_to = (rango[0], rango[-1]) if isinstance(rango, (tuple, list)) else (rango, rango)
+
+with timed("history_aggregate"):
+    sel = filter_lines(lines, date_from, date_to, destinos)
+    weekly = units_by_week(sel)
+    per_dest = units_by_destino(sel)
+    top = top_refs(sel, top_n)
+elapsed_ms = (time.perf_counter() - t0) * 1000
+
+m1, m2, m3, m4 = st.columns(4)
+m1.metric("Líneas", f"{len(sel):,}".replace(",", "."))
+m2.metric("Unidades", f"{int(sel['qty'].sum()):,}".replace(",", "."))
+m3.metric("Referencias", int(sel["ref"].nunique()))
+m4.metric("Destinos", int(sel["destino"].nunique()))
+st.caption(f"{len(lines):,} líneas en histórico · calculado en {elapsed_ms:.0f} ms".replace(",", "."))
+
+if sel.empty:
+    st.info("No hay traspasos en ese rango.")
+    st.stop()
+
+st.markdown("### Unidades por semana y destino")
+st.bar_chart(weekly)
+with st.expander("Ver tabla", expanded=False):
+    st.dataframe(weekly, use_container_width=True)
+
+left, right = st.columns([1, 1.4], gap="large")
+with left:
+    st.markdown("### Por destino")
+    st.dataframe(per_dest, use_container_width=True, hide_index=True)
+with right:
+    st.markdown("### Referencias más pedidas")
+    idx_ref = (get_match_indexes() or ({}, {}, {}, {}))[3]
+    top.insert(1, "Nombre", [(idx_ref.get(r) or [{}])[0].get("Nombre", "") for r in top["ref"]])
+    st.dataframe(top, use_container_width=True, hide_index=True)
+
+st.markdown("### Últimos traspasos")
+recent = store.list_transfers(20).drop(columns=["exported_at"])
+st.dataframe(recent, use_container_width=True, hide_index=True)
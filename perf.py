@@ -0,0 +1,218 @@
+# perf.py
+"""
+Instrumentación de rendimiento (desactivada por defecto).
+
+- `timed("etapa")` como context manager y `@timed_fn("etapa")` como decorador.
+- Cada medida va a un buffer circular por proceso y, si hay sesión de Streamlit, a otro por sesión.
+- `on_rerun()` (desde init_state) cuenta reruns por sesión y gestiona la captura cProfile de un rerun.
+- Desactivado, el coste es comprobar un booleano.
+
+Se activa con PETICIONES_PERF=1 o desde la página de Rendimiento.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+import pandas as pd
+
+BUFFER_SIZE = 2000
+SESSION_BUFFER_SIZE = 500
+# Objetos compartidos entre sesiones (versión de catálogo): no cuentan como memoria de la sesión
+SHARED_STATE_KEYS = {"catalog", "stock_snapshot", "sales_df"}
+
+ENABLED = os.environ.get("PETICIONES_PERF", "") not in ("", "0", "false", "False")
+
+_lock = threading.Lock()
+_process: Dict[str, deque] = {}
+_sessions: Dict[str, dict] = {}
+
+
+def set_enabled(value: bool):
+    global ENABLED
+    ENABLED = bool(value)
+
+
+def _ctx():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+
+def record(stage: str, seconds: float):
+    with _lock:
+        buf = _process.get(stage)
+        if buf is None:
+            buf = _process[stage] = deque(maxlen=BUFFER_SIZE)
+        buf.append((time.time(), seconds))
+    ctx = _ctx()
+    if ctx is not None:
+        sess = _sessions.get(ctx.session_id)
+        if sess is not None:
+            sess["stages"].setdefault(stage, deque(maxlen=SESSION_BUFFER_SIZE)).append(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+
+def timed_fn(stage: str):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - t0)
+
+        return wrapper
+
+    return deco
+
+
+# -----------------------------
+# Reruns y captura de perfil
+# -----------------------------
+def on_rerun():
+    """Llamar al inicio de cada rerun. Cierra una captura cProfile pendiente y, si se pidió, abre otra."""
+    ctx = _ctx()
+    if ctx is None:
+        return
+    state = ctx.session_state
+
+    prof = state["_perf_profile"] if "_perf_profile" in state else None
+    if prof is not None:
+        prof.disable()
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(40)
+        state["_perf_profile_report"] = out.getvalue()
+        state["_perf_profile"] = None
+
+    if "_perf_profile_next" in state and state["_perf_profile_next"]:
+        state["_perf_profile_next"] = False
+        prof = cProfile.Profile()
+        state["_perf_profile"] = prof
+        prof.enable()
+
+    if not ENABLED:
+        return
+    with _lock:
+        sess = _sessions.get(ctx.session_id)
+        if sess is None:
+            sess = _sessions[ctx.session_id] = {"reruns": 0, "stages": {}, "state": state}
+        sess["reruns"] += 1
+        sess["last_seen"] = time.time()
+
+
+def request_profile():
+    """Pide capturar con cProfile el siguiente rerun de esta sesión."""
+    ctx = _ctx()
+    if ctx is not None:
+        ctx.session_state["_perf_profile_next"] = True
+
+
+def reset():
+    with _lock:
+        _process.clear()
+        for sess in _sessions.values():
+            sess["stages"] = {}
+            sess["reruns"] = 0
+
+
+# -----------------------------
+# Informes
+# -----------------------------
+def _summary(buffers: Dict[str, list]) -> pd.DataFrame:
+    rows = []
+    for stage, vals in buffers.items():
+        if not vals:
+            continue
+        s = pd.Series(vals) * 1000
+        rows.append({
+            "Etapa": stage,
+            "N": len(s),
+            "p50 ms": round(s.quantile(0.5), 2),
+            "p95 ms": round(s.quantile(0.95), 2),
+            "máx ms": round(s.max(), 2),
+            "total s": round(s.sum() / 1000, 3),
+        })
+    cols = ["Etapa", "N", "p50 ms", "p95 ms", "máx ms", "total s"]
+    return pd.DataFrame(rows, columns=cols).sort_values("total s", ascending=False) if rows else pd.DataFrame(columns=cols)
+
+
+def process_summary() -> pd.DataFrame:
+    with _lock:
+        snap = {k: [v for _, v in buf] for k, buf in _process.items()}
+    return _summary(snap)
+
+
+def session_summary(session_id: Optional[str] = None) -> pd.DataFrame:
+    if session_id is None:
+        ctx = _ctx()
+        session_id = ctx.session_id if ctx is not None else None
+    sess = _sessions.get(session_id) if session_id else None
+    return _summary({k: list(v) for k, v in (sess or {}).get("stages", {}).items()})
+
+
+def deep_size(obj, _seen=None) -> int:
+    """Tamaño aproximado en bytes (DataFrames/Series con memory_usage(deep=True))."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(v, seen) for v in obj)
+    return size
+
+
+def sessions_summary(max_idle_s: float = 3600) -> pd.DataFrame:
+    """Sesiones vistas con instrumentación activa: reruns, última actividad y memoria propia."""
+    now = time.time()
+    rows = []
+    with _lock:
+        for sid in [s for s, v in _sessions.items() if now - v.get("last_seen", now) > max_idle_s]:
+            _sessions.pop(sid, None)
+        items = list(_sessions.items())
+    for sid, sess in items:
+        try:
+            state = sess["state"].filtered_state
+            mem = sum(deep_size(v) for k, v in state.items() if k not in SHARED_STATE_KEYS)
+        except Exception:
+            mem = None
+        rows.append({
+            "Sesión": sid[:8],
+            "Reruns": sess["reruns"],
+            "Última actividad (s)": round(now - sess.get("last_seen", now), 1),
+            "Memoria MB": round(mem / 1e6, 2) if mem is not None else None,
+        })
+    return pd.DataFrame(rows, columns=["Sesión", "Reruns", "Última actividad (s)", "Memoria MB"])
@@ -0,0 +1,73 @@
+# peticiones.py
+"""
+Tareas de despliegue (se ejecutan desde la raíz del repositorio).
+
+    python -m peticiones prebuild                 # genera catalog.bundle a partir de catalogue.xlsx
+    python -m peticiones prebuild --out /srv/catalog.bundle
+    python -m peticiones info                     # cabecera del bundle y si sigue vigente
+
+La app usa el bundle si existe y corresponde al catálogo actual (PETICIONES_BUNDLE cambia la ruta).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from bundle import DEFAULT_BUNDLE_PATH, build_bundle, bundle_status, load_bundle, read_header
+from utils import DEFAULT_CATALOG_PATH, DEFAULT_TEMPLATE_PATH
+
+
+def _prebuild(args) -> int:
+    t0 = time.perf_counter()
+    header = build_bundle(args.out, args.catalog, args.template)
+    built = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    load_bundle(args.out, args.catalog, args.template)
+    loaded = time.perf_counter() - t0
+    print(
+        f"{args.out}: {header['rows']} filas · {header['refs']} referencias · "
+        f"{os.path.getsize(args.out) / 1e6:.1f} MB · construido en {built:.2f} s · carga {loaded * 1000:.0f} ms"
+    )
+    if header["template_sha1"] is None:
+        print(f"Aviso: no existe {args.template}; el bundle va sin plantilla.")
+    return 0
+
+
+def _info(args) -> int:
+    header = read_header(args.out)
+    if header is None:
+        print(f"{args.out}: no existe o no es un bundle.")
+        return 1
+    print(
+        f"{args.out}: formato {header['format']} · {header['rows']} filas · {header['refs']} referencias · "
+        f"construido {datetime.fromtimestamp(header['built_at']):%Y-%m-%d %H:%M:%S}"
+    )
+    libs = header.get("libraries") or {}
+    print("Librerías: " + (" · ".join(f"{k} {v}" for k, v in libs.items()) or "sin registrar"))
+    status = bundle_status(args.out, args.catalog, args.template)
+    print(f"Estado: {status}")
+    return 0 if status == "ok" else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m peticiones", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, fn, help_ in (
+        ("prebuild", _prebuild, "Genera el bundle de arranque"),
+        ("info", _info, "Muestra la cabecera del bundle y si corresponde a los ficheros actuales"),
+    ):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("--out", default=DEFAULT_BUNDLE_PATH, help="Ruta del bundle")
+        p.add_argument("--catalog", default=DEFAULT_CATALOG_PATH)
+        p.add_argument("--template", default=DEFAULT_TEMPLATE_PATH)
+        p.set_defaults(func=fn)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# stock.py
+"""
+Snapshot de stock del almacén de origen (xlsx/CSV con almacén, EAN y stock) para validar la revisión.
+
+- read_stock_file: lectura vectorizada; columnas detectadas por cabecera (o por posición). Los EAN
+  se normalizan como los del catálogo (norm_ean_series).
+- StockSnapshot: por almacén, una Series EAN -> stock con índice hash. Se construye una vez por
+  contenido de fichero y se comparte entre sesiones (cache_resource), como la versión de catálogo.
+- StockCheck: stock disponible de las líneas del carrito, mantenido por diferencias: en cada rerun
+  solo se buscan los EAN que han entrado en el carrito (igual que CartTextIndex).
+- cap_carts: baja las líneas al stock disponible repartiendo el recorte entre los carritos.
+
+Un EAN que no aparece en el snapshot cuenta como stock 0.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from perf import timed_fn
+from utils import (
+    EAN_COLUMN_REGEX,
+    WAREHOUSE_COLUMN_REGEX,
+    match_warehouse,
+    match_warehouse_series,
+    norm_ean_series,
+    pick_column,
+    read_table_file,
+)
+
+# Sin columna de almacén, el snapshot vale para cualquier origen
+ANY_WAREHOUSE = ""
+
+STOCK_COLUMN_REGEX = re.compile(r"stock|disp|exist|uds|unidades|cant|qty", re.I)
+
+
+@timed_fn("read_stock_file")
+def read_stock_file(file_bytes: bytes, name: str = "") -> Tuple[pd.DataFrame, int]:
+    """
+    Lee el snapshot (xlsx o CSV, separador autodetectado) y lo normaliza a columnas
+    almacen / EAN / stock. Devuelve (filas válidas, filas descartadas por almacén no reconocido).
+    """
+    df = read_table_file(file_bytes, name)
+    cols = list(df.columns)
+    if len(cols) < 2:
+        raise ValueError("El fichero de stock necesita al menos las columnas EAN y stock.")
+
+    ean_col = pick_column(cols, EAN_COLUMN_REGEX)
+    stock_col = pick_column(cols, STOCK_COLUMN_REGEX, exclude=(ean_col,))
+    wh_col = pick_column(cols, WAREHOUSE_COLUMN_REGEX, exclude=(ean_col, stock_col))
+    if ean_col is None or stock_col is None:
+        # Sin cabeceras reconocibles: [almacén,] EAN, stock
+        wh_col, ean_col, stock_col = (cols[0], cols[1], cols[2]) if len(cols) >= 3 else (None, cols[0], cols[1])
+
+    out = pd.DataFrame({
+        "EAN": norm_ean_series(df[ean_col]),
+        "stock": pd.to_numeric(df[stock_col].str.replace(",", ".", regex=False), errors="coerce").fillna(0),
+    })
+    if wh_col is not None:
+        out["almacen"] = match_warehouse_series(df[wh_col])
+    else:
+        out["almacen"] = ANY_WAREHOUSE
+
+    out = out[out["EAN"] != ""]
+    unknown = int(out["almacen"].isna().sum())
+    return out.dropna(subset=["almacen"]), unknown
+
+
+class StockSnapshot:
+    def __init__(self, df: pd.DataFrame, name: str = "", version: str = "", unknown_rows: int = 0):
+        self.name = name
+        self.version = version
+        self.rows = len(df)
+        self.unknown_rows = unknown_rows
+        # Stock negativo (ajustes pendientes) se trata como 0 disponible
+        grouped = df.groupby(["almacen", "EAN"], sort=False)["stock"].sum().clip(lower=0)
+        self.by_warehouse: Dict[str, pd.Series] = {
+            wh: s.droplevel("almacen") for wh, s in grouped.groupby(level="almacen", sort=False)
+        }
+
+    @property
+    def warehouses(self) -> list:
+        return sorted(self.by_warehouse)
+
+    def stock_for(self, origen: str) -> Optional[pd.Series]:
+        """
+        Series EAN -> stock del almacén `origen` (None si el snapshot no lo incluye). `origen` puede
+        venir como código corto ("BAD"): el snapshot va por nombre PET (match_warehouse).
+        """
+        s = self.by_warehouse.get(match_warehouse(origen) or origen)
+        return s if s is not None else self.by_warehouse.get(ANY_WAREHOUSE)
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_snapshot(version: str, file_bytes: bytes, name: str) -> StockSnapshot:
+    df, unknown = read_stock_file(file_bytes, name)
+    return StockSnapshot(df, name=name, version=version, unknown_rows=unknown)
+
+
+def load_stock_snapshot(file_bytes: bytes, name: str = "") -> StockSnapshot:
+    """Snapshot compartido por contenido: el mismo fichero subido en varias sesiones se lee una vez."""
+    version = hashlib.sha1(file_bytes).hexdigest()
+    return _load_snapshot(version, file_bytes, name)
+
+
+def on_stock_upload(key: str):
+    """Callback de los file_uploader de stock: publica el snapshot en la sesión (stock_snapshot)."""
+    up = st.session_state.get(key)
+    if up is None:
+        st.session_state.stock_snapshot = None
+        st.session_state.stock_error = None
+        return
+    try:
+        st.session_state.stock_snapshot = load_stock_snapshot(up.getvalue(), up.name)
+        st.session_state.stock_error = None
+    except Exception as e:
+        st.session_state.stock_snapshot = None
+        st.session_state.stock_error = f"{type(e).__name__}: {e}"
+
+
+class StockCheck:
+    """Stock disponible por EAN de las líneas de un carrito, para un snapshot y un origen concretos."""
+
+    def __init__(self, stock: pd.Series, key: tuple):
+        self.stock = stock
+        self.key = key
+        self.avail: Dict[str, float] = {}
+
+    @timed_fn("stock_sync")
+    def sync(self, cart: Dict[str, dict]) -> Tuple[int, int]:
+        """Alinea con el carrito. Devuelve (altas, bajas)."""
+        gone = self.avail.keys() - cart.keys()
+        new = list(cart.keys() - self.avail.keys())
+        for ean in gone:
+            del self.avail[ean]
+        if new:
+            self.avail.update(self.stock.reindex(new, fill_value=0).to_dict())
+        return len(new), len(gone)
+
+    @timed_fn("stock_check")
+    def check(self, lines: pd.DataFrame) -> pd.DataFrame:
+        """Añade Stock y Falta (uds pedidas por encima del stock) a las líneas (EAN, Cantidad)."""
+        out = lines.copy()
+        out["Stock"] = out["EAN"].map(self.avail).fillna(0).astype(int)
+        out["Falta"] = (out["Cantidad"] - out["Stock"]).clip(lower=0)
+        return out
+
+
+def cap_carts(caps: Dict[str, int], totals: Dict[str, dict], carts: List[Dict[str, dict]]):
+    """
+    Baja cada EAN de `caps` a su tope. `totals` es el carrito fusionado (cantidad total por EAN);
+    el exceso se quita de los carritos en el orden de `carts` y las líneas que llegan a 0 se borran.
+    """
+    for ean, cap in caps.items():
+        excess = int(totals[ean]["Cantidad"]) - int(cap)
+        for cart in carts:
+            it = cart.get(ean)
+            if it is None or excess <= 0:
+                continue
+            take = min(excess, int(it["Cantidad"]))
+            it["Cantidad"] = int(it["Cantidad"]) - take
+            excess -= take
+            if it["Cantidad"] <= 0:
+                cart.pop(ean)
+
+
+def stock_check(key: str, cart: Dict[str, dict], snapshot: StockSnapshot, origen: str) -> Optional[StockCheck]:
+    """
+    StockCheck de la sesión para `key`, sincronizado con el carrito. Se rehace si cambia el snapshot
+    o el almacén de origen. None si el snapshot no tiene stock de ese origen.
+    """
+    origen = match_warehouse(origen) or origen
+    stock = snapshot.stock_for(origen)
+    if stock is None:
+        return None
+    chk = st.session_state.get(key)
+    if chk is None or chk.key != (snapshot.version, origen):
+        chk = st.session_state[key] = StockCheck(stock, (snapshot.version, origen))
+    chk.sync(cart)
+    return chk
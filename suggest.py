@@ -0,0 +1,165 @@
+# suggest.py
+"""
+Sugerencia de reposición a partir de un histórico de ventas (fecha, almacén, EAN, unidades).
+
+Por EAN del destino elegido:
+    venta_dia = unidades vendidas en la ventana / días de la ventana
+    objetivo  = ceil(venta_dia × días de cobertura)
+    sugerido  = objetivo − stock en destino (si hay snapshot), recortado al stock del origen
+
+Todo son operaciones por columnas sobre todos los EAN a la vez (filtro, groupby, join por índice);
+no hay bucles por línea. El fichero de ventas se lee una vez por contenido y se comparte entre
+sesiones (cache_resource), como el snapshot de stock.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from perf import timed_fn
+from stock import StockSnapshot
+from utils import (
+    EAN_COLUMN_REGEX,
+    WAREHOUSE_COLUMN_REGEX,
+    match_warehouse,
+    match_warehouse_series,
+    norm_ean_series,
+    pick_column,
+    read_table_file,
+    size_rank,
+)
+
+DEFAULT_COVER_DAYS = 14
+DEFAULT_WINDOW_DAYS = 28
+
+DATE_COLUMN_REGEX = re.compile(r"fecha|date|d[ií]a", re.I)
+UNITS_COLUMN_REGEX = re.compile(r"uds|unidades|ventas|vendid|cant|qty", re.I)
+
+SUGGEST_COLUMNS = [
+    "EAN", "Referencia", "Nombre", "Color", "Talla",
+    "vendidas", "venta_dia", "stock_destino", "objetivo", "stock_origen", "Cantidad",
+]
+
+
+@timed_fn("read_sales_file")
+def read_sales_file(file_bytes: bytes, name: str = "") -> pd.DataFrame:
+    """
+    Lee el histórico de ventas (xlsx o CSV) y lo normaliza a fecha / almacen (categórica) / EAN / uds.
+    Las columnas se detectan por cabecera; sin cabeceras reconocibles: fecha, almacén, EAN, unidades.
+    Filas sin fecha, EAN o almacén reconocible se descartan.
+    """
+    df = read_table_file(file_bytes, name)
+    cols = list(df.columns)
+    if len(cols) < 4:
+        raise ValueError("El fichero de ventas necesita las columnas fecha, almacén, EAN y unidades.")
+
+    ean_col = pick_column(cols, EAN_COLUMN_REGEX)
+    date_col = pick_column(cols, DATE_COLUMN_REGEX, exclude=(ean_col,))
+    wh_col = pick_column(cols, WAREHOUSE_COLUMN_REGEX, exclude=(ean_col, date_col))
+    units_col = pick_column(cols, UNITS_COLUMN_REGEX, exclude=(ean_col, date_col, wh_col))
+    if None in (ean_col, date_col, wh_col, units_col):
+        date_col, wh_col, ean_col, units_col = cols[:4]
+
+    fecha = pd.to_datetime(df[date_col], errors="coerce", format="ISO8601")
+    if fecha.isna().mean() > 0.5:
+        fecha = pd.to_datetime(df[date_col], errors="coerce", dayfirst=True)
+    out = pd.DataFrame({
+        "fecha": fecha,
+        "almacen": match_warehouse_series(df[wh_col]),
+        "EAN": norm_ean_series(df[ean_col]),
+        "uds": pd.to_numeric(df[units_col].str.replace(",", ".", regex=False), errors="coerce").fillna(0),
+    })
+    out = out[out["fecha"].notna() & out["almacen"].notna() & (out["EAN"] != "")]
+    out["almacen"] = out["almacen"].astype("category")
+    return out.reset_index(drop=True)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_sales(version: str, file_bytes: bytes, name: str) -> pd.DataFrame:
+    return read_sales_file(file_bytes, name)
+
+
+def load_sales_file(file_bytes: bytes, name: str = "") -> pd.DataFrame:
+    """Ventas compartidas por contenido: el mismo fichero en varias sesiones se lee una vez."""
+    return _load_sales(hashlib.sha1(file_bytes).hexdigest(), file_bytes, name)
+
+
+@timed_fn("suggest_replenishment")
+def suggest_replenishment(
+    sales: pd.DataFrame,
+    cat: pd.DataFrame,
+    destino: str,
+    origen: str = "",
+    cover_days: int = DEFAULT_COVER_DAYS,
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    snapshot: Optional[StockSnapshot] = None,
+    as_of: Optional[date] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Cantidades propuestas por EAN para `destino`.
+    - Ventana: los `window_days` días hasta `as_of` (por defecto, la última fecha del fichero).
+    - Con snapshot: se resta el stock del destino y se recorta al stock del origen (si los incluye).
+    Devuelve (líneas sugeridas con columnas de variante + Cantidad, EANs vendidos que no están en catálogo).
+    """
+    dest = match_warehouse(destino) or destino
+    sel = sales[sales["almacen"] == dest]
+    if sel.empty:
+        return pd.DataFrame(columns=SUGGEST_COLUMNS), pd.DataFrame(columns=["EAN", "vendidas"])
+
+    end = pd.Timestamp(as_of) if as_of else sel["fecha"].max()
+    start = end - pd.Timedelta(days=int(window_days) - 1)
+    sel = sel[(sel["fecha"] >= start) & (sel["fecha"] <= end)]
+
+    sold = sel.groupby("EAN", sort=False)["uds"].sum()
+    sold = sold[sold > 0]
+    out = pd.DataFrame({"vendidas": sold})
+    out["venta_dia"] = out["vendidas"] / int(window_days)
+    out["objetivo"] = np.ceil(out["venta_dia"] * int(cover_days) - 1e-9).astype(int)
+
+    dest_stock = snapshot.by_warehouse.get(dest) if snapshot is not None else None
+    orig_stock = snapshot.by_warehouse.get(match_warehouse(origen) or origen) if snapshot is not None else None
+    out["stock_destino"] = (dest_stock.reindex(out.index, fill_value=0) if dest_stock is not None else 0)
+    need = (out["objetivo"] - out["stock_destino"]).clip(lower=0)
+    if orig_stock is not None:
+        out["stock_origen"] = orig_stock.reindex(out.index, fill_value=0)
+        need = np.minimum(need, out["stock_origen"])
+    else:
+        out["stock_origen"] = np.nan
+    out["Cantidad"] = need.astype(int)
+    out = out[out["Cantidad"] > 0]
+
+    # Join por índice con el catálogo actual
+    variant_cols = ["EAN", "Referencia", "Nombre", "Color", "Talla", "TallaRank"]
+    keys = cat[[c for c in variant_cols if c in cat.columns]].drop_duplicates(subset=["EAN"])
+    pos = pd.Index(keys["EAN"]).get_indexer(out.index)
+    found = pos >= 0
+    missing = out.loc[~found, ["vendidas"]].rename_axis("EAN").reset_index()
+
+    lines = keys.iloc[pos[found]].reset_index(drop=True)
+    for c in ["vendidas", "venta_dia", "stock_destino", "objetivo", "stock_origen", "Cantidad"]:
+        lines[c] = out[c].to_numpy()[found]
+    rank = lines["TallaRank"] if "TallaRank" in lines.columns else size_rank(lines["Talla"].astype(str))
+    lines = lines.assign(_rank=rank).sort_values(["Referencia", "Color", "_rank"])
+    lines["venta_dia"] = lines["venta_dia"].round(2)
+    return lines[SUGGEST_COLUMNS].reset_index(drop=True), missing
+
+
+def summarize_by_ref(lines: pd.DataFrame) -> pd.DataFrame:
+    """Totales de la sugerencia por referencia y color."""
+    g = lines.groupby(["Referencia", "Color"], observed=True, sort=False)
+    return pd.DataFrame({
+        "Nombre": g["Nombre"].first(),
+        "tallas": g.size(),
+        "vendidas": g["vendidas"].sum(),
+        "Cantidad": g["Cantidad"].sum(),
+    }).reset_index()
+
+
+def default_as_of(sales: pd.DataFrame) -> date:
+    return sales["fecha"].max().date() if len(sales) else date.today() - timedelta(days=1)
@@ -0,0 +1,50 @@
+# tests/test_bulk.py
+"""utils.parse_bulk_lines + resolve_bulk_lines: formatos de la lista pegada y su cruce con el catálogo."""
+import pandas as pd
+
+import utils
+
+CAT = utils.normalize_catalog(pd.DataFrame(
+    [
+        ("8445790000007", "214843", "Bikini Top", "Negro", "M"),
+        ("8445790000014", "214843", "Bikini Top", "Negro", "10A"),
+        ("8445790000021", "214843", "Bikini Top", "Azul Marino", "M"),
+    ],
+    columns=["EAN", "Referencia", "Nombre", "Color", "Talla"],
+))
+EAN_INDEX = utils.build_ean_index(CAT)
+
+
+def _parse(text):
+    return utils.parse_bulk_lines(text).set_index("line")
+
+
+def test_line_formats():
+    out = _parse("8445790000007\n8445790000014;3\n8445790000021 2\n\n214843|Negro|m|4\n8445790000007.0\t5")
+    assert out.index.tolist() == [1, 2, 3, 5, 6]
+    assert (out["error"] == "").all()
+    assert out["EAN"].tolist() == ["8445790000007", "8445790000014", "8445790000021", "", "8445790000007"]
+    assert out["qty"].tolist() == [1, 3, 2, 4, 5]
+    assert out.loc[5, ["Referencia", "Color", "Talla"]].tolist() == ["214843", "Negro", "M"]
+
+
+def test_bad_lines_report_why():
+    out = _parse("8445790000007;x\n8445790000007;0\n8445790000007;1.5\nA;B;C\n214843;Negro;M;2;9")
+    assert out["error"].tolist() == [
+        "Cantidad no numérica",
+        "Cantidad debe ser > 0",
+        "Cantidad no numérica",
+        "Formato no reconocido (usa EAN;cant o Ref;Color;Talla;cant)",
+        "Demasiados campos (máximo 4: Ref;Color;Talla;cant)",
+    ]
+
+
+def test_resolve_by_ean_and_by_variant():
+    lines = utils.parse_bulk_lines("8445790000007;2\n214843;negro;10a;3\n214843;Rojo;M;1\n8400000000001")
+    resolved, errors = utils.resolve_bulk_lines(lines, CAT, EAN_INDEX)
+    assert resolved["EAN"].tolist() == ["8445790000007", "8445790000014"]
+    assert resolved["Cantidad"].tolist() == [2, 3]
+    assert dict(zip(errors["line"], errors["error"])) == {
+        3: "No existe esa variante (ref/color/talla) en catálogo",
+        4: "EAN no encontrado en catálogo",
+    }
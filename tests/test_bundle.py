@@ -0,0 +1,73 @@
+# tests/test_bundle.py
+"""bundle.build_bundle + load_bundle: ida y vuelta, y vuelta al xlsx si el bundle no vale para el catálogo actual."""
+import pandas as pd
+import pytest
+
+import bundle
+import utils
+from bench.generators import make_catalog
+from catalog_store import CatalogStore
+
+
+@pytest.fixture
+def paths(tmp_path):
+    cat, tpl, out = tmp_path / "catalogue.xlsx", tmp_path / "plantilla.xlsx", tmp_path / "catalog.bundle"
+    make_catalog(200, colors_per_ref=4, sizes_per_ref=5).to_excel(cat, index=False)
+    tpl.write_bytes(b"plantilla v1")
+    bundle.build_bundle(str(out), str(cat), str(tpl))
+    return str(out), str(cat), str(tpl)
+
+
+def test_round_trip(paths):
+    out, cat, tpl = paths
+    assert bundle.bundle_status(out, cat, tpl) == "ok"
+    payload = bundle.load_bundle(out, cat, tpl)
+    df = utils._read_catalog_xlsx(cat)
+    pd.testing.assert_frame_equal(payload["catalog_df"], df)
+    assert payload["ean_index"] == utils.build_ean_index(df)
+    assert payload["match_indexes"] == utils.build_catalog_indexes(df)
+    assert payload["search_blob"].tolist() == utils.build_search_blob(df).tolist()
+    assert payload["size_ranks"] == utils.build_size_ranks(df["Talla"])
+    assert payload["tpl_bytes"] == b"plantilla v1"
+
+
+def test_changed_template_keeps_catalogue(paths):
+    out, cat, tpl = paths
+    with open(tpl, "wb") as f:
+        f.write(b"plantilla v2")
+    assert bundle.bundle_status(out, cat, tpl) == "plantilla distinta"
+    payload = bundle.load_bundle(out, cat, tpl)
+    assert "tpl_bytes" not in payload and len(payload["catalog_df"]) == 200
+
+
+@pytest.mark.parametrize("stale,status", [
+    (lambda m, cat: m.setattr(bundle, "BUNDLE_FORMAT", bundle.BUNDLE_FORMAT + 1), "formato antiguo"),
+    (lambda m, cat: m.setattr(bundle, "_library_versions", lambda: {"pandas": "0", "numpy": "0"}), "versiones distintas"),
+    (lambda m, cat: make_catalog(40).to_excel(cat, index=False), "catálogo distinto"),
+])
+def test_stale_header_falls_back_to_xlsx(paths, monkeypatch, stale, status):
+    out, cat, tpl = paths
+    stale(monkeypatch, cat)
+    assert bundle.bundle_status(out, cat, tpl) == status
+    assert bundle.load_bundle(out, cat, tpl) is None
+
+    store = CatalogStore(cat, tpl, bundle_path=out)
+    assert store.refresh()
+    v = store.current
+    assert v.source == "xlsx" and store.bundle_error is None
+    pd.testing.assert_frame_equal(v.catalog_df, utils._read_catalog_xlsx(cat))
+
+
+def test_store_starts_from_bundle_and_survives_a_corrupt_one(paths):
+    out, cat, tpl = paths
+    store = CatalogStore(cat, tpl, bundle_path=out)
+    store.refresh()
+    assert store.current.source == "bundle" and store.current.tpl_bytes == b"plantilla v1"
+
+    # Cabecera vigente pero datos truncados
+    with open(out, "r+b") as f:
+        f.truncate(f.seek(0, 2) // 2)
+    store = CatalogStore(cat, tpl, bundle_path=out)
+    store.refresh()
+    assert store.current.source == "xlsx" and store.bundle_error
+    assert len(store.current.catalog_df) == 200
@@ -0,0 +1,53 @@
+# tests/test_cart_text_index.py
+"""utils.CartTextIndex: altas, bajas y búsqueda por trigramas frente a un `in` sobre el texto."""
+import utils
+
+
+def _line(ean, ref, nom, col, tal):
+    return {"EAN": ean, "Ref": ref, "Nom": nom, "Col": col, "Tal": tal, "Cantidad": 1}
+
+
+CART = {
+    "1": _line("1", "214843", "Bikini Top", "Negro", "M"),
+    "2": _line("2", "214843", "Bikini Top", "Azul Marino", "L"),
+    "3": _line("3", "300100", "Vestido Luna", "Negro", "38"),
+}
+
+
+def _brute(idx, q):
+    return {e for e, t in idx.docs.items() if q.strip().lower() in t}
+
+
+def test_search_matches_substring():
+    idx = utils.CartTextIndex()
+    assert idx.sync(CART) == (3, 0)
+    for q in ["negro", "BIKINI", "marino", "2148", "luna negro", "x", "zzz", "", "  38 "]:
+        assert idx.search(q) == _brute(idx, q), q
+    assert idx.search("negro") == {"1", "3"}
+    assert idx.search("") == {"1", "2", "3"}
+
+
+def test_add_remove_keep_postings_clean():
+    idx = utils.CartTextIndex()
+    idx.sync(CART)
+    idx.remove("3")
+    idx.remove("3")
+    assert idx.search("vestido") == set()
+    assert not any("3" in post for post in idx.grams.values())
+    idx.add("1", "otro texto")
+    assert idx.search("bikini") == {"2"} and idx.search("otro") == {"1"}
+
+    empty = utils.CartTextIndex()
+    for ean, it in CART.items():
+        empty.add(ean, empty.line_text(it))
+        empty.remove(ean)
+    assert empty.docs == {} and empty.grams == {}
+
+
+def test_sync_follows_cart_and_prefers_catalogue_text():
+    variants = {"1": {"EAN": "1", "Referencia": "214843", "Nombre": "Nombre del catálogo", "Color": "Negro", "Talla": "M"}}
+    idx = utils.CartTextIndex(cat_version=1, variants=variants)
+    idx.sync(CART)
+    assert idx.search("catálogo") == {"1"}
+    assert idx.sync({"1": CART["1"], "4": _line("4", "1", "Nuevo", "Rojo", "S")}) == (1, 2)
+    assert set(idx.docs) == {"1", "4"} and idx.search("nuevo") == {"4"}
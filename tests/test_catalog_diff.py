@@ -0,0 +1,115 @@
+# tests/test_catalog_diff.py
+"""
+catalog_store.diff_catalogs + update_catalog_artifacts: los derivados actualizados por diferencias
+tienen que ser idénticos a reconstruirlos desde cero sobre el catálogo nuevo.
+"""
+import pandas as pd
+import pytest
+
+import utils
+from bench.generators import make_catalog
+from catalog_store import CatalogVersion, diff_catalogs, update_catalog_artifacts
+
+# 20 referencias × 4 colores × 5 tallas
+BASE = make_catalog(400, colors_per_ref=4, sizes_per_ref=5)
+REFS = sorted(BASE["Referencia"].unique())
+
+
+def _rows(raw, ref):
+    return raw.index[raw["Referencia"] == ref]
+
+
+def add_row(raw):
+    extra = raw.loc[_rows(raw, REFS[0])[:1]].assign(EAN="8400000000001", Color="Fucsia")
+    return pd.concat([raw, extra], ignore_index=True)
+
+
+def remove_row(raw):
+    return raw.drop(_rows(raw, REFS[1])[:1]).reset_index(drop=True)
+
+
+def change_rows(raw):
+    raw = raw.copy()
+    raw.loc[_rows(raw, REFS[2])[:1], "Nombre"] = "Otro nombre"
+    raw.loc[_rows(raw, REFS[3])[:1], "Color"] = "Fucsia"
+    raw.loc[_rows(raw, REFS[3])[1:2], "Talla"] = "xxl"
+    return raw
+
+
+def move_ean_between_refs(raw):
+    raw = raw.copy()
+    raw.loc[_rows(raw, REFS[4])[:1], ["Referencia", "Color"]] = [REFS[5], "Fucsia"]
+    return raw
+
+
+def ref_loses_last_row(raw):
+    return raw.drop(_rows(raw, REFS[6])).reset_index(drop=True)
+
+
+def add_duplicate_ean(raw):
+    dup = raw.loc[_rows(raw, REFS[7])[:1]].assign(Talla="XXXL")
+    return pd.concat([raw, dup], ignore_index=True)
+
+
+def all_changes(raw):
+    for fn in (add_row, remove_row, change_rows, move_ean_between_refs, ref_loses_last_row, add_duplicate_ean):
+        raw = fn(raw)
+    return raw
+
+
+def _version(df: pd.DataFrame) -> CatalogVersion:
+    v = CatalogVersion(version=1, catalog_mtime=None, template_mtime=None, catalog_df=df, built_at=0.0)
+    v.warm()
+    for ref, rows in v.match_indexes[3].items():
+        v.ref_grids[ref] = utils.build_ref_grid(rows)
+    return v
+
+
+def _assert_same_as_rebuild(old_raw: pd.DataFrame, new_raw: pd.DataFrame):
+    prev = _version(utils.normalize_catalog(old_raw))
+    new_df = utils.normalize_catalog(new_raw)
+    diff = diff_catalogs(prev.catalog_df, new_df)
+    out = update_catalog_artifacts(prev, new_df, diff)
+    got = CatalogVersion(version=2, catalog_mtime=None, template_mtime=None, built_at=0.0, **out)
+
+    assert got.ean_index == utils.build_ean_index(new_df)
+    assert got.match_indexes == utils.build_catalog_indexes(new_df)
+    assert got.search_blob.tolist() == utils.build_search_blob(new_df).tolist()
+    # Los grids heredados son los de refs intactas: iguales a reconstruirlos; los afectados se descartan
+    full_ref = got.match_indexes[3]
+    for ref, grid in got.ref_grids.items():
+        assert ref not in diff["refs"]
+        assert grid == utils.build_ref_grid(full_ref[ref])
+    # prev no se toca: las sesiones pueden seguir leyéndolo
+    assert prev.ean_index == utils.build_ean_index(prev.catalog_df)
+    return diff
+
+
+@pytest.mark.parametrize("change", [
+    add_row, remove_row, change_rows, move_ean_between_refs, ref_loses_last_row, add_duplicate_ean, all_changes,
+])
+def test_incremental_matches_full_rebuild(change):
+    _assert_same_as_rebuild(BASE, change(BASE))
+
+
+def test_diff_classifies_rows():
+    new = all_changes(BASE)
+    diff = diff_catalogs(utils.normalize_catalog(BASE), utils.normalize_catalog(new))
+    assert list(diff["added"]) == ["8400000000001"]
+    assert len(diff["removed"]) == 1 + 20  # una fila de REFS[1] y la referencia REFS[6] entera
+    moved = BASE.loc[_rows(BASE, REFS[4])[0], "EAN"]
+    assert moved in diff["changed"]
+    assert {REFS[0], REFS[1], REFS[2], REFS[3], REFS[4], REFS[5], REFS[6], REFS[7]} == diff["refs"]
+
+
+def test_ref_losing_last_row_disappears():
+    new_df = utils.normalize_catalog(ref_loses_last_row(BASE))
+    prev = _version(utils.normalize_catalog(BASE))
+    out = update_catalog_artifacts(prev, new_df, diff_catalogs(prev.catalog_df, new_df))
+    idx_exact, idx_ref_color, idx_ref_talla, idx_ref = out["artifacts"].values["match_indexes"]
+    assert REFS[6] not in idx_ref and REFS[6] not in out["ref_grids"]
+    assert not any(k[0] == REFS[6] for k in (*idx_exact, *idx_ref_color, *idx_ref_talla))
+
+
+def test_duplicate_ean_that_becomes_unique():
+    _assert_same_as_rebuild(add_duplicate_ean(BASE), BASE)
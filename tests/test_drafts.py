@@ -0,0 +1,73 @@
+# tests/test_drafts.py
+"""
+drafts.DraftStore: muchas sesiones (una por hilo, como en Streamlit) escribiendo a la vez su
+borrador en la misma base WAL; al recargar, cada carrito es exactamente el esperado.
+"""
+import threading
+from datetime import date
+
+import pytest
+
+import drafts
+
+N_SESSIONS = 16
+EDITS = 200
+
+
+@pytest.fixture
+def store(tmp_path):
+    return drafts.DraftStore(str(tmp_path / "drafts.sqlite3"))
+
+
+def test_concurrent_sessions_keep_their_carts(store):
+    expected, errors = {}, []
+
+    def session(i: int):
+        draft_id = f"stress-{i}"
+        cart = {}
+        try:
+            store.save_header(draft_id, f"REF-{i}", date.today(), "PET Almacén Badalona", "PET T001 Tienda Ibiza")
+            for k in range(EDITS):
+                ean = f"84{i:05d}{k % 50:06d}"
+                it = cart.setdefault(ean, {"EAN": ean, "Ref": str(i), "Nom": "", "Col": "", "Tal": "", "Cantidad": 0})
+                # Cada 7 ediciones se resta: hay líneas que llegan a 0 y se borran
+                it["Cantidad"] += 1 if k % 7 else -1
+                store.upsert_lines(draft_id, "carrito_manual", [it])
+                if it["Cantidad"] <= 0:
+                    cart.pop(ean)
+            expected[draft_id] = {e: v["Cantidad"] for e, v in cart.items()}
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(N_SESSIONS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(expected) == N_SESSIONS
+    for draft_id, cart in expected.items():
+        got = store.load_draft(draft_id)["carts"]["carrito_manual"]
+        assert {e: v["Cantidad"] for e, v in got.items()} == cart, draft_id
+
+
+def test_clear_cart_and_header(store):
+    store.save_header("d1", "REF-1", date(2026, 1, 2), "PET Almacén Badalona", "PET T001 Tienda Ibiza")
+    line = {"EAN": "1", "Ref": "r", "Nom": "n", "Col": "c", "Tal": "M", "Cantidad": 3}
+    store.upsert_lines("d1", "carrito_import", [line])
+    store.upsert_lines("d1", "carrito_manual", [line])
+    store.clear_cart("d1", "carrito_import")
+    got = store.load_draft("d1")
+    assert got["fecha"] == date(2026, 1, 2) and got["ref_peticion"] == "REF-1"
+    assert got["carts"]["carrito_import"] == {}
+    assert got["carts"]["carrito_manual"]["1"]["Cantidad"] == 3
+
+
+def test_list_drafts_filter_is_a_literal_prefix(store):
+    for i, ref in enumerate(["50%", "50x", "A_1", "AB1"]):
+        store.save_header(f"d{i}", ref, None, "o", "d")
+    assert set(store.list_drafts("50%")["ref_peticion"]) == {"50%"}
+    assert set(store.list_drafts("50")["ref_peticion"]) == {"50%", "50x"}
+    assert set(store.list_drafts("A_")["ref_peticion"]) == {"A_1"}
+    assert list(store.list_drafts("%")["ref_peticion"]) == []
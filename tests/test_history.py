@@ -0,0 +1,58 @@
+# tests/test_history.py
+"""
+history.HistoryStore: el id del traspaso deduplica descargas repetidas del mismo Excel.
+utils.resolve_reorder_lines: repetir un traspaso anterior contra el catálogo actual.
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import history
+import utils
+
+LINES = {"8445790000007": {"Ref": "214843", "Col": "Negro", "Tal": "M", "Cantidad": 2}}
+HEAD = ("d1", date(2026, 1, 2), "PET Almacén Badalona", "PET T001 Tienda Ibiza")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return history.HistoryStore(str(tmp_path / "historico.sqlite3"))
+
+
+def test_same_export_is_recorded_once(store):
+    assert store.record_transfer(*HEAD, "REF-1", LINES)
+    assert not store.record_transfer(*HEAD, "REF-1", LINES)
+    assert len(store.list_transfers()) == 1
+
+
+def test_other_ref_peticion_is_another_transfer(store):
+    assert store.record_transfer(*HEAD, "REF-1", LINES)
+    assert store.record_transfer(*HEAD, "REF-2", LINES)
+    assert sorted(store.find_transfers()["ref_peticion"]) == ["REF-1", "REF-2"]
+
+
+def test_reorder_resolves_against_current_catalogue(store):
+    lines = {
+        "8445790000007": {"Ref": "214843", "Col": "Negro", "Tal": "M", "Cantidad": 3},
+        "8445790000014": {"Ref": "214843", "Col": "Negro", "Tal": "L", "Cantidad": 1},
+        "8400000000001": {"Ref": "999", "Col": "Rojo", "Tal": "S", "Cantidad": 2},
+    }
+    store.record_transfer(*HEAD, "REF-1", lines)
+    tid = store.find_transfers()["transfer_id"].iloc[0]
+    # El catálogo actual renombró la variante y ya no tiene 8400000000001
+    cat = utils.normalize_catalog(pd.DataFrame(
+        [
+            ("8445790000007", "214843", "Nombre nuevo", "Negro", "M"),
+            ("8445790000014", "214843", "Nombre nuevo", "Negro", "L"),
+        ],
+        columns=["EAN", "Referencia", "Nombre", "Color", "Talla"],
+    ))
+
+    resolved, missing = utils.resolve_reorder_lines(store.transfer_lines(tid), cat, factor=0.5)
+    assert dict(zip(resolved["EAN"], resolved["Cantidad"])) == {"8445790000007": 2, "8445790000014": 1}
+    assert set(resolved["Nombre"]) == {"Nombre nuevo"}
+    assert missing["EAN"].tolist() == ["8400000000001"]
+
+    resolved, _ = utils.resolve_reorder_lines(store.transfer_lines(tid), cat, factor=2)
+    assert dict(zip(resolved["EAN"], resolved["Cantidad"])) == {"8445790000007": 6, "8445790000014": 2}
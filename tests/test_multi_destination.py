@@ -0,0 +1,55 @@
+# tests/test_multi_destination.py
+"""utils.detect_dest_column + read_petition_excel + match_petition_by_destination: peticiones multi-destino."""
+import io
+
+import pandas as pd
+import pytest
+
+import utils
+
+CAT = utils.normalize_catalog(pd.DataFrame(
+    [
+        ("8445790000007", "214843", "Bikini Top", "Negro", "M"),
+        ("8445790000014", "214843", "Bikini Top", "Negro", "L"),
+    ],
+    columns=["EAN", "Referencia", "Nombre", "Color", "Talla"],
+))
+INDEXES = utils.build_catalog_indexes(CAT)
+
+
+@pytest.mark.parametrize("cols,expected", [
+    (["Producto", "Cantidad", "Destino"], "Destino"),
+    (["Producto", "Tienda", "Cantidad", "Almacén destino"], "Almacén destino"),
+    (["Producto", "Cantidad", "Tienda"], "Tienda"),
+    (["Producto", "Cantidad", "Almacén origen", "Tienda"], "Tienda"),
+    (["Producto", "Cantidad", "Almacén origen"], None),
+    (["Producto", "Cantidad"], None),
+])
+def test_detect_dest_column(cols, expected):
+    assert utils.detect_dest_column(pd.DataFrame(columns=cols)) == expected
+
+
+def test_detect_dest_column_skips_excluded():
+    assert utils.detect_dest_column(pd.DataFrame(columns=["Destino", "Tienda"]), exclude=("Destino",)) == "Tienda"
+
+
+def test_petition_split_by_destination():
+    petition = pd.DataFrame({
+        "Producto": ["[214843] (Negro, M)", "[214843] (Negro, L)", "[214843] (Negro, M)", "[214843] (Negro, M)"],
+        "Cantidad": [2, 1, 5, 3],
+        "Destino": ["T001", "Marbella", "PET T001 Tienda Ibiza", "Luna"],
+    })
+    buf = io.BytesIO()
+    petition.to_excel(buf, index=False)
+    df = utils.read_petition_excel(buf.getvalue())
+    assert df["destino"].fillna("").tolist() == [
+        "PET T001 Tienda Ibiza", "PET T002 Tienda Marbella", "PET T001 Tienda Ibiza", "",
+    ]
+
+    per_dest, pending = utils.match_petition_by_destination(df, *INDEXES)
+    got = {d: [(m["EAN"], m["Cantidad"]) for m in lines] for d, lines in per_dest.items()}
+    assert got == {
+        "PET T001 Tienda Ibiza": [("8445790000007", 2), ("8445790000007", 5)],
+        "PET T002 Tienda Marbella": [("8445790000014", 1)],
+    }
+    assert [(p["qty"], p["reason"], p["destino"]) for p in pending] == [(3, "Destino no reconocido", None)]
@@ -0,0 +1,41 @@
+# tests/test_normalize.py
+"""
+Casos límite de utils.normalize_catalog (NaN, EAN numéricos, tallas en minúsculas, espacios) y
+equivalencia con el camino celda a celda sobre datos limpios. Los casos son los de bench.normalize.
+
+    python -m pytest -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+from bench.generators import make_catalog
+from bench.normalize import BASE_ROW, EDGE_CASES, per_cell
+
+
+@pytest.mark.parametrize("col,raw,expected", EDGE_CASES)
+def test_edge_case(col, raw, expected):
+    out = utils.normalize_catalog(pd.DataFrame([{**BASE_ROW, col: raw}], dtype=object))
+    assert str(out.at[0, col]) == expected
+
+
+@pytest.mark.parametrize("missing", [np.nan, None, "", "  "])
+def test_rows_without_ean_are_dropped(missing):
+    out = utils.normalize_catalog(pd.DataFrame([{**BASE_ROW, "EAN": missing}, BASE_ROW], dtype=object))
+    assert out["EAN"].tolist() == [BASE_ROW["EAN"]]
+
+
+def test_text_columns_as_read_by_read_excel():
+    # read_excel(dtype=str): texto con NaN en las celdas vacías
+    raw = pd.DataFrame([{**BASE_ROW, "Nombre": np.nan, "Talla": np.nan}, BASE_ROW])
+    raw = raw.apply(lambda c: c.astype("str").where(c.notna()))
+    out = utils.normalize_catalog(raw)
+    assert out.at[0, "Nombre"] == "" and out.at[0, "Talla"] == ""
+
+
+def test_matches_per_cell_on_clean_data():
+    clean = make_catalog(5_000)
+    a, b = utils.normalize_catalog(clean), per_cell(clean)
+    pd.testing.assert_frame_equal(a, b)
+    assert list(a["Talla"].cat.categories) == list(b["Talla"].cat.categories)
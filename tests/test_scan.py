@@ -0,0 +1,24 @@
+# tests/test_scan.py
+"""utils.parse_scan_codes + apply_scanned_eans: ráfagas del lector de códigos."""
+import utils
+
+VARIANT = {"EAN": "8445790000007", "Referencia": "214843", "Nombre": "Bikini Top", "Color": "Negro", "Talla": "m"}
+EAN_INDEX = {VARIANT["EAN"]: VARIANT}
+
+
+def test_parse_splits_on_any_separator():
+    assert utils.parse_scan_codes("  8445790000007\n8445790000007, 123;;456\t789 \n") == [
+        "8445790000007", "8445790000007", "123", "456", "789",
+    ]
+    assert utils.parse_scan_codes("") == [] and utils.parse_scan_codes(None) == []
+
+
+def test_apply_groups_repeats_and_reports_unknown():
+    cart = {}
+    added, unknown = utils.apply_scanned_eans(cart, ["8445790000007", "999", "8445790000007", "999"], EAN_INDEX)
+    assert added == 2 and unknown == ["999"]
+    assert cart["8445790000007"]["Cantidad"] == 2
+    assert cart["8445790000007"]["Tal"] == "M"
+
+    added, _ = utils.apply_scanned_eans(cart, ["8445790000007"], EAN_INDEX)
+    assert added == 1 and cart["8445790000007"]["Cantidad"] == 3
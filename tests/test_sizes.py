@@ -0,0 +1,29 @@
+# tests/test_sizes.py
+"""utils.size_sort_key + build_size_ranks + size_rank: orden natural de tallas."""
+import pandas as pd
+
+import utils
+
+ORDERED = ["2A", "6M", "10A", "12A", "XXS", "XS", "S", "M", "L", "XL", "XXL", "XXXL", "34", "36", "38", "40", "T.U.", "ÚNICA"]
+
+
+def test_sort_key_natural_order():
+    shuffled = ORDERED[::2] + ORDERED[1::2]
+    assert sorted(shuffled, key=utils.size_sort_key) == ORDERED
+    # Sin distinguir mayúsculas ni espacios
+    assert utils.size_sort_key(" xl ") == utils.size_sort_key("XL")
+    assert utils.size_sort_key("10a")[:2] == utils.size_sort_key("10A")[:2]
+
+
+def test_ranks_are_dense_and_follow_sort_key():
+    ranks = utils.build_size_ranks(["M", "38", "S", "M", None, "10A"])
+    assert ranks == {"10A": 0, "S": 1, "M": 2, "38": 3, "": 4}
+
+
+def test_size_rank_recomputes_for_sizes_missing_from_table():
+    ranks = utils.build_size_ranks(["S", "M", "L"])
+    s = pd.Series(["L", "S", "M"])
+    assert utils.size_rank(s, ranks).tolist() == [2, 0, 1]
+    # "XS" no está en la tabla del catálogo (línea descatalogada): se ordena igual
+    s = pd.Series(["L", "XS", "M"])
+    assert s.iloc[utils.size_rank(s, ranks).argsort()].tolist() == ["XS", "M", "L"]
@@ -0,0 +1,49 @@
+# tests/test_stock.py
+"""stock: lectura del snapshot, StockCheck.check por diferencias y cap_carts."""
+import pandas as pd
+
+import stock
+
+CSV = (
+    "Almacén;EAN;Stock\n"
+    "BAD;8445790000007;5\n"
+    "BAD;8445790000014.0;-2\n"
+    "BAD;8445790000007;1\n"
+    "IBI;8445790000007;9\n"
+    "Luna;8445790000021;3\n"
+).encode()
+
+
+def _line(ean, qty):
+    return {"EAN": ean, "Ref": "r", "Nom": "n", "Col": "c", "Tal": "M", "Cantidad": qty}
+
+
+def test_snapshot_groups_by_warehouse():
+    df, unknown = stock.read_stock_file(CSV, "stock.csv")
+    snap = stock.StockSnapshot(df, unknown_rows=unknown)
+    assert unknown == 1
+    assert snap.warehouses == ["PET Almacén Badalona", "PET Almacén Ibiza"]
+    bad = snap.stock_for("BAD")
+    assert bad.to_dict() == {"8445790000007": 6, "8445790000014": 0}
+    assert snap.stock_for("PET T001 Tienda Ibiza") is None
+
+
+def test_check_marks_shortfall_and_follows_cart():
+    chk = stock.StockCheck(pd.Series({"8445790000007": 6, "8445790000014": 0}), key=("v", "BAD"))
+    cart = {e: _line(e, q) for e, q in [("8445790000007", 8), ("8445790000014", 1), ("8400000000001", 2)]}
+    assert chk.sync(cart) == (3, 0)
+    out = chk.check(pd.DataFrame(list(cart.values())))
+    assert dict(zip(out["EAN"], zip(out["Stock"], out["Falta"]))) == {
+        "8445790000007": (6, 2), "8445790000014": (0, 1), "8400000000001": (0, 2),
+    }
+    cart.pop("8400000000001")
+    assert chk.sync(cart) == (0, 1) and set(chk.avail) == set(cart)
+
+
+def test_cap_carts_trims_first_cart_first():
+    man = {"A": _line("A", 3), "B": _line("B", 1)}
+    imp = {"A": _line("A", 4), "B": _line("B", 2)}
+    totals = {"A": _line("A", 7), "B": _line("B", 3)}
+    stock.cap_carts({"A": 2, "B": 0}, totals, [man, imp])
+    assert {e: it["Cantidad"] for e, it in man.items()} == {}
+    assert {e: it["Cantidad"] for e, it in imp.items()} == {"A": 2}
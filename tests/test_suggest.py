@@ -0,0 +1,64 @@
+# tests/test_suggest.py
+"""suggest.suggest_replenishment: ventana de ventas, cobertura, stock de destino/origen y cruce con el catálogo."""
+from datetime import date
+
+import pandas as pd
+
+import stock
+import suggest
+import utils
+
+CAT = utils.normalize_catalog(pd.DataFrame(
+    [
+        ("A", "214843", "Bikini Top", "Negro", "L"),
+        ("B", "214843", "Bikini Top", "Negro", "M"),
+        ("D", "214843", "Bikini Top", "Negro", "S"),
+    ],
+    columns=["EAN", "Referencia", "Nombre", "Color", "Talla"],
+))
+
+SALES_CSV = "\n".join([
+    "Fecha;Tienda;EAN;Unidades",
+    "2026-03-01;T001;A;100",  # fuera de la ventana de 7 días
+    "2026-03-10;T001;A;4",
+    "2026-03-14;T001;A;3",
+    "2026-03-12;T001;B;3",
+    "2026-03-13;T001;D;1",
+    "2026-03-13;T001;C;2",  # no está en catálogo
+    "2026-03-13;T002;A;50",  # otro destino
+]).encode()
+
+SALES = suggest.read_sales_file(SALES_CSV, "ventas.csv")
+
+
+def _qty(lines):
+    return dict(zip(lines["EAN"], lines["Cantidad"]))
+
+
+def test_window_cover_and_catalogue_join():
+    lines, missing = suggest.suggest_replenishment(SALES, CAT, "T001", cover_days=7, window_days=7)
+    assert _qty(lines) == {"D": 1, "B": 3, "A": 7}
+    # Orden Ref/Color/talla natural: S, M, L
+    assert lines["EAN"].tolist() == ["D", "B", "A"]
+    assert missing.to_dict("records") == [{"EAN": "C", "vendidas": 2}]
+
+    lines, _ = suggest.suggest_replenishment(SALES, CAT, "T001", cover_days=14, window_days=7, as_of=date(2026, 3, 12))
+    assert _qty(lines) == {"B": 6, "A": 8}
+
+
+def test_snapshot_subtracts_destination_and_caps_to_origin():
+    snap = stock.StockSnapshot(pd.DataFrame({
+        "almacen": ["PET T001 Tienda Ibiza"] * 2 + ["PET Almacén Badalona"] * 3,
+        "EAN": ["A", "B", "A", "B", "D"],
+        "stock": [2, 5, 3, 9, 9],
+    }))
+    lines, _ = suggest.suggest_replenishment(SALES, CAT, "T001", origen="BAD", cover_days=7, window_days=7, snapshot=snap)
+    assert _qty(lines) == {"D": 1, "A": 3}
+    row = lines.set_index("EAN").loc["A"]
+    assert (row["objetivo"], row["stock_destino"], row["stock_origen"]) == (7, 2, 3)
+
+
+def test_unknown_destination_is_empty():
+    lines, missing = suggest.suggest_replenishment(SALES, CAT, "PET T004 Tienda Madrid")
+    assert lines.empty and list(lines.columns) == suggest.SUGGEST_COLUMNS
+    assert missing.empty
@@ -0,0 +1,48 @@
+# tests/test_validation.py
+"""validation.validate_export_lines: qué bloquea el export y qué solo se informa."""
+import pandas as pd
+
+import validation
+
+VALID = "8445790000007"  # EAN-13 con dígito de control correcto
+INTERNAL = "214843-NEGRO-M"  # código interno del catálogo, no EAN-13
+
+
+def _line(ean, qty=1):
+    return {"EAN": ean, "Ref": "r", "Col": "c", "Tal": "t", "Cantidad": qty}
+
+
+def _problems(lines, ean_index):
+    clean, problems = validation.validate_export_lines({e: _line(e, q) for e, q in lines}, ean_index)
+    return clean, {(p, b) for p, b in zip(problems["Problema"], problems["Bloquea"])}
+
+
+def test_ean13_check_digit():
+    fmt, ok = validation.ean13_valid(pd.Series([VALID, "8445790000008", "123", "１２３４５６７８９０１２８"]))
+    assert fmt.tolist() == [True, True, False, False]
+    assert ok.tolist() == [True, False, False, False]
+
+
+def test_internal_catalogue_codes_do_not_block():
+    clean, found = _problems([(INTERNAL, 1), (VALID, 2)], {INTERNAL: {}, VALID: {}})
+    assert found == {(validation.PROBLEM_FORMAT, False)}
+    assert set(clean) == {INTERNAL, VALID}
+
+
+def test_unknown_and_malformed_codes_block():
+    _, found = _problems([("12345", 1), ("8445790000008", 1)], {VALID: {}})
+    assert (validation.PROBLEM_FORMAT, True) in found
+    assert (validation.PROBLEM_CHECKSUM, True) in found
+    assert (validation.PROBLEM_CATALOG, True) in found
+
+
+def test_format_blocks_without_catalogue():
+    _, found = _problems([(INTERNAL, 1)], None)
+    assert found == {(validation.PROBLEM_FORMAT, True)}
+
+
+def test_duplicates_merge_and_quantity_bounds():
+    clean, found = _problems([(VALID, 3), (VALID + ".0", 2), (" 8445790000014 ", 0)], {VALID: {}, "8445790000014": {}})
+    assert clean[VALID]["Cantidad"] == 5
+    assert (validation.PROBLEM_DUPLICATE, False) in found
+    assert (validation.PROBLEM_QTY, True) in found
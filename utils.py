@@ -3,12 +3,19 @@ from __future__ import annotations
 
 import io
 import re
+import uuid
+import zipfile
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import date
-from typing import Dict, Tuple, Optional, List
+from typing import Dict, Tuple, Optional, List, Iterable
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from perf import on_rerun, timed_fn
+
 try:
     import openpyxl
 except Exception:
@@ -56,12 +63,60 @@ TALLA_MAP = {
     "XXL": "XXL",
     "XXXL": "XXXL",
 }
+# Orden de las tallas de letra: el de TALLA_MAP
+LETTER_SIZE_ORDER = {t: i for i, t in enumerate(dict.fromkeys(TALLA_MAP.values()))}
+NUM_SIZE_REGEX = re.compile(r"^(\d+(?:[.,]\d+)?)([A-Z]*)$")
 TALLA_REGEX = re.compile(r"^\s*(XXS|XS|S|M|L|XL|XXL|XXXL|[0-9]{2,3}|[0-9]{1,2}[A-Z]?)\s*$", re.I)
 REF_BRACKET_REGEX = re.compile(r"\[(?P<ref>[^\]]+)\]")
 ATTR_PAREN_REGEX = re.compile(r"\((?P<attrs>[^)]+)\)\s*$")
+DEST_COLUMN_REGEX = re.compile(r"destin", re.I)
+# Sin columna "Destino": vale "Tienda"/"Almacén", pero nunca la de origen ("Almacén de origen")
+DEST_FALLBACK_REGEX = re.compile(r"tienda|almac", re.I)
+ORIGIN_COLUMN_REGEX = re.compile(r"origen", re.I)
+# Ficheros de stock y de ventas: cabeceras de EAN y de almacén, separadores de CSV admitidos
+EAN_COLUMN_REGEX = re.compile(r"ean|barcode|c[oó]d", re.I)
+WAREHOUSE_COLUMN_REGEX = re.compile(r"almac|warehouse|origen|tienda|store", re.I)
+CSV_SEPARATORS = ";,\t|"
+# Clave de persistencia del carrito importado de cada destino en modo multi-destino
+DEST_CART_PREFIX = "destino:"
+# Vistas de carrito: paginación en servidor; por encima de BULK_CART_LINES se abre en vista compacta
+CART_PAGE_SIZES = (25, 50, 100)
+COMPACT_PAGE_SIZES = (200, 500, 1000)
+BULK_CART_LINES = 300
+# Importación en segundo plano: filas por bloque de matching (progreso y cancelación) y refresco del panel
+IMPORT_CHUNK_ROWS = 2000
+IMPORT_POLL_SECONDS = 0.5
+# Columnas del catálogo muy repetidas (pocas refs/colores/tallas para muchas variantes): categóricas
+CATEGORY_COLUMNS = ["Referencia", "Nombre", "Color", "Talla"]
+TEMPLATE_HEADER = ["Fecha", "Almacén de origen", "Almacén de destino", "Observaciones", "EAN", "Cantidad"]
+SCAN_SPLIT_REGEX = re.compile(r"[\s,;]+")
+BULK_SPLIT_REGEX = r"\s*[;\t,|]\s*"
+BULK_SPACED_PAIR_REGEX = r"^(\S+)\s+(-?\d+)$"
+BULK_COLUMNS = ["line", "raw", "EAN", "Referencia", "Color", "Talla", "qty", "error"]
+PENDING_COLUMNS = ["raw", "qty", "ref", "color", "talla", "reason"]
+
+
+# Modo ligero (móvil): CSS mínimo, grid como tabla editable y vistas compactas
+LIGHT_CSS = (
+    "<style>.small{font-size:12px;color:#666}"
+    ".mono{font-family:ui-monospace,Menlo,Consolas,monospace}.card{padding:4px 0}</style>"
+)
 
 
 def ensure_style():
+    """
+    CSS común e interruptor de modo ligero (barra lateral; `?ligero=1` lo activa de entrada).
+    En modo ligero solo se envía LIGHT_CSS y las páginas omiten sus bloques <style>.
+    """
+    st.session_state.setdefault("light_mode", st.query_params.get("ligero") == "1")
+    st.session_state.light_mode = st.sidebar.toggle(
+        "Modo ligero (móvil)",
+        value=st.session_state.light_mode,
+        help="Menos elementos por rerun: grid como tabla editable, listas compactas y sin estilos extra.",
+    )
+    if st.session_state.light_mode:
+        st.markdown(LIGHT_CSS, unsafe_allow_html=True)
+        return
     st.markdown(
         """
 <style>
@@ -84,10 +139,17 @@ button[kind="secondary"] { font-size: 18px; font-weight: 700; }
 
 
 def init_state():
+    on_rerun()
+
     st.session_state.setdefault("cat_loaded", False)
-    st.session_state.setdefault("catalog_df", None)
-    st.session_state.setdefault("search_blob", None)
-    st.session_state.setdefault("tpl_bytes", None)
+    st.session_state.setdefault("catalog", None)
+    st.session_state.setdefault("cat_version", None)
+    st.session_state.setdefault("cart_orphans", [])
+    st.session_state.setdefault("stock_snapshot", None)
+    st.session_state.setdefault("stock_error", None)
+    st.session_state.setdefault("sales_df", None)
+    st.session_state.setdefault("sales_error", None)
+    st.session_state.setdefault("suggestion", None)
 
     st.session_state.setdefault("origen", ORIGIN_OPTIONS[0])
     st.session_state.setdefault("destino", DEST_OPTIONS[0])
@@ -96,16 +158,30 @@ def init_state():
 
     st.session_state.setdefault("carrito_import", {})
     st.session_state.setdefault("carrito_manual", {})
+    st.session_state.setdefault("carritos_destino", {})
 
-    st.session_state.setdefault("pending_rows", [])
+    st.session_state.setdefault("pending_rows", pending_frame())
+    st.session_state.setdefault("cart_rev", 0)
     st.session_state.setdefault("last_import_stats", None)
+    st.session_state.setdefault("import_job", None)
+    st.session_state.setdefault("import_notice", None)
+
+    st.session_state.setdefault("draft_id", uuid.uuid4().hex)
+    st.session_state.setdefault("draft_header", None)
+    st.session_state.setdefault("draft_error", None)
+    st.session_state.setdefault("history_error", None)
 
     st.session_state.setdefault("selected_ref", "")
     st.session_state.setdefault("search_query", "")
+    st.session_state.setdefault("scan_last", None)
+    st.session_state.setdefault("bulk_last", None)
+    st.session_state.setdefault("reorder_last", None)
+
+    collect_import_job()
 
 
 def norm_str(x: object) -> str:
-    if x is None:
+    if x is None or (isinstance(x, float) and x != x):
         return ""
     return str(x).strip()
 
@@ -124,12 +200,83 @@ def norm_talla(x: object) -> str:
     return TALLA_MAP.get(up, s)
 
 
+# Versiones por columnas (.str) de norm_*: operan sobre una Series entera, sin llamada Python por celda
+def norm_str_series(s: pd.Series) -> pd.Series:
+    # Rellenar antes de convertir: en pandas 2.x astype(str) deja NaN como el texto "nan"
+    return s.where(s.notna(), "").astype(str).str.strip()
+
+
+def norm_talla_series(s: pd.Series) -> pd.Series:
+    """Tallas de letra a su forma canónica (TALLA_MAP, sin distinguir mayúsculas); el resto, tal cual."""
+    s = norm_str_series(s)
+    return s.str.upper().map(TALLA_MAP).fillna(s)
+
+
+def norm_ean_series(s: pd.Series) -> pd.Series:
+    """EAN como texto: sin espacios ni el ".0" que deja un número leído como float."""
+    return norm_str_series(s).str.removesuffix(".0")
+
+
+CATALOG_NORMALIZERS = {
+    "Referencia": norm_str_series,
+    "Nombre": norm_str_series,
+    "Color": norm_str_series,
+    "Talla": norm_talla_series,
+}
+
+
+def normalize_by_value(s: pd.Series, norm) -> pd.Series:
+    """
+    Aplica `norm` (función de norm_*_series) solo a los valores distintos de la columna y reexpande
+    por códigos: la columna sale categórica (categorías ordenadas, como encode_catalog_columns).
+    Valores que normalizan igual (" m" y "M") acaban en la misma categoría.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    table = norm(pd.Series(uniques, dtype=object))
+    final, categories = pd.factorize(table, sort=True)
+    return pd.Series(pd.Categorical.from_codes(final[codes], categories=categories), index=s.index, name=s.name)
+
+
+def size_sort_key(talla: str) -> tuple:
+    """
+    Orden natural de tallas: edades/mixtas ("6M", "10A") por número, luego letras (XXS…XXXL)
+    en el orden de TALLA_MAP, luego numéricas (34, 36, 38…) y al final el resto (ÚNICA, T.U.…).
+    """
+    t = norm_str(talla).upper()
+    if t in LETTER_SIZE_ORDER:
+        return (1, LETTER_SIZE_ORDER[t], "", t)
+    m = NUM_SIZE_REGEX.match(t)
+    if m:
+        num = float(m.group(1).replace(",", "."))
+        return (0, num, m.group(2), t) if m.group(2) else (2, num, "", t)
+    return (3, 0, "", t)
+
+
+def build_size_ranks(tallas) -> Dict[str, int]:
+    """Tabla talla -> rango entero (0..n-1) según size_sort_key. Se calcula sobre los valores únicos."""
+    uniq = pd.unique(pd.Series(tallas, dtype=object).fillna("").astype(str))
+    return {t: i for i, t in enumerate(sorted(uniq, key=size_sort_key))}
+
+
+def size_rank(tallas: pd.Series, ranks: Optional[Dict[str, int]] = None) -> pd.Series:
+    """
+    Rango de cada talla para ordenar (sort_values(key=...)). Usa la tabla del catálogo si se da;
+    las tallas que no estén (líneas descatalogadas) obligan a recalcular la tabla con ellas.
+    """
+    tallas = tallas.fillna("").astype(str)
+    r = tallas.map(ranks) if ranks else None
+    if r is None or r.isna().any():
+        r = tallas.map(build_size_ranks(list(ranks or ()) + tallas.tolist()))
+    return r.astype("int32")
+
+
 def looks_like_talla(s: str) -> bool:
     if not s:
         return False
     return bool(TALLA_REGEX.match(s.strip()))
 
 
+@timed_fn("search_blob")
 def build_search_blob(cat: pd.DataFrame) -> pd.Series:
     blob = (
         cat["EAN"].astype(str).fillna("")
@@ -145,51 +292,132 @@ def build_search_blob(cat: pd.DataFrame) -> pd.Series:
     return blob
 
 
-@st.cache_data(show_spinner=False)
+@timed_fn("catalog_load")
 def _read_catalog_xlsx(path: str) -> pd.DataFrame:
-    df = pd.read_excel(path)
+    # dtype=str: EAN y referencias numéricas llegan como texto, sin pasar por float ("8445...0.0", "nan")
+    df = pd.read_excel(path, dtype=str)
     needed = {"EAN", "Referencia", "Nombre", "Color", "Talla"}
     missing = needed - set(df.columns)
     if missing:
         raise ValueError(f"Faltan columnas en catálogo: {', '.join(sorted(missing))}")
-
-    df = df.copy()
-    df["EAN"] = df["EAN"].astype(str).str.strip()
-    df["Referencia"] = df["Referencia"].map(norm_ref)
-    df["Nombre"] = df["Nombre"].map(norm_str)
-    df["Color"] = df["Color"].map(norm_color)
-    df["Talla"] = df["Talla"].map(norm_talla)
-    return df
+    return normalize_catalog(df)
 
 
-@st.cache_data(show_spinner=False)
-def _read_bytes(path: str) -> bytes:
-    with open(path, "rb") as f:
-        return f.read()
+@timed_fn("catalog_normalize")
+def normalize_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normaliza un catálogo recién leído: EAN como texto y CATEGORY_COLUMNS categóricas y normalizadas
+    por valor distinto (normalize_by_value), más TallaRank. Las filas sin EAN se descartan: carritos,
+    índices y export van por EAN.
+    """
+    out = df.copy()
+    out["EAN"] = norm_ean_series(df["EAN"])
+    for col, norm in CATALOG_NORMALIZERS.items():
+        out[col] = normalize_by_value(df[col], norm)
+    out = out[out["EAN"] != ""].reset_index(drop=True)
+    # Rango por categoría (pocas) y no por fila
+    ranks = build_size_ranks(out["Talla"].cat.categories)
+    out["TallaRank"] = np.array([ranks[t] for t in out["Talla"].cat.categories], dtype="int32")[
+        out["Talla"].cat.codes.to_numpy()
+    ]
+    return encode_catalog_columns(out)
+
+
+def encode_catalog_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pasa CATEGORY_COLUMNS a dtype category: cada valor distinto se guarda una vez y las
+    filas son códigos enteros, así que filtros por igualdad, isin y groupby operan sobre enteros.
+    EAN no se codifica (es único por fila).
+    """
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    return df
 
 
-def load_repo_data():
+@timed_fn("load_repo_data")
+def load_repo_data(wait: bool = False):
     """
-    Carga catálogo y plantilla desde el repo si existen.
+    Sincroniza la sesión con la versión publicada del catálogo/plantilla (catalog_store).
     - Catálogo: catalogue.xlsx (obligatorio para trabajar)
     - Plantilla: plantilla_pedido.xlsx (necesaria para exportar)
+    No parsea nada: la sesión guarda la versión (st.session_state.catalog) y cada artefacto se
+    deriva al primer acceso (get_catalog_df, get_search_blob, ...). Sin `wait`, si la precarga
+    aún no ha publicado nada se vuelve sin esperar; con `wait`, se espera a la primera carga.
+    Si el catálogo cambió desde el último rerun, se adopta la versión nueva y se marcan
+    las líneas de carrito cuyo EAN ya no existe (cart_orphans).
     """
-    if not st.session_state.get("cat_loaded"):
-        try:
-            df = _read_catalog_xlsx(DEFAULT_CATALOG_PATH)
-            st.session_state.catalog_df = df
-            st.session_state.search_blob = build_search_blob(df)
-            st.session_state.cat_loaded = True
-        except Exception:
-            st.session_state.cat_loaded = False
+    from catalog_store import find_orphan_eans, get_catalog_store
+
+    store = get_catalog_store()
+    v = store.ensure_loaded() if wait else store.current
+    if v is None:
+        return None
+    if st.session_state.get("cat_version") == v.version:
+        return st.session_state.catalog
+
+    prev = st.session_state.get("cat_version")
+    st.session_state.catalog = v
+    st.session_state.cat_loaded = v.cat_loaded
+    st.session_state.cat_version = v.version
+
+    if prev is not None:
+        # También los carritos aparcados de los demás destinos (multi-destino)
+        st.session_state.cart_orphans = find_orphan_eans(
+            [st.session_state.get("carrito_import"), st.session_state.get("carrito_manual"),
+             *(st.session_state.get("carritos_destino") or {}).values()],
+            v.ean_index,
+        )
+        st.toast(f"Catálogo actualizado (versión {v.version}).", icon="🔄")
+    return v
+
+
+# -----------------------------
+# Accesos perezosos al catálogo de la sesión
+# -----------------------------
+# Solo las páginas que llaman a estos accesos esperan por el catálogo; el resto pinta enseguida.
+# Durante un rerun se usa siempre la versión que adoptó la sesión (la nueva entra en el siguiente).
+def session_catalog():
+    v = st.session_state.get("catalog")
+    return v if v is not None else load_repo_data(wait=True)
+
+
+def catalog_loaded() -> bool:
+    v = session_catalog()
+    return v is not None and v.cat_loaded
+
+
+def catalog_ready() -> bool:
+    """Sin esperar: True si ya hay una versión publicada (con o sin catálogo válido)."""
+    return load_repo_data() is not None
+
+
+def get_catalog_df() -> Optional[pd.DataFrame]:
+    v = session_catalog()
+    return v.catalog_df if v is not None else None
 
-    if st.session_state.get("tpl_bytes") is None:
-        try:
-            st.session_state.tpl_bytes = _read_bytes(DEFAULT_TEMPLATE_PATH)
-        except Exception:
-            st.session_state.tpl_bytes = None
 
+def get_search_blob() -> Optional[pd.Series]:
+    v = session_catalog()
+    return v.search_blob if v is not None else None
 
+
+def get_ean_index() -> Optional[Dict[str, dict]]:
+    v = session_catalog()
+    return v.ean_index if v is not None else None
+
+
+def get_match_indexes():
+    v = session_catalog()
+    return v.match_indexes if v is not None else None
+
+
+def get_template() -> Optional[bytes]:
+    v = session_catalog()
+    return v.tpl_bytes if v is not None else None
+
+
+@timed_fn("build_catalog_indexes")
 def build_catalog_indexes(cat: pd.DataFrame):
     idx_exact: Dict[Tuple[str, str, str], dict] = {}
     idx_ref_color: Dict[Tuple[str, str], List[dict]] = {}
@@ -212,6 +440,205 @@ def build_catalog_indexes(cat: pd.DataFrame):
     return idx_exact, idx_ref_color, idx_ref_talla, idx_ref
 
 
+@timed_fn("ean_index")
+def build_ean_index(cat: pd.DataFrame) -> Dict[str, dict]:
+    """
+    Índice hash EAN -> variante (mismas claves que las filas de build_catalog_indexes).
+    Se construye una vez por carga de catálogo; cada lectura es O(1).
+    """
+    cols = ["EAN", "Referencia", "Nombre", "Color", "Talla"]
+    records = cat[cols].astype(str).to_dict("records")
+    return {r["EAN"]: r for r in records if r["EAN"]}
+
+
+def parse_scan_codes(text: str) -> List[str]:
+    """Separa la ráfaga del lector (saltos de línea, espacios, comas o ';') en EANs."""
+    return [c for c in SCAN_SPLIT_REGEX.split(text or "") if c]
+
+
+def apply_scanned_eans(cart: Dict[str, dict], codes: List[str], ean_index: Dict[str, dict]) -> Tuple[int, List[str]]:
+    """
+    Suma al carrito una unidad por cada EAN escaneado (repetidos se agrupan antes).
+    Devuelve (unidades añadidas, EANs desconocidos).
+    """
+    added = 0
+    unknown = []
+    for ean, n in Counter(codes).items():
+        variant = ean_index.get(ean)
+        if variant is None:
+            unknown.append(ean)
+            continue
+        add_to_cart(cart, variant, n)
+        added += n
+    return added, unknown
+
+
+def parse_bulk_lines(text: str) -> pd.DataFrame:
+    """
+    Parsea una lista pegada en una sola pasada vectorizada. Formatos por línea:
+    - EAN                  (1 ud)
+    - EAN;cantidad         (también "EAN cantidad", tabulador, coma o '|')
+    - Ref;Color;Talla;cantidad
+    Devuelve una fila por línea no vacía con columna `error` ("" si es válida).
+    """
+    raw = pd.Series((text or "").splitlines(), dtype=object).astype(str).str.strip()
+    df = pd.DataFrame({"line": range(1, len(raw) + 1), "raw": raw})
+    df = df[df["raw"] != ""].reset_index(drop=True)
+    if df.empty:
+        return pd.DataFrame(columns=BULK_COLUMNS)
+
+    norm = df["raw"].str.replace(BULK_SPACED_PAIR_REGEX, r"\1;\2", regex=True)
+    fields = norm.str.split(BULK_SPLIT_REGEX, regex=True, expand=True)
+    fields = fields.mask(fields == "")
+    # Un quinto campo no se descarta en silencio: la línea se rechaza entera
+    too_many = fields.notna().sum(axis=1) > 4
+    parts = fields.reindex(columns=range(4))
+    nf = parts.notna().sum(axis=1)
+
+    is_ean = nf.isin([1, 2]) & ~parts[0].fillna("").str.contains(r"\s")
+    is_var = nf == 4
+    qty_raw = parts[1].where(nf == 2, parts[3].where(is_var, "1"))
+    qty = pd.to_numeric(qty_raw, errors="coerce")
+
+    df["EAN"] = parts[0].where(is_ean, "").fillna("").str.replace(r"\.0$", "", regex=True)
+    df["Referencia"] = parts[0].where(is_var, "").fillna("")
+    df["Color"] = parts[1].where(is_var, "").fillna("")
+    talla = parts[2].where(is_var, "").fillna("")
+    df["Talla"] = talla.str.upper().map(TALLA_MAP).fillna(talla)
+    df["qty"] = qty.fillna(0).astype(int)
+
+    err = pd.Series("", index=df.index)
+    err = err.mask(too_many, "Demasiados campos (máximo 4: Ref;Color;Talla;cant)")
+    err = err.mask((err == "") & ~(is_ean | is_var), "Formato no reconocido (usa EAN;cant o Ref;Color;Talla;cant)")
+    err = err.mask((err == "") & (qty.isna() | (qty != qty.round())), "Cantidad no numérica")
+    err = err.mask((err == "") & (df["qty"] <= 0), "Cantidad debe ser > 0")
+    df["error"] = err
+    return df[BULK_COLUMNS]
+
+
+@timed_fn("bulk_resolve")
+def resolve_bulk_lines(lines: pd.DataFrame, cat: pd.DataFrame, ean_index: Dict[str, dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Resuelve las líneas de parse_bulk_lines contra el catálogo:
+    - EAN por el índice hash (map vectorizado)
+    - Ref/Color/Talla por join (sin distinguir mayúsculas: "10a" encuentra "10A")
+    Devuelve (líneas resueltas con columnas de variante + Cantidad, informe de errores por línea).
+    """
+    variant_cols = ["EAN", "Referencia", "Nombre", "Color", "Talla"]
+    lines = lines.copy()
+    ok = lines["error"] == ""
+
+    by_ean = ok & (lines["EAN"] != "")
+    hits = lines.loc[by_ean, "EAN"].map(ean_index)
+    found_ean = hits.dropna()
+    res_ean = pd.DataFrame(found_ean.tolist(), index=found_ean.index, columns=variant_cols)
+    lines.loc[hits[hits.isna()].index, "error"] = "EAN no encontrado en catálogo"
+
+    by_var = ok & (lines["EAN"] == "")
+    res_var = pd.DataFrame(columns=variant_cols)
+    if by_var.any():
+        keys = cat[variant_cols].copy()
+        keys["_k"] = (
+            keys["Referencia"].str.lower()
+            + "\x1f"
+            + keys["Color"].str.lower()
+            + "\x1f"
+            + keys["Talla"].astype(str).str.upper()
+        )
+        keys = keys.drop_duplicates(subset="_k")
+        want = lines.loc[by_var]
+        want_k = (
+            want["Referencia"].str.lower() + "\x1f" + want["Color"].str.lower() + "\x1f" + want["Talla"].str.upper()
+        )
+        pos = pd.Index(keys["_k"]).get_indexer(want_k)
+        found = pos >= 0
+        res_var = keys.iloc[pos[found]][variant_cols].set_index(want.index[found])
+        lines.loc[want.index[~found], "error"] = "No existe esa variante (ref/color/talla) en catálogo"
+
+    resolved = pd.concat([res_ean, res_var])
+    resolved["Cantidad"] = lines.loc[resolved.index, "qty"].astype(int)
+    resolved = resolved.sort_index()
+    errors = lines.loc[lines["error"] != "", ["line", "raw", "error"]]
+    return resolved, errors
+
+
+def resolve_reorder_lines(lines: pd.DataFrame, cat: pd.DataFrame, factor: float = 1.0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Prepara las líneas de un traspaso anterior (HistoryStore.transfer_lines) para el carrito:
+    - join vectorizado por EAN contra el catálogo actual (los datos de la variante salen del catálogo)
+    - cantidades escaladas por `factor`, redondeadas y con mínimo 1 ud
+    Devuelve (líneas con columnas de variante + Cantidad, líneas descatalogadas).
+    """
+    variant_cols = ["EAN", "Referencia", "Nombre", "Color", "Talla"]
+    keys = cat[variant_cols].drop_duplicates(subset=["EAN"])
+    pos = pd.Index(keys["EAN"]).get_indexer(lines["EAN"].astype(str))
+    found = pos >= 0
+
+    resolved = keys.iloc[pos[found]].reset_index(drop=True)
+    qty = (lines.loc[found, "qty"].astype(float) * float(factor) + 0.5) // 1
+    resolved["Cantidad"] = qty.clip(lower=1).astype(int).to_numpy()
+    return resolved, lines.loc[~found].reset_index(drop=True)
+
+
+def build_ref_grid(rows: List[dict]) -> dict:
+    """Datos del grid Color×Talla de una referencia a partir de sus filas de idx_ref."""
+    return {
+        "nombre": rows[0].get("Nombre", "") if rows else "",
+        "colors": sorted({r["Color"] for r in rows}),
+        "tallas": sorted({r["Talla"] for r in rows}, key=size_sort_key),
+        "var_map": {(r["Color"], r["Talla"]): r for r in rows},
+    }
+
+
+@timed_fn("grid_build")
+def get_ref_grid(ref: str) -> Optional[dict]:
+    """
+    Grid de la referencia desde la caché de la versión de catálogo (se construye al primer acceso).
+    Usa idx_ref: no recorre el catálogo entero.
+    """
+    v = session_catalog()
+    if v is None or not v.cat_loaded:
+        return None
+    g = v.ref_grids.get(ref)
+    if g is None:
+        rows = v.match_indexes[3].get(ref)
+        if not rows:
+            return None
+        g = v.ref_grids[ref] = build_ref_grid(rows)
+    return g
+
+
+def ref_grid_frame(grid: dict, cart: Dict[str, dict]) -> pd.DataFrame:
+    """Grid Talla × Color con las cantidades del carrito (vacío donde no existe la variante)."""
+    df = pd.DataFrame(index=pd.Index(grid["tallas"], name="Talla"), columns=grid["colors"], dtype="Int64")
+    for (col, talla), v in grid["var_map"].items():
+        df.at[talla, col] = int(cart.get(v["EAN"], {}).get("Cantidad", 0))
+    return df
+
+
+def apply_grid_edits(ref: str, key: str, cart_name: str = "carrito_manual"):
+    """
+    Callback del grid editable (modo ligero): fija en el carrito las cantidades editadas
+    (valores absolutos por celda). Las celdas sin variante se ignoran.
+    """
+    grid = get_ref_grid(ref)
+    edits = (st.session_state.get(key) or {}).get("edited_rows", {})
+    if grid is None or not edits:
+        return
+    cart = st.session_state[cart_name]
+    changed = []
+    for row, cols in edits.items():
+        talla = grid["tallas"][int(row)]
+        for col, value in cols.items():
+            variant = grid["var_map"].get((col, talla))
+            if variant is None:
+                continue
+            new = max(0, int(value or 0))
+            add_to_cart(cart, variant, new - int(cart.get(variant["EAN"], {}).get("Cantidad", 0)))
+            changed.append(variant["EAN"])
+    persist_cart_lines(cart_name, changed)
+
+
 def parse_petition_line(raw: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     if not raw:
         return None, None, None
@@ -260,6 +687,49 @@ def detect_qty_column(df: pd.DataFrame) -> str:
     return cols[0]
 
 
+def detect_dest_column(df: pd.DataFrame, exclude=()) -> Optional[str]:
+    """
+    Columna de destino (multi-destino) por nombre de cabecera: 'Destino' antes que nada; si no hay,
+    'Tienda' o 'Almacén' que no sean de origen.
+    """
+    cols = [c for c in df.columns if c not in exclude]
+    for c in cols:
+        if DEST_COLUMN_REGEX.search(str(c)):
+            return c
+    for c in cols:
+        if DEST_FALLBACK_REGEX.search(str(c)) and not ORIGIN_COLUMN_REGEX.search(str(c)):
+            return c
+    return None
+
+
+def pick_column(cols, regex, exclude=()) -> Optional[str]:
+    """Primera cabecera de `cols` que casa con `regex` (sin contar las de `exclude`)."""
+    for c in cols:
+        if c not in exclude and regex.search(str(c)):
+            return c
+    return None
+
+
+def read_table_file(file_bytes: bytes, name: str = "") -> pd.DataFrame:
+    """
+    xlsx o CSV/TXT, todo como texto. En CSV el separador es el de CSV_SEPARATORS que más aparece
+    en la primera línea.
+    """
+    if name.lower().endswith((".csv", ".txt")):
+        head = file_bytes[:4096].decode("utf-8", errors="ignore").split("\n", 1)[0]
+        sep = max(CSV_SEPARATORS, key=head.count)
+        return pd.read_csv(io.BytesIO(file_bytes), sep=sep, dtype=str)
+    return pd.read_excel(io.BytesIO(file_bytes), dtype=str)
+
+
+def match_warehouse_series(s: pd.Series) -> pd.Series:
+    """match_warehouse por valor distinto: pocos almacenes repetidos en muchas filas."""
+    raw = s.fillna("")
+    uniq = raw.unique()
+    return raw.map(dict(zip(uniq, (match_warehouse(v) for v in uniq))))
+
+
+@timed_fn("read_petition_excel")
 def read_petition_excel(file_bytes: bytes) -> pd.DataFrame:
     df = pd.read_excel(io.BytesIO(file_bytes))
     cols = list(df.columns)
@@ -267,11 +737,16 @@ def read_petition_excel(file_bytes: bytes) -> pd.DataFrame:
         return pd.DataFrame(columns=["raw", "qty"])
     raw_col = cols[0]
     qty_col = detect_qty_column(df)
-    return pd.DataFrame(
+    out = pd.DataFrame(
         {"raw": df[raw_col], "qty": pd.to_numeric(df[qty_col], errors="coerce").fillna(0).astype(int)}
     )
+    dest_col = detect_dest_column(df, exclude=(raw_col, qty_col))
+    if dest_col is not None:
+        out["destino"] = df[dest_col].map(match_warehouse)
+    return out
 
 
+@timed_fn("matching")
 def match_petition_to_catalog(petition_df: pd.DataFrame, idx_exact, idx_ref_color, idx_ref_talla, idx_ref):
     matched = []
     pending = []
@@ -332,6 +807,182 @@ def match_petition_to_catalog(petition_df: pd.DataFrame, idx_exact, idx_ref_colo
     return matched, pending
 
 
+@timed_fn("matching_multi")
+def match_petition_by_destination(petition_df: pd.DataFrame, idx_exact, idx_ref_color, idx_ref_talla, idx_ref):
+    """
+    Multi-destino: reparte la petición por la columna `destino` y matchea cada grupo contra
+    los mismos índices (compartidos, no se reconstruyen). Devuelve ({destino: matched}, pending);
+    cada pendiente lleva su destino. Filas con destino no reconocido quedan todas pendientes.
+    """
+    per_dest: Dict[str, List[dict]] = {}
+    pending_all: List[dict] = []
+    dest = petition_df["destino"].fillna("")
+    for d, grp in petition_df.groupby(dest, sort=False):
+        if not d:
+            for raw, qty in zip(grp["raw"].map(norm_str), grp["qty"].astype(int)):
+                if qty > 0 and "[" in raw:
+                    ref, color, talla = parse_petition_line(raw)
+                    pending_all.append({"raw": raw, "qty": int(qty), "ref": ref, "color": color, "talla": talla,
+                                        "reason": "Destino no reconocido", "destino": None})
+            continue
+        matched, pending = match_petition_to_catalog(grp, idx_exact, idx_ref_color, idx_ref_talla, idx_ref)
+        per_dest.setdefault(d, []).extend(matched)
+        pending_all += [{**p, "destino": d} for p in pending]
+    return per_dest, pending_all
+
+
+def slice_match_indexes(match_indexes, refs: Iterable[str]):
+    """
+    Subconjunto de los índices de match con solo las referencias dadas. Es lo que viaja a un
+    proceso del pool para matchear una petición (el índice completo sería caro de serializar).
+    """
+    idx_exact, idx_ref_color, idx_ref_talla, idx_ref = match_indexes
+    out = ({}, {}, {}, {})
+    for ref in refs:
+        rows = idx_ref.get(ref)
+        if not rows:
+            continue
+        out[3][ref] = rows
+        for r in rows:
+            k_exact, k_color, k_talla = (ref, r["Color"], r["Talla"]), (ref, r["Color"]), (ref, r["Talla"])
+            out[0][k_exact] = idx_exact[k_exact]
+            out[1][k_color] = idx_ref_color[k_color]
+            out[2][k_talla] = idx_ref_talla[k_talla]
+    return out
+
+
+def petition_refs(petition_df: pd.DataFrame) -> set:
+    return {parse_petition_line(raw)[0] for raw in petition_df["raw"].map(norm_str) if "[" in raw}
+
+
+def match_petition_chunk(chunk: pd.DataFrame, match_indexes, multi: bool):
+    """Tarea del pool: matchea un bloque de petición (un destino o multi-destino)."""
+    if multi:
+        return match_petition_by_destination(chunk, *match_indexes)
+    return match_petition_to_catalog(chunk, *match_indexes)
+
+
+def run_petition_import(job, raw: bytes, match_indexes) -> dict:
+    """
+    Trabajo de importación (jobs.JobManager). El cálculo va al pool de procesos compartido
+    (jobs.Scheduler, prioridad de importación): primero la lectura del Excel y después el
+    matching por bloques de IMPORT_CHUNK_ROWS filas, cada uno con los índices recortados a sus
+    referencias. Informa progreso y atiende cancelación entre tareas.
+    No toca session_state; el resultado se aplica con apply_import_result().
+    """
+    from jobs import PRIORITY_IMPORT, get_scheduler
+
+    pool = get_scheduler()
+    job.report(0.05, "Leyendo Excel…")
+    pet_df = job.wait(pool.submit(read_petition_excel, raw, priority=PRIORITY_IMPORT, block=True))
+    if pet_df is None or len(pet_df) == 0:
+        raise ValueError(
+            "El Excel se ha leído pero no se obtienen filas útiles (posible tabla dinámica/cabecera rara). "
+            f"Columnas detectadas: {list(getattr(pet_df, 'columns', []))}"
+        )
+
+    multi = "destino" in pet_df.columns
+    per_dest: Dict[str, List[dict]] = {}
+    matched: List[dict] = []
+    pending: List[dict] = []
+    n = len(pet_df)
+    for start in range(0, n, IMPORT_CHUNK_ROWS):
+        job.report(0.3 + 0.65 * start / n, f"Cruzando con catálogo… {start}/{n} filas")
+        chunk = pet_df.iloc[start:start + IMPORT_CHUNK_ROWS]
+        idx = slice_match_indexes(match_indexes, petition_refs(chunk))
+        part, pend = job.wait(pool.submit(match_petition_chunk, chunk, idx, multi, priority=PRIORITY_IMPORT, block=True))
+        if multi:
+            for dest, lines in part.items():
+                per_dest.setdefault(dest, []).extend(lines)
+        else:
+            matched.extend(part)
+        pending.extend(pend)
+
+    job.report(1.0, "Listo.")
+    return {"per_dest": per_dest if multi else None, "matched": matched, "pending": pending}
+
+
+def apply_import_result(result: dict):
+    """Vuelca el resultado de run_petition_import en los carritos importados y pendientes de la sesión."""
+    per_dest = result["per_dest"]
+    carried, carried_to = 0, None
+    if per_dest is not None:
+        # Multi-destino: un match compartido, un carrito importado por destino
+        matched = [m for lines in per_dest.values() for m in lines]
+        prev = st.session_state.carrito_import
+        if not st.session_state.carritos_destino and prev:
+            # Primera importación multi-destino con líneas ya importadas: pasan al carrito del destino
+            # activo (y al mismo borrador) en vez de perderse al cambiar carrito_import de objeto
+            persist_cart_clear("carrito_import")
+            st.session_state.carritos_destino[st.session_state.destino] = prev
+            persist_cart_lines(f"{DEST_CART_PREFIX}{st.session_state.destino}", list(prev), cart=prev)
+            carried, carried_to = len(prev), st.session_state.destino
+        for dest, lines in per_dest.items():
+            cart = st.session_state.carritos_destino.setdefault(dest, {})
+            for m in lines:
+                add_to_cart(cart, m, int(m["Cantidad"]))
+            persist_cart_lines(f"{DEST_CART_PREFIX}{dest}", {m["EAN"] for m in lines}, cart=cart)
+        if per_dest and st.session_state.destino not in per_dest:
+            st.session_state.destino = next(iter(per_dest))
+        sync_active_destination()
+    else:
+        matched = result["matched"]
+        for m in matched:
+            add_to_cart(st.session_state.carrito_import, m, int(m["Cantidad"]))
+        persist_cart_lines("carrito_import", {m["EAN"] for m in matched})
+
+    st.session_state.pending_rows = pending_frame(result["pending"])
+    persist_pending()
+    st.session_state.last_import_stats = {
+        "matched_lines": len(matched),
+        "pending_lines": len(result["pending"]),
+        "added_lines": len(matched),
+        "carried_lines": carried,
+        "carried_to": carried_to,
+    }
+
+
+def apply_suggestion(lines: pd.DataFrame):
+    """
+    Sustituye el carrito importado (el del destino activo en multi-destino) por las líneas de una
+    sugerencia de reposición (columnas de variante + Cantidad).
+    """
+    cart = st.session_state.carrito_import
+    cart.clear()
+    persist_cart_clear("carrito_import")
+    n = add_lines_to_cart(cart, lines)
+    persist_cart_lines("carrito_import", lines["EAN"].unique())
+    st.session_state.last_import_stats = {"matched_lines": n, "pending_lines": 0, "added_lines": n}
+
+
+def collect_import_job():
+    """
+    Si el trabajo de importación de la sesión terminó, aplica su resultado (en cualquier página)
+    y deja el aviso en import_notice. Se llama en cada rerun desde init_state.
+    """
+    job_id = st.session_state.get("import_job")
+    if not job_id:
+        return
+    from jobs import CANCELLED, DONE, get_job_manager
+
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        st.session_state.import_job = None
+        return
+    if not job.finished:
+        return
+    if job.status == DONE:
+        apply_import_result(job.result)
+        st.session_state.import_notice = ("success", "Importación aplicada.", None)
+    elif job.status == CANCELLED:
+        st.session_state.import_notice = ("info", "Importación cancelada; no se ha aplicado nada.", None)
+    else:
+        st.session_state.import_notice = ("error", f"Error en la importación: {job.error}", job.traceback)
+    st.session_state.import_job = None
+    manager.forget(job_id)
+
+
 def add_to_cart(cart: Dict[str, dict], variant: dict, qty: int):
     ean = norm_str(variant.get("EAN", ""))
     if not ean:
@@ -354,13 +1005,228 @@ def add_to_cart(cart: Dict[str, dict], variant: dict, qty: int):
         cart.pop(ean, None)
 
 
+def add_lines_to_cart(cart: Dict[str, dict], lines: pd.DataFrame) -> int:
+    """
+    Mezcla en el carrito un lote de variantes (columnas de catálogo + Cantidad).
+    Agrupa por EAN antes de tocar el carrito: una operación por EAN, no por línea.
+    """
+    if lines is None or lines.empty:
+        return 0
+    grouped = lines.groupby("EAN", sort=False).agg(
+        Referencia=("Referencia", "first"),
+        Nombre=("Nombre", "first"),
+        Color=("Color", "first"),
+        Talla=("Talla", "first"),
+        Cantidad=("Cantidad", "sum"),
+    ).reset_index()
+    for v in grouped.to_dict("records"):
+        add_to_cart(cart, v, int(v["Cantidad"]))
+    return len(grouped)
+
+
+@timed_fn("cart_to_df")
 def cart_to_df(cart: Dict[str, dict]) -> pd.DataFrame:
     if not cart:
         return pd.DataFrame(columns=["EAN", "Ref", "Nom", "Col", "Tal", "Cantidad"])
     df = pd.DataFrame(list(cart.values()))
-    return df[["EAN", "Ref", "Nom", "Col", "Tal", "Cantidad"]].sort_values(["Ref", "Col", "Tal"])
+    # Sin esperar al catálogo: si la sesión aún no tiene versión, size_rank calcula el orden con las tallas del carrito
+    v = st.session_state.get("catalog")
+    ranks = v.size_ranks if v is not None else None
+    return df[["EAN", "Ref", "Nom", "Col", "Tal", "Cantidad"]].sort_values(
+        ["Ref", "Col", "Tal"], key=lambda s: size_rank(s, ranks) if s.name == "Tal" else s
+    )
+
+
+# -----------------------------
+# Vistas columnares de la sesión (cacheadas por versión)
+# -----------------------------
+# Los carritos siguen siendo dicts (ediciones O(1) por EAN), pero las páginas pintan DataFrames.
+# Toda modificación de un carrito termina en persist_cart_lines/persist_cart_clear (borradores),
+# que suben cart_rev: mientras no cambie, los DataFrames de la sesión se reutilizan tal cual.
+def touch_carts():
+    st.session_state.cart_rev = st.session_state.get("cart_rev", 0) + 1
+
+
+def session_cached(name: str, key: tuple, build):
+    """build() una vez por sesión mientras `key` no cambie; el resultado se comparte, no mutar."""
+    cache = st.session_state.setdefault("_columnar_cache", {})
+    hit = cache.get(name)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    value = build()
+    cache[name] = (key, value)
+    return value
+
+
+def cart_frame(name: str, cart: Dict[str, dict]) -> pd.DataFrame:
+    """cart_to_df de la sesión, reconstruido solo si cambió el carrito o el catálogo. No mutar."""
+    key = (id(cart), st.session_state.get("cart_rev", 0), st.session_state.get("cat_version"))
+    return session_cached(f"frame:{name}", key, lambda: cart_to_df(cart))
+
+
+def merged_cart() -> Dict[str, dict]:
+    """merge_carts(carrito_import, carrito_manual) de la sesión, reconstruido solo si cambió algún carrito."""
+    imp, man = st.session_state.carrito_import, st.session_state.carrito_manual
+    key = (id(imp), id(man), st.session_state.get("cart_rev", 0))
+    return session_cached("merged", key, lambda: merge_carts(imp, man))
+
+
+def pending_frame(rows: Optional[List[dict]] = None) -> pd.DataFrame:
+    """Pendientes de importación en columnas: se construye al importar/reanudar, no en cada rerun."""
+    df = pd.DataFrame(rows or [])
+    return df.reindex(columns=PENDING_COLUMNS + [c for c in df.columns if c not in PENDING_COLUMNS])
+
+
+def filter_cart_df(df: pd.DataFrame, ref: str = "", query: str = "") -> pd.DataFrame:
+    """Filtro vectorizado de líneas de carrito por referencia exacta y/o texto (ref, nombre, color, talla, EAN)."""
+    if ref:
+        df = df[df["Ref"] == ref]
+    q = (query or "").strip().lower()
+    if q:
+        blob = (df["Ref"] + " " + df["Nom"] + " " + df["Col"] + " " + df["Tal"] + " " + df["EAN"]).str.lower()
+        df = df[blob.str.contains(q, regex=False)]
+    return df
+
+
+class CartTextIndex:
+    """
+    Índice de trigramas sobre las líneas de un carrito (texto: ref, nombre, color, talla, EAN).
+    Se mantiene por diferencias con sync(): solo se indexan/desindexan los EAN que entran o salen.
+    El texto sale de la variante del catálogo (`variants`, índice EAN) si existe, o de la línea del
+    carrito. El de un EAN que sigue en el carrito no se relee: el índice vale para una versión de
+    catálogo (`cat_version`) y se rehace entero cuando cambia.
+    """
+
+    N = 3
+
+    def __init__(self, cat_version: Optional[int] = None, variants: Optional[Dict[str, dict]] = None):
+        self.cat_version = cat_version
+        self.variants = variants or {}
+        self.docs: Dict[str, str] = {}
+        self.grams: Dict[str, set] = {}
+
+    @staticmethod
+    def line_text(it: dict) -> str:
+        return f"{it.get('Ref', '')} {it.get('Nom', '')} {it.get('Col', '')} {it.get('Tal', '')} {it.get('EAN', '')}".lower()
+
+    @staticmethod
+    def variant_text(v: dict) -> str:
+        return f"{v['Referencia']} {v['Nombre']} {v['Color']} {v['Talla']} {v['EAN']}".lower()
+
+    def _grams(self, text: str) -> set:
+        return {text[i:i + self.N] for i in range(len(text) - self.N + 1)}
+
+    def add(self, ean: str, text: str):
+        if ean in self.docs:
+            self.remove(ean)
+        self.docs[ean] = text
+        for g in self._grams(text):
+            self.grams.setdefault(g, set()).add(ean)
+
+    def remove(self, ean: str):
+        text = self.docs.pop(ean, None)
+        if text is None:
+            return
+        for g in self._grams(text):
+            post = self.grams.get(g)
+            if post is not None:
+                post.discard(ean)
+                if not post:
+                    del self.grams[g]
+
+    @timed_fn("review_index_sync")
+    def sync(self, cart: Dict[str, dict]) -> Tuple[int, int]:
+        """Alinea el índice con el carrito. Devuelve (altas, bajas)."""
+        gone = self.docs.keys() - cart.keys()
+        new = cart.keys() - self.docs.keys()
+        for ean in gone:
+            self.remove(ean)
+        for ean in new:
+            v = self.variants.get(ean)
+            self.add(ean, self.variant_text(v) if v is not None else self.line_text(cart[ean]))
+        return len(new), len(gone)
+
+    @timed_fn("review_search")
+    def search(self, query: str) -> set:
+        """EANs cuyo texto contiene `query` (sin distinguir mayúsculas)."""
+        q = (query or "").strip().lower()
+        if not q:
+            return set(self.docs)
+        if len(q) < self.N:
+            return {e for e, t in self.docs.items() if q in t}
+        posts = []
+        for g in self._grams(q):
+            post = self.grams.get(g)
+            if not post:
+                return set()
+            posts.append(post)
+        posts.sort(key=len)
+        cand = set(posts[0]).intersection(*posts[1:])
+        return {e for e in cand if q in self.docs[e]}
+
+
+def cart_text_index(key: str, cart: Dict[str, dict]) -> CartTextIndex:
+    """Índice de texto de la sesión para `key`, sincronizado con el carrito actual (nuevo si cambió el catálogo)."""
+    version = st.session_state.get("cat_version")
+    idx = st.session_state.get(key)
+    if idx is None or idx.cat_version != version:
+        v = st.session_state.get("catalog")
+        idx = st.session_state[key] = CartTextIndex(version, v.ean_index if v is not None and v.cat_loaded else None)
+    idx.sync(cart)
+    return idx
+
+
+def paginate(df: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
+    n_pages = max(1, -(-len(df) // page_size))
+    page = min(max(1, int(page)), n_pages)
+    return df.iloc[(page - 1) * page_size: page * page_size]
+
+
+def render_cart_view_mode(key: str, n_lines: int) -> bool:
+    """
+    Selector Editable/Compacta. Devuelve True si la vista es compacta (st.dataframe de solo lectura).
+    En modo ligero siempre es compacta y no se pinta el selector.
+    """
+    if st.session_state.get("light_mode"):
+        return True
+    opts = ["Editable", "Compacta"]
+    if f"{key}_view" not in st.session_state:
+        st.session_state[f"{key}_view"] = opts[1] if n_lines > BULK_CART_LINES else opts[0]
+    return st.radio("Vista", opts, key=f"{key}_view", horizontal=True) == "Compacta"
 
 
+def render_pager(key: str, total: int, sizes=CART_PAGE_SIZES, reset_on: object = None) -> Tuple[int, int]:
+    """
+    Controles de paginación. Devuelve (página, tamaño); sin controles si todo cabe en una página.
+    Si cambia `reset_on` (p.ej. el filtro) se vuelve a la página 1.
+    En modo ligero las páginas son siempre las cortas (CART_PAGE_SIZES).
+    """
+    if st.session_state.get("light_mode"):
+        sizes = CART_PAGE_SIZES
+    size_key, page_key = f"{key}_size", f"{key}_page"
+    if st.session_state.get(f"{key}_reset_on") != reset_on:
+        st.session_state[f"{key}_reset_on"] = reset_on
+        st.session_state[page_key] = 1
+    if total <= sizes[0]:
+        return 1, sizes[0]
+    if st.session_state.get(size_key) not in sizes:
+        st.session_state[size_key] = sizes[0]
+    n_pages = max(1, -(-total // st.session_state[size_key]))
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+
+    c1, c2, c3 = st.columns([1, 1, 2])
+    with c1:
+        page_size = st.selectbox("Líneas por página", sizes, key=size_key)
+    with c2:
+        page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+    with c3:
+        first = (page - 1) * page_size + 1
+        st.caption(f"Mostrando {first}–{min(page * page_size, total)} de {total} líneas")
+    return int(page), int(page_size)
+
+
+@timed_fn("merge_carts")
 def merge_carts(a: Dict[str, dict], b: Dict[str, dict]) -> Dict[str, dict]:
     out = {}
     for src in (a, b):
@@ -391,6 +1257,242 @@ def export_to_template_xlsx(df_lines: pd.DataFrame, fecha: date, origen: str, de
     wb.save(bio)
     return bio.getvalue()
 
+def safe_filename_part(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._ -]+", "_", (s or "").strip())
+
+
+def transfer_filename(fecha: date, obs: str, destino: Optional[str] = None) -> str:
+    name = f"{fecha:%Y%m%d}_{safe_filename_part(obs) if obs else 'SIN_REF'}"
+    if destino:
+        name += f"_{safe_filename_part(destino)}"
+    return f"{name}.xlsx".replace(" ", "_")
+
+
+def _header_mismatch(ws) -> Optional[list]:
+    row1 = [ws.cell(1, c).value for c in range(1, 7)]
+    if [str(x).strip() if x is not None else "" for x in row1] != TEMPLATE_HEADER:
+        return row1
+    return None
+
+
+def template_header_mismatch(template_bytes: bytes) -> Optional[list]:
+    """None si A1–F1 de la plantilla es exactamente TEMPLATE_HEADER; si no, lo encontrado."""
+    return _header_mismatch(openpyxl.load_workbook(io.BytesIO(template_bytes)).active)
+
+
+@timed_fn("export_xlsx")
+def build_transfer_xlsx(lines: Dict[str, dict], fecha: date, origen: str, destino: str, obs: str,
+                        template_bytes: bytes) -> bytes:
+    """
+    Rellena la plantilla (hoja activa) con una fila por línea de carrito, en orden estable
+    Ref/Color/Talla/EAN. No toca el formato de la cabecera.
+    """
+    if openpyxl is None:
+        raise RuntimeError("Falta openpyxl. Añádelo a requirements.txt")
+    wb = openpyxl.load_workbook(io.BytesIO(template_bytes))
+    ws = wb.active
+    found = _header_mismatch(ws)
+    if found is not None:
+        raise ValueError(f"La plantilla no coincide con la estructura esperada: {found}")
+
+    rows = []
+    for ean, it in lines.items():
+        qty = int(it.get("Cantidad", 0) or 0)
+        if qty <= 0:
+            continue
+        rows.append((str(ean), qty, it.get("Ref", ""), it.get("Col", ""), it.get("Tal", "")))
+    ranks = build_size_ranks([r[4] for r in rows])
+    rows.sort(key=lambda x: (x[2], x[3], ranks[x[4] or ""], x[0]))
+
+    # Limpiar filas antiguas SOLO en el rango usado (no desconfigura estilos del header)
+    max_clear = max(2 + len(rows) + 50, 60)
+    for r in range(2, max_clear + 1):
+        for c in range(1, 7):
+            ws.cell(r, c).value = None
+
+    for r, (ean, qty, *_) in enumerate(rows, start=2):
+        ws.cell(r, 1).value = fecha
+        ws.cell(r, 2).value = origen
+        ws.cell(r, 3).value = destino
+        ws.cell(r, 4).value = obs
+        ws.cell(r, 5).value = ean
+        ws.cell(r, 6).value = qty
+
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+@timed_fn("export_zip")
+def build_transfer_zip(plans: Dict[str, Dict[str, dict]], fecha: date, origen: str, obs: str,
+                       template_bytes: bytes, executor: Optional[Executor] = None) -> bytes:
+    """
+    Multi-destino: un Excel por destino ({destino: líneas}) generados en paralelo y empaquetados en un zip.
+    """
+    own = executor is None
+    ex = executor or ThreadPoolExecutor(max_workers=max(1, min(len(plans), 8)))
+    try:
+        futures = {}
+        try:
+            for dest, lines in plans.items():
+                futures[dest] = ex.submit(build_transfer_xlsx, lines, fecha, origen, dest, obs, template_bytes)
+        except Exception:
+            # Rechazo a mitad de lote (SchedulerBusy...): lo ya encolado no debe quedarse ocupando el pool
+            for fut in futures.values():
+                fut.cancel()
+            raise
+        bio = io.BytesIO()
+        with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as zf:
+            for dest, fut in futures.items():
+                zf.writestr(transfer_filename(fecha, obs, dest), fut.result())
+        return bio.getvalue()
+    finally:
+        if own:
+            ex.shutdown(wait=False)
+
+
+# -----------------------------
+# Multi-destino
+# -----------------------------
+def sync_active_destination():
+    """En multi-destino, carrito_import es el carrito del destino activo (el mismo objeto dict)."""
+    carts = st.session_state.get("carritos_destino")
+    if carts:
+        st.session_state.carrito_import = carts.setdefault(st.session_state.destino, {})
+
+
+def import_cart_key() -> str:
+    """Clave de persistencia de carrito_import: la del destino activo si hay multi-destino."""
+    if st.session_state.get("carritos_destino"):
+        return f"{DEST_CART_PREFIX}{st.session_state.get('destino', '')}"
+    return "carrito_import"
+
+
+# -----------------------------
+# Borradores persistentes (drafts.py)
+# -----------------------------
+def _draft_call(fn):
+    """Los fallos de persistencia no deben romper la UI: se anotan en draft_error."""
+    from drafts import get_draft_store
+
+    try:
+        fn(get_draft_store(), st.session_state.draft_id)
+        st.session_state.draft_error = None
+    except Exception as e:
+        st.session_state.draft_error = f"{type(e).__name__}: {e}"
+
+
+def persist_cart_lines(cart_name: str, eans: Iterable[str], cart: Optional[Dict[str, dict]] = None):
+    """
+    Guarda en el borrador el estado actual de esas líneas del carrito (upsert por EAN; 0 = borrar).
+    `cart` permite pasar un carrito que no vive en session_state con ese nombre (p.ej. "destino:…").
+    """
+    key = cart_name
+    if cart is None:
+        cart = st.session_state.get(cart_name) or {}
+        if cart_name == "carrito_import":
+            key = import_cart_key()
+    items = [cart.get(e) or {"EAN": e, "Cantidad": 0} for e in eans]
+    touch_carts()
+    _draft_call(lambda store, draft_id: store.upsert_lines(draft_id, key, items))
+
+
+def persist_cart_clear(cart_name: str):
+    key = import_cart_key() if cart_name == "carrito_import" else cart_name
+    touch_carts()
+    _draft_call(lambda store, draft_id: store.clear_cart(draft_id, key))
+
+
+def persist_pending():
+    df = st.session_state.get("pending_rows")
+    rows = [] if df is None or df.empty else df.astype(object).where(df.notna(), None).to_dict("records")
+    _draft_call(lambda store, draft_id: store.save_pending(draft_id, rows))
+
+
+def persist_header():
+    """Guarda fecha/origen/destino/ref_peticion solo si cambiaron desde la última escritura."""
+    header = (
+        st.session_state.get("ref_peticion", ""),
+        st.session_state.get("fecha"),
+        st.session_state.get("origen", ""),
+        st.session_state.get("destino", ""),
+    )
+    if header == st.session_state.get("draft_header"):
+        return
+    _draft_call(lambda store, draft_id: store.save_header(draft_id, *header))
+    st.session_state.draft_header = header
+
+
+def record_export(plans: Dict[str, Dict[str, dict]], fecha: Optional[date], origen: str, obs: str):
+    """
+    Callback de las descargas de 4 · Exportar: registra en el histórico un traspaso por destino
+    ({destino: líneas}). Como la persistencia de borradores, un fallo no rompe la UI (history_error).
+    """
+    from history import get_history_store
+
+    try:
+        store = get_history_store()
+        for destino, lines in plans.items():
+            store.record_transfer(st.session_state.draft_id, fecha, origen, destino, obs, lines)
+        st.session_state.history_error = None
+    except Exception as e:
+        st.session_state.history_error = f"{type(e).__name__}: {e}"
+
+
+def reorder_transfer(transfer_id: str, factor: float = 1.0):
+    """
+    Callback de «Repetir traspaso»: vuelca en carrito_manual las líneas de un traspaso del histórico.
+    Corre una vez por clic (no en cada rerun); el resumen queda en reorder_last.
+    """
+    from history import get_history_store
+
+    try:
+        lines = get_history_store().transfer_lines(transfer_id)
+    except Exception as e:
+        st.session_state.history_error = f"{type(e).__name__}: {e}"
+        return
+    resolved, discontinued = resolve_reorder_lines(lines, get_catalog_df(), factor)
+    n_eans = add_lines_to_cart(st.session_state.carrito_manual, resolved)
+    persist_cart_lines("carrito_manual", resolved["EAN"].unique())
+    st.session_state.reorder_last = {
+        "lines": len(lines),
+        "eans": n_eans,
+        "units": int(resolved["Cantidad"].sum()),
+        "factor": factor,
+        "discontinued": discontinued,
+    }
+
+
+def resume_draft(draft_id: str) -> bool:
+    """Carga un borrador guardado en la sesión actual (carritos, pendientes y cabecera)."""
+    from drafts import get_draft_store
+
+    d = get_draft_store().load_draft(draft_id)
+    if d is None:
+        return False
+    st.session_state.draft_id = draft_id
+    st.session_state.carrito_import = d["carts"].get("carrito_import", {})
+    st.session_state.carrito_manual = d["carts"].get("carrito_manual", {})
+    st.session_state.carritos_destino = {
+        k[len(DEST_CART_PREFIX):]: v for k, v in d["carts"].items() if k.startswith(DEST_CART_PREFIX)
+    }
+    st.session_state.pending_rows = pending_frame(d["pending_rows"])
+    st.session_state.last_import_stats = None
+    st.session_state.ref_peticion = d["ref_peticion"] or ""
+    if d["fecha"]:
+        st.session_state.fecha = d["fecha"]
+    if d["origen"]:
+        st.session_state.origen = d["origen"]
+    if d["destino"]:
+        st.session_state.destino = d["destino"]
+    st.session_state.draft_header = (
+        st.session_state.ref_peticion, st.session_state.fecha, st.session_state.origen, st.session_state.destino,
+    )
+    sync_active_destination()
+    touch_carts()
+    return True
+
+
 def nav_buttons(prev_page: str | None, next_page: str | None, next_label: str = "Confirmar y continuar →"):
     c1, c2 = st.columns(2)
 
@@ -430,3 +1532,18 @@ def normalize_warehouse(value: str) -> str:
         return value
     # fallback seguro
     return PET_WAREHOUSES[0]
+
+
+def match_warehouse(value: object) -> Optional[str]:
+    """
+    Como normalize_warehouse pero sin fallback (para ficheros multi-destino): nombre PET,
+    código corto o un fragmento único del nombre ("Marbella"); None si no se reconoce.
+    """
+    v = norm_str(value)
+    if not v or v.lower() == "nan":
+        return None
+    up = v.upper()
+    if up in _PET_FROM_SHORT:
+        return _PET_FROM_SHORT[up]
+    hits = [w for w in PET_WAREHOUSES if up == w.upper()] or [w for w in PET_WAREHOUSES if up in w.upper()]
+    return hits[0] if len(hits) == 1 else None
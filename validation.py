@@ -0,0 +1,134 @@
+# validation.py
+"""
+Validación previa al export: el ERP rechaza el fichero entero por una sola línea mala.
+
+Sobre las líneas fusionadas (carrito EAN -> línea), todo por columnas:
+- Formato: EAN de 13 dígitos con dígito de control EAN-13 correcto. El catálogo también tiene
+  códigos internos que no son EAN-13 ("0095881", "214843-NEGRO-M") y que el ERP acepta: si el
+  código está en el catálogo publicado, formato y dígito de control solo se informan.
+- Catálogo: el EAN existe en el índice EAN de la versión publicada (sin índice, el formato bloquea).
+- Cantidad: entera entre 1 y MAX_LINE_QTY.
+- Duplicados: EANs distintos como clave pero iguales tras normalizar (espacios, ".0" de un float)
+  se fusionan en una línea sumando cantidades; no bloquean, solo se informan.
+
+El resultado son las líneas a exportar (ya deduplicadas, con el EAN normalizado) y una tabla de
+problemas con una fila por línea afectada.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from perf import timed_fn
+from utils import norm_ean_series
+
+MAX_LINE_QTY = 9999
+EAN_LENGTH = 13
+# Pesos del dígito de control EAN-13 sobre los 12 primeros dígitos
+EAN13_WEIGHTS = np.array([1, 3] * 6, dtype=np.int64)
+EAN13_REGEX = rf"[0-9]{{{EAN_LENGTH}}}"
+
+PROBLEM_COLUMNS = ["EAN", "Ref", "Col", "Tal", "Cantidad", "Problema", "Bloquea"]
+PROBLEM_FORMAT = "EAN sin 13 dígitos"
+PROBLEM_CHECKSUM = "dígito de control incorrecto"
+PROBLEM_CATALOG = "no está en el catálogo"
+PROBLEM_QTY = f"cantidad fuera de rango (1–{MAX_LINE_QTY})"
+PROBLEM_DUPLICATE = "EAN duplicado: líneas fusionadas"
+
+
+def ean13_valid(eans: pd.Series, as_objects: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (formato correcto, dígito de control correcto) por EAN; el segundo es False si el formato no lo es.
+    `as_objects`: los mismos EAN como array de objetos, si ya se tienen (evita otra conversión).
+    """
+    fmt = eans.str.fullmatch(EAN13_REGEX).fillna(False).to_numpy(dtype=bool)
+    ok = np.zeros(len(eans), dtype=bool)
+    if fmt.any():
+        # Todos los códigos válidos seguidos en un buffer: una fila de 13 dígitos por EAN
+        objs = as_objects if as_objects is not None else eans.to_numpy(dtype=object)
+        buf = "".join(objs[fmt]).encode("ascii")
+        digits = np.frombuffer(buf, dtype=np.uint8).reshape(-1, EAN_LENGTH) - 48
+        check = (10 - (digits[:, :12].astype(np.int64) @ EAN13_WEIGHTS) % 10) % 10
+        ok[fmt] = check == digits[:, 12]
+    return fmt, ok
+
+
+@timed_fn("export_validate")
+def validate_export_lines(lines: Dict[str, dict], ean_index: Optional[Dict[str, dict]]) -> Tuple[Dict[str, dict], pd.DataFrame]:
+    """
+    Valida y deduplica las líneas de un export. Devuelve (líneas deduplicadas con el EAN normalizado
+    como clave, problemas con PROBLEM_COLUMNS). Las filas con Bloquea=True no deben exportarse.
+    """
+    keys = pd.Series(list(lines.keys()), dtype="str")
+    qty = pd.to_numeric(pd.Series([it.get("Cantidad") for it in lines.values()], dtype=object), errors="coerce")
+    eans = norm_ean_series(keys)
+
+    # Duplicados tras normalizar: se suman sobre la primera aparición
+    dup = eans.duplicated(keep=False).to_numpy()
+    if dup.any():
+        total = qty.groupby(eans, sort=False).transform("sum")
+        first = ~eans.duplicated(keep="first").to_numpy()
+    else:
+        total, first = qty, np.ones(len(eans), dtype=bool)
+    eans_obj = eans.to_numpy(dtype=object)
+
+    fmt, checksum = ean13_valid(eans, eans_obj)
+    # Presencia en el catálogo: lookup por hash en el índice EAN (isin sobre texto Arrow va elemento a elemento)
+    if ean_index is not None:
+        in_catalog = np.fromiter(map(ean_index.__contains__, eans_obj), dtype=bool, count=len(eans))
+        known = in_catalog
+    else:
+        in_catalog = np.ones(len(eans), dtype=bool)
+        known = np.zeros(len(eans), dtype=bool)
+    qty_ok = (total.notna() & (total == total.round()) & total.between(1, MAX_LINE_QTY)).to_numpy()
+
+    bad_fmt, bad_checksum = ~fmt, fmt & ~checksum
+    checks = [
+        (bad_fmt & ~known, PROBLEM_FORMAT, True),
+        (bad_fmt & known, PROBLEM_FORMAT, False),
+        (bad_checksum & ~known, PROBLEM_CHECKSUM, True),
+        (bad_checksum & known, PROBLEM_CHECKSUM, False),
+        (~in_catalog, PROBLEM_CATALOG, True),
+        (~qty_ok & first, PROBLEM_QTY, True),
+        (dup, PROBLEM_DUPLICATE, False),
+    ]
+    parts = [pd.DataFrame({"pos": np.flatnonzero(mask), "Problema": label, "Bloquea": blocks})
+             for mask, label, blocks in checks if mask.any()]
+
+    items = list(lines.values())
+    if not dup.any() and eans.equals(keys):
+        # Caso normal: nada que fusionar ni renombrar, se exportan las mismas líneas
+        clean = lines
+    else:
+        totals = total.to_numpy()
+        clean = {
+            eans_obj[p]: {**items[p], "EAN": eans_obj[p], "Cantidad": int(totals[p]) if qty_ok[p] else totals[p]}
+            for p in np.flatnonzero(first)
+        }
+
+    if not parts:
+        return clean, pd.DataFrame(columns=PROBLEM_COLUMNS)
+    found = pd.concat(parts, ignore_index=True).sort_values(["pos", "Bloquea"], ascending=[True, False])
+    pos = found["pos"].to_numpy()
+    problems = pd.DataFrame({
+        "EAN": keys.to_numpy()[pos],
+        "Ref": [items[p].get("Ref", "") for p in pos],
+        "Col": [items[p].get("Col", "") for p in pos],
+        "Tal": [items[p].get("Tal", "") for p in pos],
+        "Cantidad": qty.to_numpy()[pos],
+        "Problema": found["Problema"].to_numpy(),
+        "Bloquea": found["Bloquea"].to_numpy(),
+    })
+    return clean, problems
+
+
+def blocking_eans(problems: pd.DataFrame) -> set:
+    """EANs normalizados de las líneas con algún problema que bloquea el export."""
+    return set(norm_ean_series(problems.loc[problems["Bloquea"], "EAN"].astype("str")))
+
+
+def drop_blocked(clean: Dict[str, dict], problems: pd.DataFrame) -> Dict[str, dict]:
+    bad = blocking_eans(problems)
+    return {e: it for e, it in clean.items() if e not in bad} if bad else clean